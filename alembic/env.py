@@ -10,7 +10,7 @@ from environs import Env
 from lesson2_structured.database.models.base import Base
 
 # Import syntax: from package(directory) import module (file)
-from lesson2_structured import orders, products, users, order_products
+from lesson2_structured.database.models import orders, products, users, order_products, user_product_totals
 
 # Step 2: instantiate environment variables
 env = Env()
@@ -0,0 +1,43 @@
+"""users keyset pagination index
+
+Revision ID: 74f0923893a4
+Revises: 61a2ca233367
+Create Date: 2026-10-18 09:12:40.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '74f0923893a4'
+down_revision: Union[str, Sequence[str], None] = '61a2ca233367'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Repo.get_users_page seeks on (created_at, telegram_id) instead of OFFSET.
+    # CONCURRENTLY can't run inside a transaction, and doesn't lock writes on a live table
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_users_created_at_telegram_id',
+            'users',
+            ['created_at', 'telegram_id'],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_users_created_at_telegram_id',
+            table_name='users',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
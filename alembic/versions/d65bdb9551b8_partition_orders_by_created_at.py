@@ -0,0 +1,126 @@
+"""partition orders and orderproducts by month of created_at
+
+Revision ID: d65bdb9551b8
+Revises: d856541a307f
+Create Date: 2026-10-18 14:02:51.604417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from lesson2_structured.database.partitions import ensure_partitions
+
+
+revision: str = 'd65bdb9551b8'
+down_revision: Union[str, Sequence[str], None] = 'd856541a307f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Postgres can't turn an existing table into a partitioned one: the tables are
+# renamed, recreated partitioned, the rows copied over and the old tables dropped.
+# The copy rewrites both tables and holds their locks until commit, run it in a
+# maintenance window on a big database.
+
+
+def _move_aside(table: str, indexes: list[str]):
+    op.rename_table(table, f'{table}_unpartitioned')
+    # index and primary key names are schema wide, free them for the new table
+    op.execute(f'ALTER TABLE {table}_unpartitioned RENAME CONSTRAINT {table}_pkey TO {table}_unpartitioned_pkey')
+    for index in indexes:
+        op.drop_index(index, table_name=f'{table}_unpartitioned', if_exists=True)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    _move_aside('orderproducts', ['ix_orderproducts_product_id'])
+    _move_aside('orders', ['ix_orders_user_id'])
+
+    op.create_table('orders',
+    sa.Column('order_id', sa.Integer(), server_default=sa.text("nextval('orders_order_id_seq')"), nullable=False),
+    sa.Column('user_id', sa.BIGINT(), nullable=False),
+    sa.Column('created_at', sa.TIMESTAMP(), server_default=sa.text('now()'), nullable=False),
+    sa.Column('updated_at', sa.TIMESTAMP(), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.telegram_id'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('order_id', 'created_at'),
+    postgresql_partition_by='RANGE (created_at)'
+    )
+    op.create_index('ix_orders_user_id', 'orders', ['user_id'], unique=False)
+
+    op.create_table('orderproducts',
+    sa.Column('order_id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('order_created_at', sa.TIMESTAMP(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['order_id', 'order_created_at'], ['orders.order_id', 'orders.created_at'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['product_id'], ['products.product_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('order_id', 'product_id', 'order_created_at'),
+    postgresql_partition_by='RANGE (order_created_at)'
+    )
+    op.create_index('ix_orderproducts_product_id', 'orderproducts', ['product_id'], unique=False)
+
+    # One partition per month from the oldest order, plus a few months ahead
+    oldest = op.get_bind().scalar(sa.text('SELECT min(created_at) FROM orders_unpartitioned'))
+    ensure_partitions(op.get_bind(), start=oldest)
+
+    op.execute("""
+        INSERT INTO orders (order_id, user_id, created_at, updated_at)
+        SELECT order_id, user_id, created_at, updated_at FROM orders_unpartitioned
+    """)
+    op.execute("""
+        INSERT INTO orderproducts (order_id, product_id, order_created_at, quantity)
+        SELECT orderproducts_unpartitioned.order_id, product_id, orders_unpartitioned.created_at, quantity
+        FROM orderproducts_unpartitioned
+        JOIN orders_unpartitioned ON orders_unpartitioned.order_id = orderproducts_unpartitioned.order_id
+    """)
+
+    # keep the sequence (and its current value) when the old table goes
+    op.execute('ALTER SEQUENCE orders_order_id_seq OWNED BY orders.order_id')
+    op.drop_table('orderproducts_unpartitioned')
+    op.drop_table('orders_unpartitioned')
+    op.execute('ANALYZE orders')
+    op.execute('ANALYZE orderproducts')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Rows in detached partitions are not brought back
+    op.rename_table('orderproducts', 'orderproducts_partitioned')
+    op.rename_table('orders', 'orders_partitioned')
+    op.execute('ALTER TABLE orderproducts_partitioned RENAME CONSTRAINT orderproducts_pkey TO orderproducts_partitioned_pkey')
+    op.execute('ALTER TABLE orders_partitioned RENAME CONSTRAINT orders_pkey TO orders_partitioned_pkey')
+    op.drop_index('ix_orderproducts_product_id', table_name='orderproducts_partitioned')
+    op.drop_index('ix_orders_user_id', table_name='orders_partitioned')
+
+    op.create_table('orders',
+    sa.Column('order_id', sa.Integer(), server_default=sa.text("nextval('orders_order_id_seq')"), nullable=False),
+    sa.Column('user_id', sa.BIGINT(), nullable=False),
+    sa.Column('created_at', sa.TIMESTAMP(), server_default=sa.text('now()'), nullable=False),
+    sa.Column('updated_at', sa.TIMESTAMP(), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.telegram_id'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('order_id')
+    )
+    op.create_index('ix_orders_user_id', 'orders', ['user_id'], unique=False)
+    op.create_table('orderproducts',
+    sa.Column('order_id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['order_id'], ['orders.order_id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['product_id'], ['products.product_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('order_id', 'product_id')
+    )
+    op.create_index('ix_orderproducts_product_id', 'orderproducts', ['product_id'], unique=False)
+
+    op.execute("""
+        INSERT INTO orders (order_id, user_id, created_at, updated_at)
+        SELECT order_id, user_id, created_at, updated_at FROM orders_partitioned
+    """)
+    op.execute("""
+        INSERT INTO orderproducts (order_id, product_id, quantity)
+        SELECT order_id, product_id, quantity FROM orderproducts_partitioned
+    """)
+    op.execute('ALTER SEQUENCE orders_order_id_seq OWNED BY orders.order_id')
+    # dropping a partitioned table drops its partitions
+    op.drop_table('orderproducts_partitioned')
+    op.drop_table('orders_partitioned')
@@ -0,0 +1,43 @@
+"""user product totals summary table
+
+Revision ID: d856541a307f
+Revises: e73800e82cd6
+Create Date: 2026-10-18 11:26:05.873311
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'd856541a307f'
+down_revision: Union[str, Sequence[str], None] = 'e73800e82cd6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('user_product_totals',
+    sa.Column('user_id', sa.BIGINT(), nullable=False),
+    sa.Column('total_quantity', sa.BIGINT(), server_default='0', nullable=False),
+    sa.Column('updated_at', sa.TIMESTAMP(), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.telegram_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    op.create_index(op.f('ix_user_product_totals_total_quantity'), 'user_product_totals', ['total_quantity'], unique=False)
+    # Backfill from the existing order lines
+    op.execute("""
+        INSERT INTO user_product_totals (user_id, total_quantity)
+        SELECT orders.user_id, SUM(orderproducts.quantity)
+        FROM orderproducts
+        JOIN orders ON orders.order_id = orderproducts.order_id
+        GROUP BY orders.user_id
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_user_product_totals_total_quantity'), table_name='user_product_totals')
+    op.drop_table('user_product_totals')
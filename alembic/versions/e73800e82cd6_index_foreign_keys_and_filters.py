@@ -0,0 +1,56 @@
+"""index foreign keys and filter columns
+
+Revision ID: e73800e82cd6
+Revises: 74f0923893a4
+Create Date: 2026-10-18 10:03:17.542981
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'e73800e82cd6'
+down_revision: Union[str, Sequence[str], None] = '74f0923893a4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (index name, table, columns)
+# Postgres doesn't index the referencing side of a foreign key, so every join on
+# these columns and every ON DELETE CASCADE / SET NULL on the parent scans the table
+INDEXES = [
+    ('ix_orders_user_id', 'orders', ['user_id']),
+    ('ix_users_referred_id', 'users', ['referred_id']),
+    ('ix_orderproducts_product_id', 'orderproducts', ['product_id']),
+    ('ix_users_language_code_created_at', 'users', ['language_code', 'created_at']),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY doesn't block writes on a live database, but can't run
+    # inside a transaction. If a build fails it leaves an INVALID index behind:
+    # drop it and run the upgrade again.
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(
+                name,
+                table,
+                columns,
+                unique=False,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, columns in reversed(INDEXES):
+            op.drop_index(
+                name,
+                table_name=table,
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
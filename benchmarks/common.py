@@ -0,0 +1,126 @@
+# common.py
+# Timing, percentiles and JSON result files shared by the benchmarks.
+import json
+import math
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+LOCAL_HOSTS = {"localhost", "127.0.0.1", "::1"}
+
+
+def require_local_database(db, allow_remote: bool = False):
+    # Benchmarks drop and reseed tables, never point them at a shared server
+    if db.host not in LOCAL_HOSTS and not allow_remote:
+        sys.exit(f"Refusing to benchmark against {db.host}, set DATABASE_HOST to a local PostgreSQL")
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list, q in [0, 100]"""
+    if not sorted_values:
+        return float("nan")
+    rank = max(math.ceil(q / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies: list[float], wall_seconds: float, rows: int | None = None) -> dict:
+    """Latencies in seconds -> milliseconds percentiles and throughput"""
+    ordered = sorted(latencies)
+    summary = {
+        "calls": len(ordered),
+        "p50_ms": percentile(ordered, 50) * 1000,
+        "p95_ms": percentile(ordered, 95) * 1000,
+        "p99_ms": percentile(ordered, 99) * 1000,
+        "mean_ms": sum(ordered) / len(ordered) * 1000 if ordered else float("nan"),
+        "ops_per_sec": len(ordered) / wall_seconds if wall_seconds else float("inf"),
+    }
+    if rows is not None:
+        summary["rows"] = rows
+        summary["rows_per_sec"] = rows / wall_seconds if wall_seconds else float("inf")
+    return summary
+
+
+def time_calls(call, iterations: int, warmup: int = 3, after_each=None) -> dict:
+    for _ in range(warmup):
+        call()
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - start)
+        if after_each is not None:
+            after_each()
+    return summarize(latencies, time.perf_counter() - started)
+
+
+async def time_calls_async(call, iterations: int, warmup: int = 3, after_each=None) -> dict:
+    for _ in range(warmup):
+        await call()
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await call()
+        latencies.append(time.perf_counter() - start)
+        if after_each is not None:
+            after_each()
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(path: str, results: dict, **meta):
+    document = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            **meta,
+        },
+        "results": results,
+    }
+    with open(path, "w") as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+    print(f"Wrote {len(results)} results to {path}")
+
+
+def compare(baseline_path: str, current_path: str, threshold: float = 1.10, metrics=("p50_ms", "p95_ms")) -> int:
+    """
+    Summary: Print current vs baseline for every benchmark and return 1 when any
+    latency metric got slower than baseline * threshold (0 otherwise).
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    with open(current_path) as f:
+        current = json.load(f)
+    if baseline["meta"].get("scale") != current["meta"].get("scale"):
+        print(f"warning: comparing scale {baseline['meta'].get('scale')} against {current['meta'].get('scale')}")
+
+    regressions = 0
+    print(f"{'benchmark':<55} {'metric':<8} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for name, old in sorted(baseline["results"].items()):
+        new = current["results"].get(name)
+        if new is None:
+            print(f"{name:<55} missing from {current_path}")
+            continue
+        for metric in metrics:
+            if metric not in old or metric not in new:
+                continue
+            ratio = new[metric] / old[metric] if old[metric] else float("inf")
+            flag = ""
+            if ratio > threshold:
+                regressions += 1
+                flag = "  REGRESSION"
+            print(f"{name:<55} {metric:<8} {old[metric]:10.3f} {new[metric]:10.3f} {ratio:6.2f}x{flag}")
+    print(f"{regressions} regression(s) past {threshold:.2f}x")
+    return 1 if regressions else 0
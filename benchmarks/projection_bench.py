@@ -0,0 +1,111 @@
+"""
+ORM entities vs projections for Repo.get_all_user_orders.
+
+Runs get_all_user_orders for the users with the most orders, four ways:
+
+    orm         (Product, Order, User, OrderProduct) entities, the default "full" profile
+    orm_summary the same entities, profile="summary" (no Product.description)
+    rows        columns=ORDER_LINE_COLUMNS, Core Row objects
+    dataclass   columns=ORDER_LINE_COLUMNS, row_type=OrderLine (__slots__)
+
+and reports rows/sec plus the peak Python memory (tracemalloc) of one pass
+that keeps every result alive, like a caller collecting them would.
+
+    python -m benchmarks.projection_bench --users 200 --out projection.json
+"""
+import argparse
+import time
+import tracemalloc
+
+from sqlalchemy import func, select
+
+from benchmarks.common import require_local_database, summarize, write_results
+from lesson2_structured.database.models.orders import Order
+from lesson2_structured.projections import ORDER_LINE_COLUMNS, OrderLine
+from lesson2_structured.setup import DbConfig, get_session
+from lesson3_sync import Repo
+
+VARIANTS = {
+    "orm": {},
+    "orm_summary": {"profile": "summary"},
+    "rows": {"columns": ORDER_LINE_COLUMNS},
+    "dataclass": {"columns": ORDER_LINE_COLUMNS, "row_type": OrderLine},
+}
+
+
+def busiest_users(session, users: int) -> list[int]:
+    ids = session.scalars(
+        select(Order.user_id).group_by(Order.user_id).order_by(func.count().desc()).limit(users)
+    ).all()
+    if not ids:
+        raise SystemExit("The database is empty, seed it first (benchmarks.repo_bench or scripts.generate_dataset)")
+    return ids
+
+
+def one_pass(repo: Repo, telegram_ids: list[int], options: dict) -> tuple[list, list[float]]:
+    results, latencies = [], []
+    for telegram_id in telegram_ids:
+        start = time.perf_counter()
+        results.append(repo.get_all_user_orders(telegram_id, **options))
+        latencies.append(time.perf_counter() - start)
+    return results, latencies
+
+
+def bench(users: int, passes: int) -> dict:
+    Session = get_session()
+    results = {}
+    with Session() as session:
+        telegram_ids = busiest_users(session, users)
+        session.rollback()
+        repo = Repo(session)
+
+        for name, options in VARIANTS.items():
+            # warm the compiled cache and the connection
+            one_pass(repo, telegram_ids[:5], options)
+            session.expunge_all()
+
+            latencies, rows = [], 0
+            started = time.perf_counter()
+            for _ in range(passes):
+                fetched, pass_latencies = one_pass(repo, telegram_ids, options)
+                latencies.extend(pass_latencies)
+                rows += sum(len(result) for result in fetched)
+                del fetched
+                # the ORM variant leaves its entities in the identity map
+                session.expunge_all()
+            summary = summarize(latencies, time.perf_counter() - started, rows=rows)
+
+            tracemalloc.start()
+            fetched, _ = one_pass(repo, telegram_ids, options)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            summary["peak_memory_mb"] = peak / 2 ** 20
+            summary["bytes_per_row"] = peak / max(sum(len(result) for result in fetched), 1)
+            del fetched
+            session.expunge_all()
+            session.rollback()
+
+            results[f"get_all_user_orders.{name}"] = summary
+            print(
+                f"get_all_user_orders.{name:<10} {summary['rows_per_sec']:12,.0f} rows/s   "
+                f"p50 {summary['p50_ms']:8.3f} ms   peak {summary['peak_memory_mb']:8.2f} MB   "
+                f"{summary['bytes_per_row']:8.0f} B/row"
+            )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200, help="how many of the busiest users to fetch")
+    parser.add_argument("--passes", type=int, default=5)
+    parser.add_argument("--out", default="projection.json")
+    parser.add_argument("--allow-remote", action="store_true")
+    options = parser.parse_args()
+
+    require_local_database(DbConfig(), options.allow_remote)
+    results = bench(options.users, options.passes)
+    write_results(options.out, results, users=options.users, passes=options.passes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Benchmark suite for the Repo layer (sync Repo and AsyncRepo) and the seeding paths.
+
+Seeds a local PostgreSQL at a given scale (order lines), then measures
+p50/p95/p99 latency and throughput for every Repo method and writes JSON.
+
+    python -m benchmarks.repo_bench run --scale 10k --out bench_10k.json
+    python -m benchmarks.repo_bench run --scale 1m --skip-seed --out bench_1m.json
+    python -m benchmarks.repo_bench compare baseline.json bench_10k.json --threshold 1.10
+"""
+import argparse
+import asyncio
+import inspect
+import itertools
+import sys
+import time
+
+from sqlalchemy import select
+
+from benchmarks.common import compare, require_local_database, summarize, time_calls, time_calls_async, write_results
+from lesson2_structured.database.models.orders import Order
+from lesson2_structured.database.models.products import Product
+from lesson2_structured.setup import DbConfig, get_session
+from lesson2_structured.setup_async import create_session_pool, DbConfig as AsyncDbConfig
+from lesson3_async import AsyncRepo, gather_bounded
+from lesson3_sync import Repo, seed_fake_data, seed_fake_data_batched
+from scripts.explain_plans import METHOD_ARGUMENTS, seed
+from scripts.time_repo_indexes import pick_arguments
+
+# order lines = users * orders_per_user * lines_per_order
+SCALES = {
+    "10k": dict(users=334, orders_per_user=10, lines_per_order=3, products=1000),
+    "1m": dict(users=33_334, orders_per_user=10, lines_per_order=3, products=10_000),
+    "10m": dict(users=333_334, orders_per_user=10, lines_per_order=3, products=100_000),
+}
+
+# Streaming variants: argument builders and the method they mirror
+STREAM_ARGUMENTS = {
+    "stream_all_user_orders": lambda a: (a["telegram_id"],),
+    "stream_total_number_of_orders_all_users": lambda a: (),
+}
+
+# New telegram ids for write benchmarks, well above the seeded range
+_new_ids = itertools.count(10 ** 12)
+
+
+def write_calls(repo, args: dict, context: dict) -> dict:
+    """Write methods, each call creates new rows so calls are comparable"""
+    def add_order_and_line():
+        order = repo.add_order(args["telegram_id"])
+        context["order_id"] = order.order_id
+        return order
+
+    return {
+        "add_user": lambda: repo.add_user(
+            telegram_id=next(_new_ids), full_name="Bench User", language_code="en", user_name="bench"
+        ),
+        "upsert_users(100)": lambda: repo.upsert_users(
+            {"telegram_id": next(_new_ids), "full_name": "Bench User", "language_code": "en"} for _ in range(100)
+        ),
+        "add_order": add_order_and_line,
+        "add_product": lambda: repo.add_product(title="bench", description="benchmark product", price=10),
+        "add_order_product": lambda: repo.add_order_product(
+            context["order_id"], args["product_id"], 1
+        ),
+        "add_order_products(10)": lambda: repo.add_order_products(
+            (context["order_id"], product_id, 1) for product_id in context["product_ids"][:10]
+        ),
+    }
+
+
+def _consume(result):
+    """Fetch lazily returned results so the query cost is included"""
+    if hasattr(result, "all"):
+        return result.all()
+    if inspect.isgenerator(result):
+        return sum(len(partition) for partition in result)
+    return result
+
+
+async def _consume_async(result):
+    if inspect.isasyncgen(result):
+        rows = 0
+        async for partition in result:
+            rows += len(partition)
+        return rows
+    return await result
+
+
+# ----- Sync -----
+def bench_sync(iterations: int, warmup: int) -> dict:
+    Session = get_session()
+    results = {}
+    with Session() as session:
+        repo = Repo(session)
+        args = pick_arguments(session)
+        context = {
+            "order_id": session.scalar(select(Order.order_id).where(Order.user_id == args["telegram_id"]).limit(1)),
+            "product_ids": session.scalars(select(Product.product_id).limit(10)).all(),
+        }
+        session.commit()
+
+        reads = {**METHOD_ARGUMENTS, **STREAM_ARGUMENTS}
+        for name, build_args in reads.items():
+            method = getattr(repo, name)
+            results[f"sync.{name}"] = time_calls(
+                lambda: _consume(method(*build_args(args))),
+                iterations, warmup, after_each=session.expunge_all
+            )
+            # read methods don't commit, end the transaction they opened
+            session.rollback()
+            print(f"sync.{name:<50} p50 {results[f'sync.{name}']['p50_ms']:8.3f} ms")
+
+        for name, call in write_calls(repo, args, context).items():
+            results[f"sync.{name}"] = time_calls(call, iterations, warmup, after_each=session.expunge_all)
+            print(f"sync.{name:<50} p50 {results[f'sync.{name}']['p50_ms']:8.3f} ms")
+    return results
+
+
+# ----- Async -----
+async def bench_async(iterations: int, warmup: int, concurrency_calls: int) -> dict:
+    db = AsyncDbConfig()
+    session_pool = await create_session_pool(db)
+    results = {}
+    Session = get_session()
+    with Session() as session:
+        args = pick_arguments(session)
+
+    async with session_pool() as session:
+        repo = AsyncRepo(session)
+        reads = {**METHOD_ARGUMENTS, **STREAM_ARGUMENTS}
+        for name, build_args in reads.items():
+            method = getattr(repo, name)
+            results[f"async.{name}"] = await time_calls_async(
+                lambda: _consume_async(method(*build_args(args))),
+                iterations, warmup, after_each=session.expunge_all
+            )
+            await session.rollback()
+            print(f"async.{name:<49} p50 {results[f'async.{name}']['p50_ms']:8.3f} ms")
+
+    # Throughput with the pool saturated: one session per call, bounded by the pool size
+    started = time.perf_counter()
+    latencies = []
+
+    async def timed_lookup(repo):
+        start = time.perf_counter()
+        await repo.get_user_by_id(args["telegram_id"])
+        latencies.append(time.perf_counter() - start)
+
+    await gather_bounded(session_pool, [timed_lookup] * concurrency_calls, db=db)
+    results["async.gather_bounded.get_user_by_id"] = summarize(latencies, time.perf_counter() - started)
+    print(f"async.gather_bounded.get_user_by_id {results['async.gather_bounded.get_user_by_id']['ops_per_sec']:,.0f} ops/s")
+    return results
+
+
+# ----- Seeding -----
+def bench_seeding(scale: dict | None) -> dict:
+    results = {}
+    if scale is not None:
+        start = time.perf_counter()
+        seed(**scale)
+        rows = scale["users"] * (1 + scale["orders_per_user"] * (1 + scale["lines_per_order"])) + scale["products"]
+        results["seed.copy"] = summarize([time.perf_counter() - start], time.perf_counter() - start, rows=rows)
+
+    Session = get_session()
+    for name, seeder in (("seed.seed_fake_data", seed_fake_data), ("seed.seed_fake_data_batched", seed_fake_data_batched)):
+        with Session() as session:
+            start = time.perf_counter()
+            seeder(Repo(session))
+            elapsed = time.perf_counter() - start
+        # 10 users, 100 orders, 100 products, 100 order lines
+        results[name] = summarize([elapsed], elapsed, rows=310)
+    return results
+
+
+def run(options):
+    require_local_database(DbConfig(), options.allow_remote)
+    scale = SCALES[options.scale]
+    results = {}
+    if not options.skip_seed:
+        print(f"Seeding scale {options.scale}: {scale}")
+        results.update(bench_seeding(scale))
+    results.update(bench_sync(options.iterations, options.warmup))
+    results.update(asyncio.run(bench_async(options.iterations, options.warmup, options.concurrency_calls)))
+    if not options.skip_seed:
+        # row-by-row seeding adds rows, so it runs last
+        results.update(bench_seeding(None))
+    write_results(options.out, results, scale=options.scale, scale_parameters=scale, iterations=options.iterations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run")
+    run_parser.add_argument("--scale", choices=SCALES, default="10k")
+    run_parser.add_argument("--out", default="bench_results.json")
+    run_parser.add_argument("--iterations", type=int, default=200)
+    run_parser.add_argument("--warmup", type=int, default=10)
+    run_parser.add_argument("--concurrency-calls", type=int, default=5000)
+    run_parser.add_argument("--skip-seed", action="store_true", help="reuse the data already loaded at this scale")
+    run_parser.add_argument("--allow-remote", action="store_true")
+
+    compare_parser = commands.add_parser("compare")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=1.10)
+
+    options = parser.parse_args()
+    if options.command == "run":
+        run(options)
+    else:
+        sys.exit(compare(options.baseline, options.current, options.threshold))
+
+
+if __name__ == "__main__":
+    main()
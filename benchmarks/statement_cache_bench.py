@@ -0,0 +1,134 @@
+"""
+Micro-benchmark for the pre-built hot statements (lesson2_structured/statement_cache.py).
+
+For get_user_by_id, get_user_language and get_total_number_of_orders it
+compares three ways to get a statement ready for the compiled cache lookup:
+
+    inline      select(...) built on every call (what the Repo used to do)
+    lambda      lambda_stmt(lambda: select(...)), cache key from the lambda's code
+    prebuilt    module-level statement with bindparam(), executed with a dict
+
+"build" measures statement + cache key in Python only, no database needed.
+"execute" runs each variant through a Session against the local database
+(seeded, see repo_bench) and reports latency plus the engine's compiled cache
+hits and misses while it ran.
+
+    python -m benchmarks.statement_cache_bench --out statement_cache.json
+    python -m benchmarks.statement_cache_bench --build-only
+"""
+import argparse
+import time
+
+from sqlalchemy import func, lambda_stmt, select
+
+from benchmarks.common import require_local_database, time_calls, write_results
+from lesson2_structured.database.models.orders import Order
+from lesson2_structured.database.models.users import User
+from lesson2_structured.setup import DbConfig, get_session
+from lesson2_structured.statement_cache import (
+    USER_BY_ID, USER_LANGUAGE, compiled_cache_stats, instrument_compiled_cache, total_orders_params,
+)
+from scripts.time_repo_indexes import pick_arguments
+
+# method -> variant -> telegram_id -> (statement, parameters)
+VARIANTS = {
+    "get_user_by_id": {
+        "inline": lambda t: (select(User).where(User.telegram_id == t), None),
+        "lambda": lambda t: (lambda_stmt(lambda: select(User).where(User.telegram_id == t)), None),
+        "prebuilt": lambda t: (USER_BY_ID, {"telegram_id": t}),
+    },
+    "get_user_language": {
+        "inline": lambda t: (select(User.language_code).where(User.telegram_id == t), None),
+        "lambda": lambda t: (lambda_stmt(lambda: select(User.language_code).where(User.telegram_id == t)), None),
+        "prebuilt": lambda t: (USER_LANGUAGE, {"telegram_id": t}),
+    },
+    "get_total_number_of_orders": {
+        "inline": lambda t: (select(func.count(Order.order_id)).where(Order.user_id == t), None),
+        "lambda": lambda t: (lambda_stmt(lambda: select(func.count(Order.order_id)).where(Order.user_id == t)), None),
+        "prebuilt": lambda t: total_orders_params(t),
+    },
+}
+
+
+def _mean_us(call, iterations: int) -> float:
+    # one timer around the whole loop, the prebuilt path is too fast to time call by call
+    for _ in range(min(iterations, 100)):
+        call()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        call()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+# ----- Build -----
+def bench_build(iterations: int, telegram_id: int = 1) -> dict:
+    """Python cost per call of making the statement and its cache key"""
+    results = {}
+    for method, variants in VARIANTS.items():
+        inline_us = None
+        for variant, make in variants.items():
+            def call():
+                stmt, _ = make(telegram_id)
+                return stmt._generate_cache_key()
+
+            mean_us = _mean_us(call, iterations)
+            inline_us = mean_us if inline_us is None else inline_us
+            results[f"build.{method}.{variant}"] = {
+                "iterations": iterations,
+                "mean_us": mean_us,
+                "saved_us": inline_us - mean_us,
+            }
+            print(f"{'build.' + method + '.' + variant:<55} {mean_us:9.2f} us/call   saved {inline_us - mean_us:8.2f} us")
+    return results
+
+
+# ----- Execute -----
+def bench_execute(iterations: int, warmup: int) -> dict:
+    """Each variant through Session.execute, with the compiled cache counters for the run"""
+    Session = get_session()
+    results = {}
+    with Session() as session:
+        engine = session.get_bind()
+        cache = instrument_compiled_cache(engine)
+        telegram_id = pick_arguments(session)["telegram_id"]
+        session.rollback()
+
+        for method, variants in VARIANTS.items():
+            for variant, make in variants.items():
+                def call():
+                    stmt, params = make(telegram_id)
+                    return session.execute(stmt, params).all()
+
+                cache.reset()
+                summary = time_calls(call, iterations, warmup, after_each=session.expunge_all)
+                session.rollback()
+                summary.update({f"cache_{name}": value for name, value in cache.snapshot().items()})
+                results[f"execute.{method}.{variant}"] = summary
+                print(
+                    f"{'execute.' + method + '.' + variant:<55} p50 {summary['p50_ms']:8.3f} ms   "
+                    f"mean {summary['mean_ms']:8.3f} ms   cache hit rate {summary['cache_hit_rate']:.1%}"
+                )
+        stats = compiled_cache_stats(engine)
+    print(f"compiled cache: {stats['size']}/{stats['capacity']} entries")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default="statement_cache.json")
+    parser.add_argument("--build-iterations", type=int, default=20_000)
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--build-only", action="store_true", help="skip the database part")
+    parser.add_argument("--allow-remote", action="store_true")
+    options = parser.parse_args()
+
+    results = bench_build(options.build_iterations)
+    if not options.build_only:
+        require_local_database(DbConfig(), options.allow_remote)
+        results.update(bench_execute(options.iterations, options.warmup))
+    write_results(options.out, results, iterations=options.iterations, build_iterations=options.build_iterations)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+# bulk_copy.py
+# Streaming bulk loader built on PostgreSQL COPY ... FROM STDIN.
+#
+# Usage:
+#   Session = get_session()
+#   with Session() as session:
+#       copy_rows(session, Order, ({"user_id": uid} for uid in user_ids))
+#       session.commit()
+from datetime import date, datetime, time
+from decimal import Decimal
+from itertools import chain, islice
+from typing import Iterable, Sequence
+from uuid import uuid4
+
+from sqlalchemy import Column, MetaData, Table, func, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+# COPY text format escapes
+_ESCAPES = str.maketrans({
+    "\\": "\\\\",
+    "\t": "\\t",
+    "\n": "\\n",
+    "\r": "\\r",
+})
+
+
+def _encode_value(value) -> str:
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, (int, float, Decimal)):
+        return str(value)
+    return str(value).translate(_ESCAPES)
+
+
+def _encode_row(values: Sequence) -> bytes:
+    return ("\t".join(_encode_value(v) for v in values) + "\n").encode("utf-8")
+
+
+class _CopyStream:
+    """
+    Summary: File-like object that copy_expert reads from. Rows are only
+    pulled from the generator and encoded when COPY asks for more bytes,
+    so memory stays at about one read buffer no matter how many rows there are.
+    """
+    def __init__(self, rows: Iterable[Sequence]):
+        self._rows = iter(rows)
+        self._buffer = bytearray()
+        self.row_count = 0
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._buffer) < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            self._buffer += _encode_row(row)
+            self.row_count += 1
+        if size < 0:
+            size = len(self._buffer)
+        chunk = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return chunk
+
+
+def _generated_key(table: Table) -> Column | None:
+    """Return the primary key column filled in by a sequence, if there is one"""
+    # also in composite keys, e.g. orders (order_id, created_at) for partitioning
+    return table.autoincrement_column
+
+
+def _allocate_keys(session: Session, table: Table, key: Column, rows, block_size: int):
+    """
+    Summary: Fill in a generated primary key before the row is copied,
+    taking ids from the column's sequence one block at a time.
+    A second connection is used because the session connection is busy with COPY.
+    """
+    stmt = select(
+        func.nextval(func.pg_get_serial_sequence(table.name, key.name))
+    ).select_from(func.generate_series(1, block_size))
+    with session.get_bind().connect() as conn:
+        while block := list(islice(rows, block_size)):
+            keys = conn.execute(stmt).scalars().all()
+            for key_value, row in zip(keys, block):
+                yield (key_value, *row)
+
+
+def copy_rows(
+    session: Session,
+    model,
+    rows: Iterable[dict | Sequence],
+    columns: Sequence[str] | None = None,
+    staging: bool = False,
+    on_conflict: str | None = None,
+    update_columns: Sequence[str] | None = None,
+    return_keys: bool = False,
+    key_block_size: int = 10000) -> int | list:
+    """
+    Summary: Stream rows into a mapped model's table with COPY ... FROM STDIN,
+    on the psycopg2 connection of the session's current transaction.
+    The caller commits.
+
+    Args:
+        session (Session): session from get_session()
+        model: mapped class (User, Order, Product, OrderProduct)
+        rows (Iterable[dict | Sequence]): dicts, or tuples in `columns` order
+        columns (Sequence[str] | None): columns to load, defaults to the first dict's keys
+        staging (bool): COPY into a temp table, then INSERT ... SELECT into the real one
+        on_conflict (str | None): with staging, "nothing" or "update"
+        update_columns (Sequence[str] | None): columns set on conflict, defaults to the non-key columns
+        return_keys (bool): return keys of the loaded rows instead of a row count: the
+            generated column (orders.order_id) when the table has one, else the primary key
+        key_block_size (int): ids reserved per round trip when keys are generated
+
+    Returns:
+        int | list: number of rows loaded, or their keys
+    """
+    table: Table = model.__table__
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return [] if return_keys else 0
+    rows = chain([first], rows)
+
+    if isinstance(first, dict):
+        # The generator only runs while COPY streams, after columns is rebound below
+        # (the generated key column goes in front), so it closes over its own tuple
+        dict_columns = tuple(columns or first.keys())
+        rows = (tuple(row.get(c) for c in dict_columns) for row in rows)
+        columns = dict_columns
+    elif columns is None:
+        raise ValueError("columns is required when rows are tuples")
+    columns = list(columns)
+    if on_conflict not in (None, "nothing", "update"):
+        raise ValueError(f"on_conflict must be 'nothing' or 'update', got {on_conflict!r}")
+    if on_conflict and not staging:
+        raise ValueError("on_conflict needs staging=True, COPY itself cannot resolve conflicts")
+
+    pk_names = [c.name for c in table.primary_key.columns]
+    generated = _generated_key(table)
+    # orders' key is (order_id, created_at) for partitioning, callers want the order_id
+    key_names = [generated.name] if generated is not None else pk_names
+    keys = []
+    if return_keys and not staging:
+        if generated is not None and generated.name not in columns:
+            # Reserve ids up front so we know them without RETURNING
+            rows = _allocate_keys(session, table, generated, rows, key_block_size)
+            columns = [generated.name, *columns]
+        missing = [name for name in key_names if name not in columns]
+        if missing:
+            raise ValueError(f"Can't resolve keys, columns are missing {missing}")
+        key_index = [columns.index(name) for name in key_names]
+
+        def record_keys(rows):
+            for row in rows:
+                key = tuple(row[i] for i in key_index)
+                keys.append(key[0] if len(key) == 1 else key)
+                yield row
+        rows = record_keys(rows)
+
+    dbapi_conn = session.connection().connection.dbapi_connection
+    target = table
+    if staging:
+        # Only the loaded columns, no constraints, dropped when the transaction ends
+        target = Table(
+            f"copy_stage_{uuid4().hex[:12]}",
+            MetaData(),
+            *[Column(name, table.c[name].type) for name in columns],
+            prefixes=["TEMPORARY"],
+            postgresql_on_commit="DROP",
+        )
+        target.create(session.connection())
+
+    stream = _CopyStream(rows)
+    column_list = ", ".join(f'"{name}"' for name in columns)
+    with dbapi_conn.cursor() as cursor:
+        cursor.copy_expert(f'COPY "{target.name}" ({column_list}) FROM STDIN', stream)
+
+    if not staging:
+        return keys if return_keys else stream.row_count
+
+    stmt = insert(table).from_select(columns, select(*target.c))
+    if on_conflict == "nothing":
+        stmt = stmt.on_conflict_do_nothing(index_elements=pk_names)
+    elif on_conflict == "update":
+        update_columns = update_columns or [c for c in columns if c not in pk_names]
+        stmt = stmt.on_conflict_do_update(
+            index_elements=pk_names,
+            set_={name: stmt.excluded[name] for name in update_columns}
+        )
+    if return_keys:
+        stmt = stmt.returning(*[table.c[name] for name in key_names])
+    result = session.execute(stmt)
+    if return_keys:
+        loaded = [row[0] if len(row) == 1 else tuple(row) for row in result]
+    else:
+        loaded = result.rowcount
+    session.execute(text(f'DROP TABLE "{target.name}"'))
+    return loaded
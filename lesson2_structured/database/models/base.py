@@ -29,5 +29,6 @@ class TableNameMixin:
 
 # Type aliases for reusable column types
 int_pk = Annotated[int, mapped_column(Integer, primary_key=True, autoincrement=True)]
-user_fk = Annotated[int, mapped_column(BIGINT, ForeignKey('users.telegram_id', ondelete="SET NULL"))]
+# Indexed: Postgres doesn't index FK columns, and joins / ON DELETE SET NULL scan without one
+user_fk = Annotated[int, mapped_column(BIGINT, ForeignKey('users.telegram_id', ondelete="SET NULL"), index=True)]
 str_255 = Annotated[str, mapped_column(VARCHAR(255))]
\ No newline at end of file
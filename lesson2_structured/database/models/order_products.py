@@ -1,17 +1,22 @@
 # Step2: Table Creation
+from datetime import datetime
+
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 
 from lesson2_structured.database.models.base import Base, TableNameMixin
+from lesson2_structured.database.partitions import create_initial_partitions
 from .products import Product
 
-from sqlalchemy import Integer,ForeignKey
+from sqlalchemy import TIMESTAMP, ForeignKeyConstraint, Integer, ForeignKey, event
 
 
 
 class OrderProduct(Base, TableNameMixin):
     """
-    Summary: Connect orders and products table.  Will have one product at a time
+    Summary: Connect orders and products table.  Will have one product at a time.
+    Partitioned like orders, on the created_at of the order it belongs to, so
+    an old month of orders and its lines detach together.
 
     Args:
         Base (_type_): _description_
@@ -19,14 +24,33 @@ class OrderProduct(Base, TableNameMixin):
     """
     order_id: Mapped[int] = mapped_column(
         Integer,
-        ForeignKey('orders.order_id', ondelete="CASCADE"),
         primary_key=True
     )
+    # order_id is covered by the primary key, product_id needs its own index
     product_id: Mapped[int] = mapped_column(
         Integer,
         ForeignKey('products.product_id', ondelete="CASCADE"),
+        primary_key=True,
+        index=True
+    )
+    # Partition key, copied from orders.created_at (see order_lines.upsert_order_products_stmt)
+    order_created_at: Mapped[datetime] = mapped_column(
+        TIMESTAMP,
         primary_key=True
     )
     quantity: Mapped[int]
+
+    __table_args__ = (
+        # orders is partitioned, its unique key includes created_at
+        ForeignKeyConstraint(
+            ["order_id", "order_created_at"],
+            ["orders.order_id", "orders.created_at"],
+            ondelete="CASCADE"
+        ),
+        {"postgresql_partition_by": "RANGE (order_created_at)"},
+    )
     
-    product: Mapped["Product"] = relationship()
\ No newline at end of file
+    product: Mapped["Product"] = relationship()
+
+
+event.listen(OrderProduct.__table__, "after_create", create_initial_partitions)
@@ -1,19 +1,44 @@
 # Step2: Table Creation
-from sqlalchemy.orm import Mapped, relationship
+from datetime import datetime
+
+from sqlalchemy import TIMESTAMP, event, func
+from sqlalchemy.orm import Mapped, declared_attr, mapped_column, relationship
 from .order_products import OrderProduct
 
 # Orders.py does not need to import user, since it uses aliases
 from .users import User
 
 from lesson2_structured.database.models.base import Base, TimestampMixin, TableNameMixin, int_pk, user_fk
+from lesson2_structured.database.partitions import create_initial_partitions
 
 
 class Order(Base, TimestampMixin, TableNameMixin):
+    """
+    Summary: Range partitioned by month on created_at (see database/partitions.py).
+    Postgres needs the partition key in the primary key, the ORM still
+    identifies an order by order_id alone.
+    """
     order_id: Mapped[int_pk]
     user_id: Mapped[user_fk]
+    # TimestampMixin's created_at, made part of the primary key
+    created_at: Mapped[datetime] = mapped_column(
+        TIMESTAMP,
+        primary_key=True,
+        server_default=func.now()
+    )
+
+    __table_args__ = {"postgresql_partition_by": "RANGE (created_at)"}
+
+    @declared_attr.directive
+    def __mapper_args__(cls):
+        return {"primary_key": [cls.__table__.c.order_id]}
     
     # Association
     products: Mapped[list["OrderProduct"]] = relationship()
     user: Mapped["User"] = relationship(
         "User", back_populates="orders"
-    )
\ No newline at end of file
+    )
+
+
+# create_all leaves a partitioned table without partitions, add them right away
+event.listen(Order.__table__, "after_create", create_initial_partitions)
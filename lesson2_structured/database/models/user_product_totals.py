@@ -0,0 +1,32 @@
+# Step2: Table Creation
+from datetime import datetime
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy import BIGINT, TIMESTAMP, ForeignKey, func
+
+from lesson2_structured.database.models.base import Base
+
+
+class UserProductTotal(Base):
+    """
+    Summary: Running SUM(order_products.quantity) per user, kept current by
+    Repo.add_order_product so the threshold query doesn't re-aggregate every order line.
+    Rebuild with Repo.rebuild_user_product_totals after bulk loads that skip the Repo.
+
+    Args:
+        Base (_type_): _description_
+    """
+    __tablename__ = "user_product_totals"
+
+    user_id: Mapped[int] = mapped_column(
+        BIGINT,
+        ForeignKey('users.telegram_id', ondelete="CASCADE"),
+        primary_key=True
+    )
+    # Indexed: "total_quantity > threshold" only touches users over the threshold
+    total_quantity: Mapped[int] = mapped_column(BIGINT, nullable=False, server_default="0", index=True)
+    updated_at: Mapped[datetime] = mapped_column(
+        TIMESTAMP,
+        nullable=False,
+        server_default=func.now(),
+        onupdate=func.now()
+    )
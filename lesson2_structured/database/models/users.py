@@ -2,7 +2,7 @@
 from typing import Optional
 from sqlalchemy.orm import Mapped, mapped_column
 
-from sqlalchemy import BIGINT, VARCHAR
+from sqlalchemy import BIGINT, VARCHAR, Index
 
 from lesson2_structured.database.models.base import Base, TimestampMixin, TableNameMixin, str_255, user_fk
 
@@ -14,6 +14,13 @@ from sqlalchemy.orm import relationship
 
 # USER WITH TYPE ALLIASES:
 class User(Base, TimestampMixin, TableNameMixin):
+    __table_args__ = (
+        # Keyset pagination: ORDER BY created_at DESC, telegram_id DESC
+        Index("ix_users_created_at_telegram_id", "created_at", "telegram_id"),
+        # get_all_users: WHERE language_code IN (...) ORDER BY created_at DESC
+        Index("ix_users_language_code_created_at", "language_code", "created_at"),
+    )
+
     telegram_id: Mapped[int] = mapped_column(
         BIGINT, primary_key=True, autoincrement=False
     )
@@ -0,0 +1,216 @@
+# partitions.py
+# Monthly range partitions for orders (on created_at) and orderproducts (on
+# order_created_at, the created_at of its order).
+#
+# Both tables use the same monthly bounds, named <table>_pYYYYMM, plus a
+# DEFAULT partition so an insert never fails when a month is missing.
+# Queries that filter on created_at only scan the months they need
+# (partition pruning), see Repo.get_total_number_of_orders(since=..., until=...).
+#
+# Future months are created ahead of time:
+#   - by create_tables (after_create on the models) and the alembic migration
+#   - by startup() / startup_async() every time the app starts
+#   - by a daily cron for processes that run for months:
+#       python -m lesson2_structured.database.partitions ensure --months-ahead 3
+# If rows for a month landed in DEFAULT before its partition existed,
+# ensure_partitions moves them into the new partition.
+#
+# Old months are detached instead of deleted. DETACH only changes the catalog,
+# the rows stay in a standalone table to archive (pg_dump -t) and DROP:
+#       python -m lesson2_structured.database.partitions detach --before 2025-01-01
+import argparse
+import re
+from datetime import date, datetime
+
+from sqlalchemy import text
+
+# parent first: orderproducts references orders
+PARTITIONED_TABLES = {
+    "orders": "created_at",
+    "orderproducts": "order_created_at",
+}
+MONTHS_AHEAD = 3
+
+_PARTITION_NAME = re.compile(r"^(?P<table>\w+)_p(?P<year>\d{4})(?P<month>\d{2})$")
+
+
+def month_start(day: date) -> date:
+    return date(day.year, day.month, 1)
+
+
+def add_months(day: date, months: int) -> date:
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month:%Y%m}"
+
+
+def create_partition_sql(table: str, month: date) -> str:
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(table, month)} PARTITION OF {table} "
+        f"FOR VALUES FROM ('{month}') TO ('{add_months(month, 1)}')"
+    )
+
+
+def create_default_partition_sql(table: str) -> str:
+    return f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT"
+
+
+def _month_rows(table: str) -> str:
+    return f"{PARTITIONED_TABLES[table]} >= :start AND {PARTITIONED_TABLES[table]} < :end"
+
+
+def _stash_default_rows(connection, table: str, month: date) -> str | None:
+    """
+    Move the month's rows out of table's DEFAULT partition into a temp table,
+    Postgres won't create a partition while DEFAULT holds rows for its range.
+    Returns the temp table, None when there was nothing to move
+    """
+    params = {"start": month, "end": add_months(month, 1)}
+    if not connection.execute(text(
+        f"SELECT EXISTS (SELECT 1 FROM {table}_default WHERE {_month_rows(table)})"
+    ), params).scalar():
+        return None
+    stash = f"{partition_name(table, month)}_moving"
+    connection.execute(text(
+        f"CREATE TEMP TABLE {stash} ON COMMIT DROP AS SELECT * FROM {table}_default WHERE {_month_rows(table)}"
+    ), params)
+    connection.execute(text(f"DELETE FROM {table}_default WHERE {_month_rows(table)}"), params)
+    return stash
+
+
+def created_between(column, since: datetime | None = None, until: datetime | None = None) -> list:
+    """
+    WHERE conditions for a [since, until) window on a partition key, the
+    planner (or the executor, for generic plans) skips the other months.
+    """
+    conditions = []
+    if since is not None:
+        conditions.append(column >= since)
+    if until is not None:
+        conditions.append(column < until)
+    return conditions
+
+
+def list_partitions(connection, table: str) -> list[tuple[str, date]]:
+    """(name, first day of the month) of the monthly partitions attached to table, oldest first"""
+    names = connection.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE parent.relname = :table"
+    ), {"table": table}).scalars()
+    partitions = []
+    for name in names:
+        match = _PARTITION_NAME.match(name)
+        if match and match["table"] == table:
+            partitions.append((name, date(int(match["year"]), int(match["month"]), 1)))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def ensure_partitions(connection, start: date | None = None, months_ahead: int = MONTHS_AHEAD,
+                      tables=None, today: date | None = None) -> list[str]:
+    """
+    Summary: Create the DEFAULT partition and one partition per month from start
+    through months_ahead months after today. Existing partitions are left alone.
+    Rows of a new month already in DEFAULT are moved into its partition, lines
+    before their orders (the foreign key), all within the caller's transaction.
+    Concurrent callers (several processes starting) wait for each other.
+
+    Args:
+        connection: sync Connection (inside a transaction)
+        start (date | None): first month to cover, defaults to the current month
+        months_ahead (int): months to create past the current one
+        tables: names from PARTITIONED_TABLES, defaults to all of them
+        today (date | None): for tests
+
+    Returns:
+        list[str]: partitions that were created
+    """
+    current = month_start(today or date.today())
+    month = month_start(start) if start else current
+    last = add_months(current, months_ahead)
+    # PARTITIONED_TABLES order: parents first
+    tables = [table for table in PARTITIONED_TABLES if table in (tables or PARTITIONED_TABLES)]
+    connection.execute(text("SELECT pg_advisory_xact_lock(hashtext('ensure_partitions'))"))
+    existing = {}
+    for table in tables:
+        existing[table] = {name for name, _ in list_partitions(connection, table)}
+        connection.execute(text(create_default_partition_sql(table)))
+
+    created = []
+    while month <= last:
+        missing = [table for table in tables if partition_name(table, month) not in existing[table]]
+        # children first, so no line still points at an order being moved
+        stashes = {table: _stash_default_rows(connection, table, month) for table in reversed(missing)}
+        for table in missing:
+            connection.execute(text(create_partition_sql(table, month)))
+            created.append(partition_name(table, month))
+        for table in missing:
+            if stashes[table] is not None:
+                # routed into the new partition
+                connection.execute(text(f"INSERT INTO {table} SELECT * FROM {stashes[table]}"))
+                connection.execute(text(f"DROP TABLE {stashes[table]}"))
+        month = add_months(month, 1)
+    return created
+
+
+def create_initial_partitions(table, connection, **kw):
+    """after_create listener for the partitioned models, so create_all leaves them usable"""
+    if connection.dialect.name == "postgresql":
+        ensure_partitions(connection, tables=[table.name])
+
+
+def detach_partitions_before(connection, cutoff: date) -> list[str]:
+    """
+    Summary: Detach every monthly partition that ends on or before cutoff.
+    The orderproducts partition goes first and drops its foreign key to orders,
+    otherwise orders couldn't let go of the rows it references. Detached tables
+    are archives, they lose all their foreign keys.
+
+    Returns:
+        list[str]: detached tables, still holding their rows
+    """
+    cutoff = month_start(cutoff)
+    detached = []
+    # children before parents
+    for table in reversed(list(PARTITIONED_TABLES)):
+        for name, month in list_partitions(connection, table):
+            if add_months(month, 1) > cutoff:
+                break
+            connection.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+            foreign_keys = connection.execute(text(
+                "SELECT conname FROM pg_constraint WHERE conrelid = CAST(:name AS regclass) AND contype = 'f'"
+            ), {"name": name}).scalars().all()
+            for constraint in foreign_keys:
+                connection.execute(text(f'ALTER TABLE {name} DROP CONSTRAINT "{constraint}"'))
+            detached.append(name)
+    return detached
+
+
+def main():
+    from lesson2_structured.setup import DbConfig, create_engine_sync
+
+    parser = argparse.ArgumentParser(description="Create or detach monthly partitions of orders and orderproducts")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ensure_parser = commands.add_parser("ensure")
+    ensure_parser.add_argument("--months-ahead", type=int, default=MONTHS_AHEAD)
+    ensure_parser.add_argument("--start", type=date.fromisoformat, help="first month to cover, YYYY-MM-DD")
+    detach_parser = commands.add_parser("detach")
+    detach_parser.add_argument("--before", type=date.fromisoformat, required=True, help="YYYY-MM-DD")
+    options = parser.parse_args()
+
+    engine = create_engine_sync(DbConfig())
+    with engine.begin() as connection:
+        if options.command == "ensure":
+            names = ensure_partitions(connection, start=options.start, months_ahead=options.months_ahead)
+            print(f"Created {len(names)} partition(s): {', '.join(names) or '-'}")
+        else:
+            names = detach_partitions_before(connection, options.before)
+            print(f"Detached {len(names)} partition(s): {', '.join(names) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
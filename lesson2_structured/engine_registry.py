@@ -0,0 +1,113 @@
+# engine_registry.py
+# One shared, pooled engine per (url, options) per process.
+#
+# Creating an engine builds a new connection pool, so calling create_engine
+# on every get_session() leaks pools and pays connection setup again.
+# setup.py and setup_async.py get their engines from here instead.
+#
+# Async engines are also keyed by the running event loop: asyncpg connections
+# belong to the loop that opened them, so two asyncio.run() calls must not
+# share a pool. Engines of loops that have since closed are dropped on the
+# next lookup.
+import asyncio
+import atexit
+import os
+import threading
+
+from sqlalchemy import URL, Engine, create_engine
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+_engines: dict[tuple, Engine | AsyncEngine] = {}
+_lock = threading.Lock()
+
+
+def _registry_key(kind: str, url: URL, options: dict, loop: asyncio.AbstractEventLoop | None = None) -> tuple:
+    return (
+        kind,
+        loop,
+        url.render_as_string(hide_password=False),
+        tuple(sorted((name, repr(value)) for name, value in options.items())),
+    )
+
+
+def get_engine(url: URL, **options) -> Engine:
+    """Return the process-wide sync engine for url + options, creating it once"""
+    key = _registry_key("sync", url, options)
+    with _lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = _engines[key] = create_engine(url, **options)
+        return engine
+
+
+def _running_loop() -> asyncio.AbstractEventLoop | None:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def _drop_closed_loops():
+    # Called with _lock held. Their connections can't be closed from here (the
+    # loop is gone), drop the pool and let the sockets go with it
+    for key in [key for key in _engines if key[1] is not None and key[1].is_closed()]:
+        _engines.pop(key).sync_engine.dispose(close=False)
+
+
+def get_async_engine(url: URL, **options) -> AsyncEngine:
+    """
+    Return the async engine for url + options in the running event loop,
+    creating it once per loop. Outside a loop the engine isn't tied to one,
+    its connections belong to whichever loop uses it first.
+    """
+    key = _registry_key("async", url, options, _running_loop())
+    with _lock:
+        _drop_closed_loops()
+        engine = _engines.get(key)
+        if engine is None:
+            engine = _engines[key] = create_async_engine(url, **options)
+        return engine
+
+
+def registered_engines() -> list[Engine | AsyncEngine]:
+    with _lock:
+        return list(_engines.values())
+
+
+def dispose_engines():
+    """Close every pooled connection and forget the engines"""
+    with _lock:
+        engines = list(_engines.values())
+        _engines.clear()
+    for engine in engines:
+        if isinstance(engine, AsyncEngine):
+            # Can't await here, and the loop that owns the connections may be
+            # gone; drop the pool and let the sockets close with the process
+            engine.sync_engine.dispose(close=False)
+        else:
+            engine.dispose()
+
+
+async def dispose_async_engines():
+    """Close the running loop's async engine pools, call it before the loop shuts down"""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        engines = [key for key in _engines if key[0] == "async" and key[1] in (loop, None)]
+        engines = [_engines.pop(key) for key in engines]
+    for engine in engines:
+        await engine.dispose()
+
+
+def _after_fork_in_child():
+    global _lock
+    _lock = threading.Lock()
+    # The child must not reuse (or close) sockets it shares with the parent.
+    # dispose(close=False) gives each engine a fresh pool in the child.
+    for engine in _engines.values():
+        sync_engine = engine.sync_engine if isinstance(engine, AsyncEngine) else engine
+        sync_engine.dispose(close=False)
+
+
+atexit.register(dispose_engines)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -0,0 +1,97 @@
+# load_profiles.py
+# Named column loading profiles for the Repo read methods.
+#
+# Product.description (VARCHAR(3000)) is a plain column: select(Product), the
+# join in get_all_user_orders and the OrderProduct.product relationship all
+# load it. A listing that never shows it can ask for the "summary" profile,
+# which defers it for that query only.
+#
+#   full     (default) every column, same as without a profile
+#   summary  defer(Product.description), every other column still loaded
+#
+#   repo.get_all_user_orders(1418)                      # descriptions included
+#   repo.get_all_user_orders(1418, profile="summary")   # without them
+#
+# A deferred description is loaded on first access, one query per product,
+# and can't be loaded at all once the object is detached or from an AsyncRepo
+# result (no implicit IO there). Only use summary where it isn't read.
+#
+# Users and orders have no large columns, their profiles are empty for now:
+# the read methods returning them take profile too, so one can be added here
+# without touching the Repo.
+#
+# user_orders_graph() is the eager-loading side: how the
+# User.orders -> Order.products -> OrderProduct.product graph is loaded, with
+# the profile applied to the products at the end of it.
+from sqlalchemy.orm import Load, joinedload, selectinload, subqueryload
+
+from .database.models.order_products import OrderProduct
+from .database.models.orders import Order
+from .database.models.products import Product
+from .database.models.users import User
+
+# Eager loading strategies for the User.orders -> Order.products -> OrderProduct.product graph
+# selectin: 1 extra SELECT ... WHERE id IN (...) per hop (4 statements total)
+# joined:   everything in one LEFT OUTER JOIN query (rows multiply per order line)
+# subquery: 1 extra SELECT per hop that re-runs the parent query as a subquery
+LOADER_STRATEGIES = {
+    "selectin": selectinload,
+    "joined": joinedload,
+    "subquery": subqueryload,
+}
+
+PROFILES = ("full", "summary")
+DEFAULT_PROFILE = "full"
+
+# model -> profile -> option applied to a Load of that model (Load(Model) or
+# a relationship loader ending at it). A profile missing here adds no option
+_PROFILE_OPTIONS = {
+    Product: {
+        "summary": lambda load: load.defer(Product.description),
+    },
+}
+
+
+def _check(profile: str):
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown load profile {profile!r}, use one of {list(PROFILES)}")
+
+
+def profile_options(profile: str, *models) -> list:
+    """
+    Summary: Loader options for the entities of a select, pass them to .options().
+    Each option is bound to its own model, so this works for multi-entity
+    selects like select(Product, Order, User, OrderProduct).
+
+    Args:
+        profile (str): one of PROFILES
+        *models: the entities the select returns
+
+    Returns:
+        list: options, empty when none of the models has anything to defer in this profile
+    """
+    _check(profile)
+    return [
+        _PROFILE_OPTIONS[model][profile](Load(model))
+        for model in models if profile in _PROFILE_OPTIONS.get(model, {})
+    ]
+
+
+def apply_profile(loader, model, profile: str):
+    """Chain the profile onto a relationship loader that loads model, e.g. selectinload(OrderProduct.product)"""
+    _check(profile)
+    if profile not in _PROFILE_OPTIONS.get(model, {}):
+        return loader
+    return _PROFILE_OPTIONS[model][profile](loader)
+
+
+def user_orders_graph(strategy: str, profile: str = DEFAULT_PROFILE):
+    """Loader option for select(User): orders, their lines and products, all loaded up front"""
+    if strategy not in LOADER_STRATEGIES:
+        raise ValueError(f"Unknown loading strategy {strategy!r}, use one of {list(LOADER_STRATEGIES)}")
+    loader = LOADER_STRATEGIES[strategy]
+    return loader(User.orders).options(
+        loader(Order.products).options(
+            apply_profile(loader(OrderProduct.product), Product, profile)
+        )
+    )
@@ -0,0 +1,273 @@
+# metrics.py
+# Per-statement latency, row and error metrics from SQLAlchemy engine events,
+# exported in Prometheus text format.
+#
+# setup.create_engine_sync and setup_async.create_engine call instrument_engine()
+# (turn off with DB_METRICS=false). Repo classes decorated with
+# @label_repo_methods add the calling method as a label.
+#
+# Export (statement metrics plus the pool gauges from pool_telemetry.py and the
+# compiled cache counters from statement_cache.py):
+#   start_metrics_server(9100)          # GET http://host:9100/metrics
+#   dump_metrics("db_metrics.prom")     # or write a file for node_exporter's textfile collector
+import inspect
+import os
+import re
+import tempfile
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import lru_cache, wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from sqlalchemy import Engine, event
+
+from .pool_telemetry import render_prometheus as render_pool_prometheus
+from .statement_cache import render_prometheus as render_cache_prometheus
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Name of the Repo method currently running, set by label_repo_methods
+current_repo_method: ContextVar[str | None] = ContextVar("current_repo_method", default=None)
+
+
+# ----- Statement normalization -----
+# psycopg2 renders %(name)s, asyncpg $1, $2, ... with a cast ($1::VARCHAR, $3::NUMERIC(16, 4))
+_NUMERIC_PARAMETER = re.compile(r"\$\d+")
+_PARAMETER = r"(?:%\([^)]+\)s|\?)(?:::[A-Z_]+(?: [A-Z_]+)*(?:\(\d+(?:,\s*\d+)?\))?(?:\[\])*)?"
+_PARAMETER_LIST = re.compile(rf"\(\s*{_PARAMETER}(?:\s*,\s*{_PARAMETER})*\s*\)")
+_VALUES_LIST = re.compile(r"(VALUES\s*\(\?\))(?:\s*,\s*\(\?\))+", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=4096)
+def normalize_statement(statement: str) -> str:
+    """
+    One label per statement shape: IN (...) lists and multi-row VALUES of any
+    length collapse to (?), whitespace is squashed. Cached, the same strings repeat.
+    $n placeholders become ? first: their numbers shift with the length of any
+    list before them.
+    """
+    normalized = _WHITESPACE.sub(" ", statement).strip()
+    normalized = _NUMERIC_PARAMETER.sub("?", normalized)
+    normalized = _PARAMETER_LIST.sub("(?)", normalized)
+    normalized = _VALUES_LIST.sub(r"\1", normalized)
+    return normalized
+
+
+# ----- Metric storage -----
+class _Series:
+    __slots__ = ("bucket_counts", "count", "sum", "rows", "errors")
+
+    def __init__(self, bucket_count: int):
+        self.bucket_counts = [0] * (bucket_count + 1)   # last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.rows = 0
+        self.errors = 0
+
+
+class StatementMetrics:
+    """Latency histogram, row count and error count per (statement, repo method)"""
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._series: dict[tuple[str, str], _Series] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, statement: str, repo_method: str | None) -> _Series:
+        key = (normalize_statement(statement), repo_method or "")
+        series = self._series.get(key)
+        if series is None:
+            with self._lock:
+                series = self._series.setdefault(key, _Series(len(self.buckets)))
+        return series
+
+    def observe(self, statement: str, repo_method: str | None, seconds: float, rows: int):
+        series = self._get(statement, repo_method)
+        index = bisect_left(self.buckets, seconds)
+        with self._lock:
+            series.bucket_counts[index] += 1
+            series.count += 1
+            series.sum += seconds
+            if rows > 0:
+                series.rows += rows
+
+    def observe_error(self, statement: str, repo_method: str | None):
+        series = self._get(statement, repo_method)
+        with self._lock:
+            series.errors += 1
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def render_prometheus(self, max_statement_length: int = 200) -> str:
+        with self._lock:
+            snapshot = [
+                (statement, method, list(s.bucket_counts), s.count, s.sum, s.rows, s.errors)
+                for (statement, method), s in self._series.items()
+            ]
+        lines = [
+            "# HELP db_statement_duration_seconds Time spent executing SQL statements.",
+            "# TYPE db_statement_duration_seconds histogram",
+        ]
+        rows_lines = [
+            "# HELP db_statement_rows_total Rows returned or affected by SQL statements.",
+            "# TYPE db_statement_rows_total counter",
+        ]
+        error_lines = [
+            "# HELP db_statement_errors_total SQL statements that raised an error.",
+            "# TYPE db_statement_errors_total counter",
+        ]
+        for statement, method, bucket_counts, count, total, rows, errors in snapshot:
+            labels = f'statement="{_escape(statement[:max_statement_length])}",repo_method="{_escape(method)}"'
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                lines.append(f'db_statement_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'db_statement_duration_seconds_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"db_statement_duration_seconds_sum{{{labels}}} {total}")
+            lines.append(f"db_statement_duration_seconds_count{{{labels}}} {count}")
+            rows_lines.append(f"db_statement_rows_total{{{labels}}} {rows}")
+            error_lines.append(f"db_statement_errors_total{{{labels}}} {errors}")
+        return "\n".join(lines + rows_lines + error_lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+# One registry per process
+statement_metrics = StatementMetrics()
+
+
+# ----- Engine events -----
+_instrumented: "weakref.WeakSet[Engine]" = weakref.WeakSet()
+
+
+def instrument_engine(engine, metrics: StatementMetrics = statement_metrics):
+    """Attach the timing listeners to a sync or async engine (once per engine)"""
+    engine = getattr(engine, "sync_engine", engine)
+    if engine in _instrumented:
+        return engine
+    _instrumented.add(engine)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_start_time", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["metrics_start_time"].pop()
+        metrics.observe(statement, current_repo_method.get(), elapsed, cursor.rowcount)
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("metrics_start_time"):
+            conn.info["metrics_start_time"].pop()
+        if exception_context.statement is not None:
+            metrics.observe_error(exception_context.statement, current_repo_method.get())
+
+    return engine
+
+
+# ----- Repo method labels -----
+def _label_generator(label: str, generator):
+    try:
+        while True:
+            token = current_repo_method.set(current_repo_method.get() or label)
+            try:
+                item = next(generator)
+            except StopIteration:
+                return
+            finally:
+                current_repo_method.reset(token)
+            yield item
+    finally:
+        generator.close()
+
+
+async def _label_async_generator(label: str, generator):
+    try:
+        while True:
+            token = current_repo_method.set(current_repo_method.get() or label)
+            try:
+                item = await generator.__anext__()
+            except StopAsyncIteration:
+                return
+            finally:
+                current_repo_method.reset(token)
+            yield item
+    finally:
+        await generator.aclose()
+
+
+def _labelled(label: str, func):
+    if inspect.iscoroutinefunction(func):
+        @wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            # nested calls keep the outermost method as the label
+            token = current_repo_method.set(current_repo_method.get() or label)
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                current_repo_method.reset(token)
+        return async_wrapper
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        token = current_repo_method.set(current_repo_method.get() or label)
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            current_repo_method.reset(token)
+        # streaming methods run their queries while being iterated
+        if inspect.isgenerator(result):
+            return _label_generator(label, result)
+        if inspect.isasyncgen(result):
+            return _label_async_generator(label, result)
+        return result
+    return wrapper
+
+
+def label_repo_methods(cls):
+    """Class decorator: statements run inside a public method are labeled Class.method"""
+    for name, attr in list(vars(cls).items()):
+        if name.startswith("_") or not inspect.isfunction(attr):
+            continue
+        setattr(cls, name, _labelled(f"{cls.__name__}.{name}", attr))
+    return cls
+
+
+# ----- Export -----
+def dump_metrics(path: str, metrics: StatementMetrics = statement_metrics):
+    """Write the metrics atomically, so a scraper never reads half a file"""
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile("w", dir=directory, delete=False, suffix=".tmp") as f:
+        f.write(metrics.render_prometheus() + render_pool_prometheus() + render_cache_prometheus())
+    os.replace(f.name, path)
+
+
+def start_metrics_server(port: int = 9100, host: str = "127.0.0.1", metrics: StatementMetrics = statement_metrics) -> ThreadingHTTPServer:
+    """Serve GET /metrics from a daemon thread"""
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            body = (metrics.render_prometheus() + render_pool_prometheus() + render_cache_prometheus()).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="db-metrics", daemon=True).start()
+    return server
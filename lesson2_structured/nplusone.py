@@ -0,0 +1,106 @@
+# nplusone.py
+# Opt-in detector for N+1 queries and other repeated statements.
+#
+# Fingerprints every statement a session executes (IN lists collapsed, see
+# metrics.normalize_statement) and warns or raises once the same shape runs
+# more than `threshold` times in one unit of work. Lazy loads are reported
+# with the relationship that triggered them, e.g. User.orders.
+#
+# Usage (Session or AsyncSession):
+#   with detect_repeated_statements(session, threshold=5, action="raise"):
+#       for user in repo.get_all_users():
+#           for order in user.orders:          # raises on the 6th lazy load
+#               ...
+import warnings
+from collections import Counter
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import ORMExecuteState, Session
+
+from .metrics import normalize_statement
+
+
+class RepeatedStatementWarning(UserWarning):
+    pass
+
+
+class RepeatedStatementError(AssertionError):
+    pass
+
+
+class RepeatedStatementDetector:
+    """
+    Summary: Counts statement shapes executed through one session.
+
+    Args:
+        threshold (int): how many runs of the same shape are allowed
+        action (str): "warn" or "raise" when a shape goes over the threshold
+    """
+    def __init__(self, threshold: int = 5, action: str = "warn"):
+        if action not in ("warn", "raise"):
+            raise ValueError(f"action must be 'warn' or 'raise', got {action!r}")
+        self.threshold = threshold
+        self.action = action
+        self.counts: Counter[str] = Counter()
+        self.relationships: dict[str, str] = {}
+        self._reported: set[str] = set()
+        self._session: Session | None = None
+
+    def attach(self, session: Session | AsyncSession) -> "RepeatedStatementDetector":
+        session = session.sync_session if isinstance(session, AsyncSession) else session
+        event.listen(session, "do_orm_execute", self._on_execute)
+        self._session = session
+        return self
+
+    def detach(self):
+        if self._session is not None:
+            event.remove(self._session, "do_orm_execute", self._on_execute)
+            self._session = None
+
+    def reset(self):
+        self.counts.clear()
+        self.relationships.clear()
+        self._reported.clear()
+
+    def _on_execute(self, state: ORMExecuteState):
+        fingerprint = normalize_statement(str(state.statement))
+        self.counts[fingerprint] += 1
+        if state.is_relationship_load and fingerprint not in self.relationships:
+            # e.g. "User.orders" for user.orders
+            self.relationships[fingerprint] = str(state.loader_strategy_path[-1])
+
+        count = self.counts[fingerprint]
+        if count > self.threshold and fingerprint not in self._reported:
+            self._reported.add(fingerprint)
+            message = self._describe(fingerprint, count)
+            if self.action == "raise":
+                raise RepeatedStatementError(message)
+            warnings.warn(message, RepeatedStatementWarning, stacklevel=2)
+
+    def _describe(self, fingerprint: str, count: int) -> str:
+        relationship = self.relationships.get(fingerprint)
+        source = (
+            f"lazy load of {relationship} (eager load it, e.g. selectinload({relationship}))"
+            if relationship else "statement"
+        )
+        return f"{source} ran {count} times (threshold {self.threshold}): {fingerprint}"
+
+    def report(self) -> list[tuple[int, str | None, str]]:
+        """(count, relationship, statement) for every shape over the threshold, worst first"""
+        return [
+            (count, self.relationships.get(fingerprint), fingerprint)
+            for fingerprint, count in self.counts.most_common()
+            if count > self.threshold
+        ]
+
+
+@contextmanager
+def detect_repeated_statements(session: Session | AsyncSession, threshold: int = 5, action: str = "warn"):
+    """Scope a RepeatedStatementDetector to a block, e.g. one request"""
+    detector = RepeatedStatementDetector(threshold, action).attach(session)
+    try:
+        yield detector
+    finally:
+        detector.detach()
@@ -0,0 +1,152 @@
+# order_lines.py
+# Single-statement upsert of order lines, shared by Repo and AsyncRepo.
+#
+# WITH incoming AS (VALUES ...),
+#      upserted AS (INSERT INTO orderproducts SELECT ... FROM incoming JOIN orders
+#                   ON CONFLICT (order_id, product_id, order_created_at)
+#                   DO UPDATE SET quantity = orderproducts.quantity + EXCLUDED.quantity
+#                   RETURNING *),
+#      totals AS (INSERT INTO user_product_totals ... ON CONFLICT DO UPDATE ...)
+# SELECT * FROM upserted
+#
+# One round trip adds the lines, accumulates quantities for lines that already
+# exist and keeps user_product_totals current, with no read-then-write race.
+from typing import Iterable
+
+from sqlalchemy import Integer, and_, column, delete, func, select, values
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import aliased
+
+from .database.models.order_products import OrderProduct
+from .database.models.orders import Order
+from .database.models.user_product_totals import UserProductTotal
+
+
+def merge_order_lines(lines: Iterable[tuple[int, int, int]]) -> list[tuple[int, int, int]]:
+    """
+    Sum quantities of repeated (order_id, product_id) pairs. ON CONFLICT can't
+    update the same row twice in one statement. Sorted, so concurrent batches
+    lock rows in the same order instead of deadlocking.
+    """
+    merged: dict[tuple[int, int], int] = {}
+    for order_id, product_id, quantity in lines:
+        merged[(order_id, product_id)] = merged.get((order_id, product_id), 0) + quantity
+    return [(order_id, product_id, quantity) for (order_id, product_id), quantity in sorted(merged.items())]
+
+
+def missing_orders(lines: list[tuple[int, int, int]], rows) -> list[int]:
+    """The order_ids of merged lines that didn't come back from upsert_order_products_stmt"""
+    returned = {(row.order_id, row.product_id) for row in rows}
+    return sorted({order_id for order_id, product_id, _ in lines if (order_id, product_id) not in returned})
+
+
+def upsert_order_products_stmt(lines: list[tuple[int, int, int]]):
+    """
+    Summary: Build the statement for merged (order_id, product_id, quantity) lines.
+    Selecting from it returns the OrderProduct rows with their accumulated quantity.
+
+    Args:
+        lines (list[tuple[int, int, int]]): output of merge_order_lines
+
+    Returns:
+        Select: select(OrderProduct) over the upserted rows
+    """
+    incoming = select(
+        values(
+            column("order_id", Integer),
+            column("product_id", Integer),
+            column("quantity", Integer),
+            name="incoming_values",
+        ).data(lines)
+    ).cte("incoming")
+
+    # orderproducts is partitioned on its order's created_at, look it up on the way in.
+    # Lines for orders that don't exist are skipped (the join finds nothing),
+    # missing_orders() tells the caller which ones
+    order_products = insert(OrderProduct).from_select(
+        ["order_id", "product_id", "order_created_at", "quantity"],
+        select(
+            incoming.c.order_id, incoming.c.product_id, Order.created_at, incoming.c.quantity
+        ).join(
+            Order, Order.order_id == incoming.c.order_id
+        )
+    )
+    order_products = order_products.on_conflict_do_update(
+        index_elements=[OrderProduct.order_id, OrderProduct.product_id, OrderProduct.order_created_at],
+        set_={"quantity": OrderProduct.quantity + order_products.excluded.quantity}
+    ).returning(
+        OrderProduct.order_id, OrderProduct.product_id, OrderProduct.order_created_at, OrderProduct.quantity
+    ).cte("upserted")
+
+    # Totals grow by the incoming quantities, whether the line was new or accumulated
+    totals = insert(UserProductTotal).from_select(
+        ["user_id", "total_quantity"],
+        select(
+            Order.user_id, func.sum(incoming.c.quantity)
+        ).join(
+            incoming, incoming.c.order_id == Order.order_id
+        ).group_by(
+            Order.user_id
+        ).order_by(
+            Order.user_id
+        )
+    )
+    totals = totals.on_conflict_do_update(
+        index_elements=[UserProductTotal.user_id],
+        set_={
+            "total_quantity": UserProductTotal.total_quantity + totals.excluded.total_quantity,
+            "updated_at": func.now()
+        }
+    ).cte("totals")
+
+    # totals isn't selected from, add_cte makes sure it still runs
+    return select(aliased(OrderProduct, order_products)).add_cte(totals).execution_options(
+        # refresh OrderProduct objects already in the session with the new quantity
+        populate_existing=True
+    )
+
+
+# ----- Consistency -----
+def recomputed_user_product_totals():
+    """user_id, total_quantity recomputed from every order line, what user_product_totals should hold"""
+    return (
+        select(
+            Order.user_id.label("user_id"),
+            func.sum(OrderProduct.quantity).label("total_quantity")
+        ).join(
+            Order,
+            and_(Order.order_id == OrderProduct.order_id, Order.created_at == OrderProduct.order_created_at)
+        ).group_by(
+            Order.user_id
+        )
+    )
+
+
+def rebuild_user_product_totals_stmts() -> tuple:
+    """Full recompute: empty user_product_totals, then fill it from recomputed_user_product_totals()"""
+    return (
+        delete(UserProductTotal),
+        insert(UserProductTotal).from_select(
+            ["user_id", "total_quantity"], recomputed_user_product_totals()
+        ),
+    )
+
+
+def user_product_totals_mismatch_stmt():
+    """(user_id, summary total, recomputed total) for every user whose summary is off"""
+    actual = recomputed_user_product_totals().subquery()
+    summary_total = func.coalesce(UserProductTotal.total_quantity, 0)
+    actual_total = func.coalesce(actual.c.total_quantity, 0)
+    return (
+        select(
+            func.coalesce(UserProductTotal.user_id, actual.c.user_id),
+            UserProductTotal.total_quantity,
+            actual.c.total_quantity
+        ).select_from(
+            UserProductTotal
+        ).join(
+            actual, actual.c.user_id == UserProductTotal.user_id, full=True
+        ).where(
+            summary_total != actual_total
+        )
+    )
@@ -0,0 +1,20 @@
+# pagination.py
+# Keyset pagination cursors for Repo.get_users_page / AsyncRepo.get_users_page.
+#
+# Opaque to callers: base64 of the last row's sort key
+import base64
+import json
+from datetime import datetime
+
+
+def encode_cursor(created_at: datetime, telegram_id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), telegram_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        created_at, telegram_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), int(telegram_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid page cursor: {cursor!r}") from e
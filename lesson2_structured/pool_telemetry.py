@@ -0,0 +1,200 @@
+# pool_telemetry.py
+# Live connection pool numbers, to size pools against Postgres max_connections.
+#
+# setup.create_engine_sync and setup_async.create_engine build their engines
+# with the timed pool classes below and call instrument_pool() (turn off with
+# DB_POOL_TELEMETRY=false).
+#
+#   pool_stats(engine)    # one engine, a dict
+#   all_pool_stats()      # every engine in engine_registry
+#   render_prometheus()   # gauges and counters, also served by metrics.start_metrics_server
+#
+# Budget: every process gets pool_size + max_overflow connections, so
+#   processes * (pool_size + max_overflow) must stay below max_connections
+#   (minus superuser_reserved_connections, 3 by default).
+import threading
+import time
+import weakref
+
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from .engine_registry import registered_engines
+
+
+# ----- Checkout wait time -----
+class _TimedCheckoutMixin:
+    """
+    Times QueuePool._do_get: waiting for a free connection, or opening an
+    overflow one. The time is left on the connection record for the
+    "checkout" event, which fires right after in the same call.
+    """
+    _telemetry: "PoolTelemetry | None" = None   # set by instrument_pool
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except Exception:
+            # pool_timeout hit (or connect failed), nobody else sees this
+            if self._telemetry is not None:
+                self._telemetry.observe_checkout_error(time.perf_counter() - start)
+            raise
+        record.info["checkout_wait"] = time.perf_counter() - start
+        return record
+
+
+class TimedQueuePool(_TimedCheckoutMixin, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(_TimedCheckoutMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+# ----- Counters -----
+class PoolTelemetry:
+    """Checkout waits and connection churn for one engine"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.checkout_errors = 0
+            self.wait_seconds_total = 0.0
+            self.wait_seconds_max = 0.0
+            self.connections_opened = 0
+            self.connections_closed = 0
+            self.connections_invalidated = 0
+
+    def observe_checkout(self, wait: float):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_seconds_total += wait
+            self.wait_seconds_max = max(self.wait_seconds_max, wait)
+
+    def observe_checkout_error(self, wait: float):
+        with self._lock:
+            self.checkout_errors += 1
+            self.wait_seconds_total += wait
+            self.wait_seconds_max = max(self.wait_seconds_max, wait)
+
+    def observe(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "checkout_errors": self.checkout_errors,
+                "checkout_wait_seconds_total": self.wait_seconds_total,
+                "checkout_wait_seconds_max": self.wait_seconds_max,
+                "checkout_wait_seconds_mean": self.wait_seconds_total / self.checkouts if self.checkouts else 0.0,
+                "connections_opened": self.connections_opened,
+                "connections_closed": self.connections_closed,
+                "connections_invalidated": self.connections_invalidated,
+                # connections opened + closed since start, high churn means the pool is too small or recycles too often
+                "churn": self.connections_opened + self.connections_closed,
+            }
+
+
+# sync engine -> its telemetry
+_instrumented: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def instrument_pool(engine) -> PoolTelemetry:
+    """Attach the pool listeners to a sync or async engine (once per engine)"""
+    engine = getattr(engine, "sync_engine", engine)
+    telemetry = _instrumented.get(engine)
+    if telemetry is not None:
+        return telemetry
+    telemetry = _instrumented[engine] = PoolTelemetry()
+    engine.pool._telemetry = telemetry
+
+    @event.listens_for(engine, "engine_disposed")
+    def engine_disposed(engine):
+        # dispose() swaps in a new pool, listeners carry over but attributes don't
+        engine.pool._telemetry = telemetry
+
+    @event.listens_for(engine, "checkout")
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        telemetry.observe_checkout(connection_record.info.pop("checkout_wait", 0.0))
+
+    @event.listens_for(engine, "connect")
+    def connect(dbapi_connection, connection_record):
+        telemetry.observe("connections_opened")
+
+    @event.listens_for(engine, "close")
+    def close(dbapi_connection, connection_record):
+        telemetry.observe("connections_closed")
+
+    @event.listens_for(engine, "close_detached")
+    def close_detached(dbapi_connection):
+        telemetry.observe("connections_closed")
+
+    @event.listens_for(engine, "invalidate")
+    def invalidate(dbapi_connection, connection_record, exception):
+        telemetry.observe("connections_invalidated")
+
+    return telemetry
+
+
+# ----- Reading it -----
+def pool_stats(engine) -> dict:
+    """
+    Summary: Current pool state plus the telemetry counters for one engine.
+
+    Returns:
+        dict: pool_size, max_overflow, capacity, checked_out, idle,
+        overflow_in_use, timeout, plus PoolTelemetry.snapshot() when instrumented
+    """
+    engine = getattr(engine, "sync_engine", engine)
+    pool = engine.pool
+    stats = {"url": engine.url.render_as_string(hide_password=True), "pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        max_overflow = max(pool._max_overflow, 0)
+        stats.update(
+            pool_size=pool.size(),
+            max_overflow=pool._max_overflow,
+            capacity=pool.size() + max_overflow,
+            checked_out=pool.checkedout(),
+            idle=pool.checkedin(),
+            # overflow() counts from -pool_size, positive once past pool_size
+            overflow_in_use=max(pool.overflow(), 0),
+            timeout=pool.timeout(),
+        )
+    telemetry = _instrumented.get(engine)
+    if telemetry is not None:
+        stats.update(telemetry.snapshot())
+    return stats
+
+
+def all_pool_stats() -> list[dict]:
+    return [pool_stats(engine) for engine in registered_engines()]
+
+
+_GAUGES = ("pool_size", "max_overflow", "capacity", "checked_out", "idle", "overflow_in_use")
+_COUNTERS = (
+    "checkouts", "checkout_errors", "checkout_wait_seconds_total",
+    "connections_opened", "connections_closed", "connections_invalidated",
+)
+
+
+def render_prometheus() -> str:
+    lines = []
+    stats = all_pool_stats()
+    for name in _GAUGES:
+        lines.append(f"# TYPE db_pool_{name} gauge")
+        lines.extend(f'db_pool_{name}{{url="{s["url"]}"}} {s[name]}' for s in stats if name in s)
+    lines.append("# TYPE db_pool_checkout_wait_seconds_max gauge")
+    lines.extend(
+        f'db_pool_checkout_wait_seconds_max{{url="{s["url"]}"}} {s["checkout_wait_seconds_max"]}'
+        for s in stats if "checkouts" in s
+    )
+    for name in _COUNTERS:
+        lines.append(f"# TYPE db_pool_{name} counter")
+        lines.extend(f'db_pool_{name}{{url="{s["url"]}"}} {s[name]}' for s in stats if name in s)
+    return "\n".join(lines) + "\n"
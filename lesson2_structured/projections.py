@@ -0,0 +1,111 @@
+# projections.py
+# Read paths that return plain rows instead of ORM entities.
+#
+# get_all_user_orders selects (Product, Order, User, OrderProduct). Every row
+# builds four identity-mapped objects, timestamps and the up to 3000 char
+# Product.description included (unless profile="summary", see load_profiles.py),
+# and the session tracks them until it closes.
+# A projection selects only the columns the caller names. The rows come back
+# as Core Row objects (immutable named tuples) or as a frozen __slots__
+# dataclass, and the session never holds on to them.
+#
+#   rows = repo.get_all_user_orders(1418, columns=ORDER_LINE_COLUMNS)
+#   rows[0].title, rows[0].quantity
+#   lines = repo.get_all_user_orders(1418, columns=ORDER_LINE_COLUMNS, row_type=OrderLine)
+#   rows = repo.get_all_user_orders(1418, columns=["Order.order_id", "Product.title"])
+#
+# benchmarks/projection_bench.py compares rows/sec and peak memory with the ORM path.
+from dataclasses import dataclass, make_dataclass
+from decimal import Decimal
+from functools import lru_cache
+from itertools import starmap
+from typing import Iterable, Sequence
+
+from .database.models.base import Base
+from .database.models.order_products import OrderProduct
+from .database.models.orders import Order
+from .database.models.products import Product
+
+
+# ----- Row types -----
+@dataclass(frozen=True, slots=True)
+class OrderLine:
+    order_id: int
+    product_id: int
+    title: str
+    price: Decimal
+    quantity: int
+
+
+# The columns OrderLine is built from, in field order
+ORDER_LINE_COLUMNS = (Order.order_id, Product.product_id, Product.title, Product.price, OrderProduct.quantity)
+
+
+@lru_cache(maxsize=128)
+def row_class(name: str, fields: tuple[str, ...]) -> type:
+    """A frozen __slots__ dataclass with these fields, one class per (name, fields)"""
+    return make_dataclass(name, fields, frozen=True, slots=True)
+
+
+# ----- Columns -----
+def _resolve(column):
+    # "Product.title" -> Product.title, anything else is used as is
+    if not isinstance(column, str):
+        return column
+    model_name, _, attribute = column.partition(".")
+    for mapper in Base.registry.mappers:
+        if mapper.class_.__name__ == model_name and attribute in mapper.attrs:
+            return getattr(mapper.class_, attribute)
+    raise ValueError(f"Unknown column {column!r}, use Model.attribute")
+
+
+def labelled_columns(columns: Iterable) -> list:
+    """
+    Summary: Resolve the columns and give each a unique label.
+    The label is the attribute name, prefixed with the model when two columns
+    share it (Order.created_at + User.created_at -> order_created_at, user_created_at).
+    A prefixed label can still collide with another column's name
+    (OrderProduct.order_created_at), that raises, label one of them yourself.
+
+    Args:
+        columns (Iterable): mapped attributes (Product.title), "Model.attribute"
+            strings, or any column expression
+
+    Returns:
+        list: labelled column expressions, in the given order
+
+    Raises:
+        ValueError: two columns still end up with the same label
+    """
+    resolved = [_resolve(column) for column in columns]
+    keys = [getattr(column, "key", None) or column.name for column in resolved]
+    labelled = []
+    for column, key in zip(resolved, keys):
+        if keys.count(key) > 1:
+            owner = getattr(column, "class_", None)
+            table = getattr(column, "table", None)
+            if owner is not None:
+                key = f"{owner.__name__.lower()}_{key}"
+            elif table is not None:
+                key = f"{table.name}_{key}"
+            else:
+                # labels and other expressions have no model or table to prefix with
+                raise ValueError(f"Columns share the label {key!r}, give them different labels")
+        labelled.append(column.label(key))
+    labels = [column.key for column in labelled]
+    duplicates = sorted({label for label in labels if labels.count(label) > 1})
+    if duplicates:
+        raise ValueError(f"Columns share the labels {duplicates}, pass Model.attribute.label(...) for one of them")
+    return labelled
+
+
+def project(stmt, columns: Iterable):
+    """Same FROM, joins and WHERE as stmt, only these columns selected"""
+    return stmt.with_only_columns(*labelled_columns(columns))
+
+
+def as_row_type(rows: Sequence, row_type: type | None = None) -> list:
+    """Rows as given, or each one unpacked positionally into row_type"""
+    if row_type is None:
+        return list(rows)
+    return list(starmap(row_type, rows))
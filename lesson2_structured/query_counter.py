@@ -0,0 +1,57 @@
+# query_counter.py
+# Count the SQL statements a block of code sends to the database.
+#
+# Usage:
+#   with assert_num_statements(session, 4):
+#       repo.get_users_with_orders(strategy="selectin")
+from contextlib import contextmanager
+
+from sqlalchemy import Engine, event
+from sqlalchemy.orm import Session
+
+
+class StatementCounter:
+    def __init__(self):
+        self.statements: list[str] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+
+def _engine_of(bind: Engine | Session) -> Engine:
+    return bind.get_bind() if isinstance(bind, Session) else bind
+
+
+@contextmanager
+def count_statements(bind: Engine | Session):
+    """Record every statement executed on the engine while the block runs"""
+    engine = _engine_of(bind)
+    counter = StatementCounter()
+    event.listen(engine, "before_cursor_execute", counter)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, "before_cursor_execute", counter)
+
+
+@contextmanager
+def assert_num_statements(bind: Engine | Session, expected: int):
+    """
+    Summary: Fail if the block doesn't run exactly `expected` statements.
+    Eager-loaded queries should give the same number for 1 user or 10,000.
+
+    Args:
+        bind (Engine | Session): engine, or session whose engine is watched
+        expected (int): number of statements the block must execute
+    """
+    with count_statements(bind) as counter:
+        yield counter
+    if counter.count != expected:
+        executed = "\n".join(f"  {i + 1}. {s}" for i, s in enumerate(counter.statements))
+        raise AssertionError(
+            f"Expected {expected} statements, {counter.count} were executed:\n{executed}"
+        )
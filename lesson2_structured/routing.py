@@ -0,0 +1,71 @@
+# routing.py
+# Primary/replica routing: reads go to a replica, writes to the primary.
+#
+# Once a session has written (or run anything that might write) it sticks to
+# the primary for the rest of its life, so it always reads its own writes
+# even while the replicas lag behind.
+#
+#   Session = setup.get_routing_session()              # sync
+#   session_pool = await setup_async.create_routing_session_pool(DbConfig())
+#
+# Replicas come from DB_REPLICA_URLS (comma separated). To try it locally
+# without streaming replication, point DB_REPLICA_URLS at the primary: replica
+# connections are opened read-only (DB_REPLICA_READ_ONLY), so a write routed
+# to a "replica" fails instead of silently working.
+import random
+
+from sqlalchemy import Delete, Insert, Select, Update
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import visitors
+from sqlalchemy.sql.selectable import CTE
+
+
+def is_read_only(clause) -> bool:
+    """
+    Plain SELECTs only. SELECT ... FOR UPDATE, selects with a data-modifying
+    CTE (Repo.add_order_products) and anything we can't inspect, like text(),
+    count as writes.
+    """
+    if not isinstance(clause, Select) or clause._for_update_arg is not None:
+        return False
+    for element in visitors.iterate(clause):
+        if isinstance(element, CTE) and isinstance(element.element, (Insert, Update, Delete)):
+            return False
+    return True
+
+
+class RoutingSession(Session):
+    """
+    Summary: Session that picks an engine per statement.
+
+    Args:
+        primary (Engine): takes every write and every read after one
+        replicas (list[Engine]): read-only statements go to one of these at random
+    """
+    def __init__(self, primary, replicas=(), **kwargs):
+        kwargs.pop("bind", None)   # sessionmaker always passes one
+        super().__init__(bind=primary, **kwargs)
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.stick_to_primary = False
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if (
+            self.replicas
+            and not self.stick_to_primary
+            and not self._flushing
+            and is_read_only(clause)
+        ):
+            return random.choice(self.replicas)
+        # writes and unknown statements: from here on read our own writes
+        self.stick_to_primary = True
+        return self.primary
+
+    def use_primary(self):
+        """Send everything to the primary from now on, e.g. before a read that must be fresh"""
+        self.stick_to_primary = True
+
+    def close(self):
+        super().close()
+        # a closed session can be reused, start routing reads to replicas again
+        self.stick_to_primary = False
@@ -1,8 +1,12 @@
 # setup_sync.py
-from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import URL
+from sqlalchemy import URL, make_url
 from .database.models.base import Base
+from .engine_registry import get_engine
+from .metrics import instrument_engine
+from .pool_telemetry import TimedQueuePool, instrument_pool
+from .statement_cache import instrument_compiled_cache
+from .routing import RoutingSession
 from environs import Env
 
 env = Env()
@@ -15,6 +19,26 @@ class DbConfig:
         self.host = env.str("DATABASE_HOST")
         self.port = 5432
         self.database = env.str("POSTGRES_DB")
+        # Pool sizing, same defaults as setup_async.py. Each process can open
+        # pool_size + max_overflow connections, keep processes * that below
+        # Postgres max_connections (100 by default)
+        self.pool_size = env.int("DB_POOL_SIZE", 20)          # number of persistent connections
+        self.max_overflow = env.int("DB_MAX_OVERFLOW", 10)    # extra connections beyond pool_size
+        self.pool_timeout = env.float("DB_POOL_TIMEOUT", 30)  # seconds to wait for a free connection
+        self.pool_recycle = env.int("DB_POOL_RECYCLE", 1800)  # reopen connections older than this (-1 = never)
+        self.pool_pre_ping = env.bool("DB_POOL_PRE_PING", True)  # check connections are alive on checkout
+        # Statement metrics and compiled cache stats (see metrics.py, statement_cache.py), pool telemetry (see pool_telemetry.py)
+        self.metrics_enabled = env.bool("DB_METRICS", True)
+        self.pool_telemetry_enabled = env.bool("DB_POOL_TELEMETRY", True)
+        # Read replicas (see routing.py), comma separated SQLAlchemy URLs, the driver is set here
+        self.replica_urls = env.list("DB_REPLICA_URLS", [])
+        self.replica_read_only = env.bool("DB_REPLICA_READ_ONLY", True)
+        # Cold start (see startup.py)
+        self.startup_timeout = env.float("DB_STARTUP_TIMEOUT", 60)         # give up waiting for the server after this
+        self.startup_backoff = env.float("DB_STARTUP_BACKOFF", 0.1)        # first retry delay, doubles per attempt (jittered)
+        self.startup_backoff_max = env.float("DB_STARTUP_BACKOFF_MAX", 5)  # longest retry delay
+        self.start_docker = env.str("DB_START_DOCKER", "auto")             # auto (only if nothing answers), always, never
+        self.prewarm_connections = env.int("DB_PREWARM_CONNECTIONS", 5)    # connections opened before the first request
 
     def construct_sqlalchemy_url(self) -> URL:
         # Use sychronous driver
@@ -27,15 +51,34 @@ class DbConfig:
             database=self.database,
         )
 
-def create_engine_sync(db: DbConfig, echo=False):
-    return create_engine(
-        db.construct_sqlalchemy_url(), 
+    def construct_replica_urls(self) -> list[URL]:
+        return [make_url(url).set(drivername="postgresql+psycopg2") for url in self.replica_urls]
+
+def create_engine_sync(db: DbConfig, echo=False, url: URL | None = None, **options):
+    # Shared per process: the same config returns the same engine (and pool)
+    engine = get_engine(
+        url or db.construct_sqlalchemy_url(),
         echo=echo,
-        pool_size=200,       # number of persistent connections
-        max_overflow=0,      # extra connections beyond pool_size
-        pool_pre_ping=True   # check connections are alive
+        poolclass=TimedQueuePool,
+        pool_size=db.pool_size,
+        max_overflow=db.max_overflow,
+        pool_timeout=db.pool_timeout,
+        pool_recycle=db.pool_recycle,
+        pool_pre_ping=db.pool_pre_ping,
+        **options,
     )
-    
+    if db.metrics_enabled:
+        instrument_engine(engine)
+        instrument_compiled_cache(engine)
+    if db.pool_telemetry_enabled:
+        instrument_pool(engine)
+    return engine
+
+def create_replica_engines_sync(db: DbConfig, echo=False):
+    # Replica connections refuse writes, a misrouted write fails loudly
+    options = {"connect_args": {"options": "-c default_transaction_read_only=on"}} if db.replica_read_only else {}
+    return [create_engine_sync(db, echo=echo, url=url, **options) for url in db.construct_replica_urls()]
+
 def drop_tables(db: DbConfig, echo=False):
     engine = create_engine_sync(db, echo=echo)
     # Drop all tables
@@ -44,6 +87,7 @@ def drop_tables(db: DbConfig, echo=False):
 def create_tables(db: DbConfig, echo=False):
     engine = create_engine_sync(db, echo=echo)
     Base.metadata.create_all(engine)
+    # one-off setup, don't keep its connections in the shared pool
     engine.dispose()
 
 def get_session(echo=False):
@@ -51,4 +95,15 @@ def get_session(echo=False):
     engine = create_engine_sync(db, echo=echo)
     # session will not expire after commit
     Session = sessionmaker(bind=engine, expire_on_commit=False)
-    return Session
\ No newline at end of file
+    return Session
+
+def get_routing_session(echo=False):
+    """Like get_session, but reads go to the DB_REPLICA_URLS replicas (see routing.py)"""
+    db = DbConfig()
+    Session = sessionmaker(
+        class_=RoutingSession,
+        primary=create_engine_sync(db, echo=echo),
+        replicas=create_replica_engines_sync(db, echo=echo),
+        expire_on_commit=False,
+    )
+    return Session
@@ -1,7 +1,12 @@
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
-from sqlalchemy import URL
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy import URL, make_url
 from .database.models.base import Base
-from .database.models import orders, products, users, order_products
+from .database.models import orders, products, users, order_products, user_product_totals
+from .engine_registry import get_async_engine
+from .metrics import instrument_engine
+from .pool_telemetry import TimedAsyncAdaptedQueuePool, instrument_pool
+from .statement_cache import instrument_compiled_cache
+from .routing import RoutingSession
 
 from environs import Env
 
@@ -15,6 +20,26 @@ class DbConfig:
         self.host = env.str("DATABASE_HOST")
         self.port = 5432
         self.database = env.str("POSTGRES_DB")
+        # Pool sizing, same env vars and defaults as setup.py (max 30 connections per process)
+        self.pool_size = env.int("DB_POOL_SIZE", 20)
+        self.max_overflow = env.int("DB_MAX_OVERFLOW", 10)
+        self.pool_timeout = env.float("DB_POOL_TIMEOUT", 30)
+        self.pool_recycle = env.int("DB_POOL_RECYCLE", 1800)
+        self.pool_pre_ping = env.bool("DB_POOL_PRE_PING", True)
+        # Compiled statement cache entries per engine
+        self.query_cache_size = env.int("DB_QUERY_CACHE_SIZE", 1200)
+        # Statement metrics and compiled cache stats (see metrics.py, statement_cache.py), pool telemetry (see pool_telemetry.py)
+        self.metrics_enabled = env.bool("DB_METRICS", True)
+        self.pool_telemetry_enabled = env.bool("DB_POOL_TELEMETRY", True)
+        # Read replicas (see routing.py), same env vars as setup.py
+        self.replica_urls = env.list("DB_REPLICA_URLS", [])
+        self.replica_read_only = env.bool("DB_REPLICA_READ_ONLY", True)
+        # Cold start, same env vars as setup.py (see startup.py)
+        self.startup_timeout = env.float("DB_STARTUP_TIMEOUT", 60)
+        self.startup_backoff = env.float("DB_STARTUP_BACKOFF", 0.1)
+        self.startup_backoff_max = env.float("DB_STARTUP_BACKOFF_MAX", 5)
+        self.start_docker = env.str("DB_START_DOCKER", "auto")
+        self.prewarm_connections = env.int("DB_PREWARM_CONNECTIONS", 5)
     
     def construct_sqlalchemy_url(self) -> URL:
         # use async driver
@@ -27,17 +52,36 @@ class DbConfig:
             database=self.database,
         )
 
-def create_engine(db: DbConfig, echo=False):
-    engine = create_async_engine(
-        db.construct_sqlalchemy_url(),
-        query_cache_size=1200,
-        pool_size=20,
-        max_overflow=200,
+    def construct_replica_urls(self) -> list[URL]:
+        return [make_url(url).set(drivername="postgresql+asyncpg") for url in self.replica_urls]
+
+def create_engine(db: DbConfig, echo=False, url: URL | None = None, **options):
+    # Shared per process: the same config returns the same engine (and pool)
+    engine = get_async_engine(
+        url or db.construct_sqlalchemy_url(),
+        query_cache_size=db.query_cache_size,
+        poolclass=TimedAsyncAdaptedQueuePool,
+        pool_size=db.pool_size,
+        max_overflow=db.max_overflow,
+        pool_timeout=db.pool_timeout,
+        pool_recycle=db.pool_recycle,
+        pool_pre_ping=db.pool_pre_ping,
         future=True,
         echo=echo,
+        **options,
     )
+    if db.metrics_enabled:
+        instrument_engine(engine)
+        instrument_compiled_cache(engine)
+    if db.pool_telemetry_enabled:
+        instrument_pool(engine)
     return engine
 
+def create_replica_engines(db: DbConfig, echo=False):
+    # Replica connections refuse writes, a misrouted write fails loudly
+    options = {"connect_args": {"server_settings": {"default_transaction_read_only": "on"}}} if db.replica_read_only else {}
+    return [create_engine(db, echo=echo, url=url, **options) for url in db.construct_replica_urls()]
+
 # One-time setup function to create database schema
 async def create_tables(db: DbConfig, echo=False):
     """Create all database tables - run once during setup"""
@@ -46,11 +90,12 @@ async def create_tables(db: DbConfig, echo=False):
     async with engine.begin() as conn:
         # Create_all: only creates tables that don't already exist
         await conn.run_sync(Base.metadata.create_all)
-    
+
+    # asyncio.run(create_tables(...)) closes its loop next, close the connections inside it
     await engine.dispose()
 
 # Creates session pool to be used by multiple users concurrently
-# for ongoing database operations (Max 220)
+# for ongoing database operations (Max pool_size + max_overflow)
 async def create_session_pool(db: DbConfig, echo=False):
     """Create session pool for runtime database operations"""
     engine = create_engine(db, echo=echo)
@@ -58,6 +103,18 @@ async def create_session_pool(db: DbConfig, echo=False):
     return session_pool
 
 
+async def create_routing_session_pool(db: DbConfig, echo=False):
+    """Session pool whose reads go to the DB_REPLICA_URLS replicas (see routing.py)"""
+    session_pool = async_sessionmaker(
+        sync_session_class=RoutingSession,
+        # RoutingSession runs inside AsyncSession, it routes between sync engines
+        primary=create_engine(db, echo=echo).sync_engine,
+        replicas=[engine.sync_engine for engine in create_replica_engines(db, echo=echo)],
+        expire_on_commit=False,
+    )
+    return session_pool
+
+
 async def get_session(echo=False):
     """Get a session pool with default configuration"""
     db_config = DbConfig()
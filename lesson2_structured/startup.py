@@ -0,0 +1,318 @@
+# startup.py
+# Cold start: wait for Postgres, fill the pool, compile the hot statements.
+#
+#   startup(DbConfig(), Repo)                     # lesson3_sync.py
+#   await startup_async(AsyncDbConfig(), AsyncRepo)  # lesson3_async.py, same event loop as the app
+#
+# 1. Probe with the configured engine (so DbConfig credentials) and retry with
+#    jittered exponential backoff. docker-compose is only started when nothing
+#    answers on a local host (DB_START_DOCKER=auto), or always / never.
+# 2. Create the monthly partitions of orders / orderproducts for the next
+#    months (database/partitions.py), so new rows don't pile up in DEFAULT.
+#    Open DB_PREWARM_CONNECTIONS connections at once and return them to the
+#    pool, so the first requests don't pay for connection setup.
+# 3. Run the HOT_CALLS Repo methods once inside a transaction that is rolled
+#    back. That fills the engine's compiled statement cache and the ORM's
+#    caches, so the first real call runs at steady-state latency.
+# 4. Compile the HOT_STATEMENTS write statements into the same cache without
+#    running them: a write needs rows that exist, and raises when they don't.
+import asyncio
+import inspect
+import random
+import subprocess
+import time
+
+from sqlalchemy import exc, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import compiler
+
+from .database.partitions import ensure_partitions
+from .order_lines import upsert_order_products_stmt
+from .setup import DbConfig, create_engine_sync
+from .setup_async import DbConfig as AsyncDbConfig, create_engine as create_async_engine
+
+LOCAL_HOSTS = {"localhost", "127.0.0.1", "::1"}
+
+# Repo method -> arguments. Ids that don't exist: the statements compile and
+# run, nothing is found. Everything is rolled back afterwards.
+HOT_CALLS = {
+    "get_user_by_id": (0,),
+    "get_user_language": (0,),
+    "get_all_users": (),
+    "get_users_page": (),
+    "get_total_number_of_orders": (0,),
+    "get_all_user_orders": (0,),
+    "get_user_with_orders": (0,),
+}
+
+# name -> statement builder. Compiled, never executed (see compile_statements)
+HOT_STATEMENTS = {
+    # add_order_product's statement, one line
+    "upsert_order_products": lambda: upsert_order_products_stmt([(0, 0, 1)]),
+}
+
+# what a server that isn't up yet looks like
+_NOT_READY = (exc.OperationalError, exc.InterfaceError, OSError)
+
+# warm_statements result for a HOT_CALLS method the repo class doesn't have
+SKIPPED = "skipped"
+
+
+def pool_capacity(db: DbConfig | AsyncDbConfig) -> int:
+    """Connections an engine built from db can hand out at once: pool_size + max_overflow"""
+    return db.pool_size + max(db.max_overflow, 0)
+
+
+def backoff_delays(base: float, cap: float, rng: random.Random | None = None):
+    """Full jitter: attempt n sleeps uniform(0, min(cap, base * 2^n))"""
+    rng = rng or random.Random()
+    attempt = 0
+    while True:
+        yield rng.uniform(0, min(cap, base * 2 ** attempt))
+        attempt += 1
+
+
+def start_docker(db: DbConfig, reachable: bool) -> bool:
+    """Start docker-compose when DB_START_DOCKER asks for it, returns whether it ran"""
+    if db.start_docker == "never":
+        return False
+    if db.start_docker == "auto" and (reachable or db.host not in LOCAL_HOSTS):
+        return False
+    subprocess.run(["docker-compose", "up", "-d"], check=True)
+    return True
+
+
+def compile_statements(engine, statements: dict = HOT_STATEMENTS) -> dict[str, str | None]:
+    """
+    Summary: Put each statement in the engine's compiled cache without running it.
+    Same cache key as Connection.execute uses, so the first real execution is a hit.
+    Statements without a cache key (values() with literal rows, like
+    upsert_order_products_stmt) are compiled on every execution anyway, compiling
+    one here still gets the ORM and dialect set-up for it out of the first request.
+    Works for sync and async engines, nothing is sent to the server.
+
+    Returns:
+        dict[str, str | None]: name -> None, or the error compiling it raised
+    """
+    engine = getattr(engine, "sync_engine", engine)
+    results = {}
+    for name, build in statements.items():
+        try:
+            build()._compile_w_cache(
+                engine.dialect,
+                compiled_cache=engine._compiled_cache,
+                column_keys=[],
+                for_executemany=False,
+                schema_translate_map=None,
+                linting=engine.dialect.compiler_linting | compiler.WARN_LINTING,
+            )
+            results[name] = None
+        except exc.SQLAlchemyError as e:
+            results[name] = f"{type(e).__name__}: {e.args[0] if e.args else e}"
+    return results
+
+
+# ----- Sync -----
+def is_reachable(engine) -> bool:
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        return True
+    except _NOT_READY:
+        return False
+
+
+def wait_until_ready(engine, timeout: float, base: float, cap: float) -> int:
+    """
+    Summary: Retry SELECT 1 with jittered exponential backoff until it works.
+
+    Returns:
+        int: attempts it took
+
+    Raises:
+        TimeoutError: the server didn't answer within timeout seconds
+    """
+    deadline = time.monotonic() + timeout
+    for attempt, delay in enumerate(backoff_delays(base, cap), start=1):
+        if is_reachable(engine):
+            return attempt
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"Postgres at {engine.url.host} not ready after {timeout:g}s ({attempt} attempts)")
+        print(f"Waiting for Postgres to start... (attempt {attempt})")
+        time.sleep(min(delay, remaining))
+
+
+def prewarm_pool(engine, connections: int) -> int:
+    """
+    Check out `connections` at once and give them back, leaving them idle in the pool.
+    Keep it within pool_capacity(db), past it the checkouts wait for pool_timeout
+    """
+    opened = []
+    try:
+        for _ in range(connections):
+            conn = engine.connect()
+            opened.append(conn)
+            conn.execute(text("SELECT 1"))
+    finally:
+        for conn in opened:
+            conn.close()
+    return len(opened)
+
+
+def warm_statements(engine, repo_class, calls: dict = HOT_CALLS) -> dict[str, str | None]:
+    """
+    Summary: Call each repo method once in a transaction that is rolled back.
+
+    Returns:
+        dict[str, str | None]: method -> None, the error it raised, or SKIPPED
+        when repo_class doesn't have it
+    """
+    results = {}
+    with engine.connect() as conn:
+        outer = conn.begin()
+        # the repo's commits only release savepoints, the outer rollback undoes everything
+        session = Session(bind=conn, join_transaction_mode="create_savepoint", expire_on_commit=False)
+        repo = repo_class(session)
+        try:
+            for name, args in calls.items():
+                method = getattr(repo, name, None)
+                if method is None:
+                    results[name] = SKIPPED
+                    continue
+                try:
+                    result = method(*args)
+                    if hasattr(result, "all"):
+                        result.all()
+                    results[name] = None
+                except exc.SQLAlchemyError as e:
+                    session.rollback()
+                    results[name] = f"{type(e).__name__}: {e.args[0] if e.args else e}"
+        finally:
+            session.close()
+            outer.rollback()
+    return results
+
+
+def startup(db: DbConfig | None = None, repo_class=None, connections: int | None = None):
+    """Wait for the database, pre-warm the pool and the hot statements. Returns the engine"""
+    db = db or DbConfig()
+    started = time.perf_counter()
+    engine = create_engine_sync(db)
+    reachable = is_reachable(engine)
+    if start_docker(db, reachable) or not reachable:
+        wait_until_ready(engine, db.startup_timeout, db.startup_backoff, db.startup_backoff_max)
+    ready = time.perf_counter() - started
+
+    with engine.begin() as conn:
+        partitions = ensure_partitions(conn)
+    connections = db.prewarm_connections if connections is None else connections
+    warmed = prewarm_pool(engine, min(connections, pool_capacity(db)))
+    calls = warm_statements(engine, repo_class) if repo_class is not None else {}
+    calls.update(compile_statements(engine))
+    _report(ready, warmed, calls, time.perf_counter() - started, partitions)
+    return engine
+
+
+# ----- Async -----
+async def is_reachable_async(engine) -> bool:
+    try:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+        return True
+    except _NOT_READY:
+        return False
+
+
+async def wait_until_ready_async(engine, timeout: float, base: float, cap: float) -> int:
+    """Async wait_until_ready"""
+    deadline = time.monotonic() + timeout
+    for attempt, delay in enumerate(backoff_delays(base, cap), start=1):
+        if await is_reachable_async(engine):
+            return attempt
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"Postgres at {engine.url.host} not ready after {timeout:g}s ({attempt} attempts)")
+        print(f"Waiting for Postgres to start... (attempt {attempt})")
+        await asyncio.sleep(min(delay, remaining))
+
+
+async def prewarm_pool_async(engine, connections: int) -> int:
+    """Open the connections concurrently, asyncpg connects are independent round trips. See prewarm_pool"""
+    opened = []
+
+    async def open_one():
+        conn = await engine.connect()
+        opened.append(conn)
+        await conn.execute(text("SELECT 1"))
+
+    try:
+        await asyncio.gather(*(open_one() for _ in range(connections)))
+    finally:
+        for conn in opened:
+            await conn.close()
+    return len(opened)
+
+
+async def warm_statements_async(engine, repo_class, calls: dict = HOT_CALLS) -> dict[str, str | None]:
+    """Async warm_statements"""
+    results = {}
+    async with engine.connect() as conn:
+        outer = await conn.begin()
+        session = AsyncSession(bind=conn, join_transaction_mode="create_savepoint", expire_on_commit=False)
+        repo = repo_class(session)
+        try:
+            for name, args in calls.items():
+                method = getattr(repo, name, None)
+                if method is None:
+                    results[name] = SKIPPED
+                    continue
+                try:
+                    result = method(*args)
+                    if inspect.isawaitable(result):
+                        await result
+                    results[name] = None
+                except exc.SQLAlchemyError as e:
+                    await session.rollback()
+                    results[name] = f"{type(e).__name__}: {e.args[0] if e.args else e}"
+        finally:
+            await session.close()
+            await outer.rollback()
+    return results
+
+
+async def startup_async(db: AsyncDbConfig | None = None, repo_class=None, connections: int | None = None):
+    """startup() for the async engine. Run it in the event loop the app uses"""
+    db = db or AsyncDbConfig()
+    started = time.perf_counter()
+    engine = create_async_engine(db)
+    reachable = await is_reachable_async(engine)
+    if start_docker(db, reachable) or not reachable:
+        await wait_until_ready_async(engine, db.startup_timeout, db.startup_backoff, db.startup_backoff_max)
+    ready = time.perf_counter() - started
+
+    async with engine.begin() as conn:
+        partitions = await conn.run_sync(ensure_partitions)
+    connections = db.prewarm_connections if connections is None else connections
+    warmed = await prewarm_pool_async(engine, min(connections, pool_capacity(db)))
+    calls = await warm_statements_async(engine, repo_class) if repo_class is not None else {}
+    calls.update(compile_statements(engine))
+    _report(ready, warmed, calls, time.perf_counter() - started, partitions)
+    return engine
+
+
+def _report(ready: float, warmed: int, calls: dict, total: float, partitions: list[str] = ()):
+    compiled = sum(error is None for error in calls.values())
+    print(
+        f"Postgres ready after {ready:.2f}s, {warmed} pooled connections warm, "
+        f"{compiled}/{len(calls)} hot calls compiled, startup took {total:.2f}s"
+    )
+    skipped = [name for name, error in calls.items() if error == SKIPPED]
+    if skipped:
+        print(f"  not on the repo, skipped: {', '.join(skipped)}")
+    for name, error in calls.items():
+        if error is not None and error != SKIPPED:
+            print(f"  warm-up of {name} failed: {error}")
+    if partitions:
+        print(f"  created partitions: {', '.join(partitions)}")
@@ -0,0 +1,148 @@
+# statement_cache.py
+# Pre-built statements for the hottest Repo reads, plus compiled cache stats.
+#
+# Building select(User).where(User.telegram_id == telegram_id) on every call
+# costs twice: constructing the objects, then walking the new construct to
+# compute its cache key before the engine can look up the compiled SQL. The
+# statements below are built once with bindparam() placeholders and executed
+# with a parameter dict. The same object comes back every call and memoizes
+# its cache key, so a call goes straight to the compiled cache:
+#
+#   session.execute(USER_BY_ID, {"telegram_id": telegram_id})
+#
+# lambda_stmt() skips the key walk too, but still builds a lambda element per
+# call. benchmarks/statement_cache_bench.py measures all three.
+#
+# compiled_cache_stats(engine) counts compiled cache hits and misses per engine
+# (setup.create_engine_sync / setup_async.create_engine turn it on with DB_METRICS).
+# A hit rate that keeps falling means query_cache_size is too small, or some
+# statement renders values into its SQL instead of binding them.
+import threading
+import weakref
+
+from sqlalchemy import bindparam, event, func, select
+from sqlalchemy.engine.interfaces import CacheStats
+
+from .database.models.orders import Order
+from .database.models.users import User
+from .database.partitions import created_between
+from .engine_registry import registered_engines
+
+# ----- Hot statements -----
+USER_BY_ID = select(User).where(User.telegram_id == bindparam("telegram_id"))
+
+# telegram_id is the primary key: one row or none, same as USER_BY_ID (and the
+# user cache) sees, so no ORDER BY to pick among rows
+USER_LANGUAGE = select(User.language_code).where(
+    User.telegram_id == bindparam("telegram_id")
+)
+
+
+def _total_orders_stmt(since: bool, until: bool):
+    return select(func.count(Order.order_id)).where(
+        Order.user_id == bindparam("telegram_id"),
+        *created_between(
+            Order.created_at,
+            bindparam("since") if since else None,
+            bindparam("until") if until else None,
+        )
+    )
+
+
+# One statement per window shape: (since given, until given)
+TOTAL_ORDERS = {(since, until): _total_orders_stmt(since, until) for since in (False, True) for until in (False, True)}
+
+
+def total_orders_params(telegram_id: int, since=None, until=None) -> tuple:
+    """(statement, parameters) for Repo.get_total_number_of_orders"""
+    params = {"telegram_id": telegram_id}
+    if since is not None:
+        params["since"] = since
+    if until is not None:
+        params["until"] = until
+    return TOTAL_ORDERS[since is not None, until is not None], params
+
+
+# ----- Compiled cache stats -----
+class CompiledCacheStats:
+    """Counts of CacheStats per engine, filled by an after_cursor_execute listener"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # statements without a cache key (or a dialect that can't cache), compiled every time
+        self.uncached = 0
+
+    def observe(self, cache_hit):
+        with self._lock:
+            if cache_hit is CacheStats.CACHE_HIT:
+                self.hits += 1
+            elif cache_hit is CacheStats.CACHE_MISS:
+                self.misses += 1
+            else:
+                self.uncached += 1
+
+    def reset(self):
+        with self._lock:
+            self.hits = self.misses = self.uncached = 0
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "uncached": self.uncached,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# sync engine -> its stats
+_instrumented: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def instrument_compiled_cache(engine) -> CompiledCacheStats:
+    """Attach the listener to a sync or async engine (once per engine)"""
+    engine = getattr(engine, "sync_engine", engine)
+    stats = _instrumented.get(engine)
+    if stats is not None:
+        return stats
+    stats = _instrumented[engine] = CompiledCacheStats()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        stats.observe(context.cache_hit)
+
+    return stats
+
+
+def compiled_cache_stats(engine) -> dict:
+    """
+    Summary: Compiled cache counters and current size for one engine.
+
+    Returns:
+        dict: url, size, capacity, plus hits, misses, uncached and hit_rate when instrumented
+    """
+    engine = getattr(engine, "sync_engine", engine)
+    cache = engine._compiled_cache
+    snapshot = {
+        "url": engine.url.render_as_string(hide_password=True),
+        "size": len(cache) if cache is not None else 0,
+        "capacity": cache.capacity if cache is not None else 0,
+    }
+    stats = _instrumented.get(engine)
+    if stats is not None:
+        snapshot.update(stats.snapshot())
+    return snapshot
+
+
+def render_prometheus() -> str:
+    stats = [compiled_cache_stats(engine) for engine in registered_engines()]
+    lines = []
+    for name in ("size", "capacity", "hit_rate"):
+        lines.append(f"# TYPE db_compiled_cache_{name} gauge")
+        lines.extend(f'db_compiled_cache_{name}{{url="{s["url"]}"}} {s[name]}' for s in stats if name in s)
+    for name in ("hits", "misses", "uncached"):
+        lines.append(f"# TYPE db_compiled_cache_{name}_total counter")
+        lines.extend(f'db_compiled_cache_{name}_total{{url="{s["url"]}"}} {s[name]}' for s in stats if name in s)
+    return "\n".join(lines) + "\n"
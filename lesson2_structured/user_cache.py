@@ -0,0 +1,98 @@
+# user_cache.py
+# Read-through cache for user lookups, keyed by telegram_id.
+#
+# User rows almost never change, but get_user_by_id / get_user_language run on
+# every bot message. Repo checks the cache first and only queries Postgres on a
+# miss; add_user / upsert_users write through so reads never go stale.
+#
+# Usage:
+#   user_cache = UserCache(max_entries=50_000, ttl=300)   # one per process
+#   repo = Repo(session, user_cache=user_cache)
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable
+
+from sqlalchemy.orm import make_transient_to_detached
+
+from .database.models.users import User
+
+_MISSING = object()
+
+
+class UserCache:
+    """
+    Summary: Bounded LRU with a per-entry TTL and hit/miss counters. Thread safe.
+    Stores plain column values, not ORM objects, so entries can be shared across sessions.
+    Anything with the same get/set/invalidate methods can be passed to Repo instead.
+
+    Args:
+        max_entries (int): least recently used entries are evicted past this size
+        ttl (float): seconds an entry stays valid
+        clock (Callable): time source, monotonic seconds
+    """
+    def __init__(self, max_entries: int = 10000, ttl: float = 300.0, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: OrderedDict[int, tuple[float, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, telegram_id: int) -> dict | None:
+        """Cached column values for the user, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(telegram_id, _MISSING)
+            if entry is not _MISSING:
+                expires_at, values = entry
+                if expires_at > self._clock():
+                    self._entries.move_to_end(telegram_id)
+                    self.hits += 1
+                    return values
+                del self._entries[telegram_id]
+            self.misses += 1
+            return None
+
+    def set(self, telegram_id: int, values: dict):
+        with self._lock:
+            self._entries[telegram_id] = (self._clock() + self.ttl, values)
+            self._entries.move_to_end(telegram_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, telegram_id: int):
+        with self._lock:
+            self._entries.pop(telegram_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# ----- ORM helpers -----
+def user_to_values(user: User) -> dict:
+    return {attr.key: getattr(user, attr.key) for attr in User.__mapper__.column_attrs}
+
+
+def user_from_values(values: dict) -> User:
+    """
+    Rebuild a detached User from cached values. session.merge(user, load=False)
+    then attaches it without a query, so relationships (user.orders) still lazy-load
+    """
+    user = User(**values)
+    make_transient_to_detached(user)
+    return user
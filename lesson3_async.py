@@ -1,59 +1,532 @@
-import subprocess
-import time
-import psycopg2
+from datetime import datetime
 import asyncio
+from contextlib import asynccontextmanager
+from itertools import islice
+from typing import AsyncIterator, Awaitable, Callable, Iterable, Sequence
+
 from lesson2_structured.database.models.users import User
-from sqlalchemy import insert
-from lesson2_structured.setup_async import get_session
-from sqlalchemy.orm import Session
+from lesson2_structured.database.models.orders import Order
+from lesson2_structured.database.models.products import Product
+from lesson2_structured.database.models.order_products import OrderProduct
+from lesson2_structured.database.models.user_product_totals import UserProductTotal
+from sqlalchemy import Row, and_, func, or_, select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import aliased
+from lesson2_structured.setup_async import DbConfig, get_session
+from lesson2_structured.startup import pool_capacity, startup_async
+from lesson2_structured.statement_cache import USER_BY_ID, USER_LANGUAGE, total_orders_params
+from lesson2_structured.projections import as_row_type, project
+from lesson2_structured.load_profiles import DEFAULT_PROFILE, profile_options, user_orders_graph
+from lesson2_structured.metrics import label_repo_methods
+from lesson2_structured.user_cache import UserCache, user_from_values, user_to_values
+from lesson2_structured.order_lines import (
+    merge_order_lines, missing_orders, rebuild_user_product_totals_stmts, user_product_totals_mismatch_stmt,
+    upsert_order_products_stmt,
+)
+from lesson2_structured.pagination import decode_cursor, encode_cursor
+from lesson2_structured.database.partitions import created_between
 
-# ----- Docker/Postgres Startup -----
-def start_postgres():
-    subprocess.run(["docker-compose", "up", "-d"], check=True)
+# ----- Repo Class -----
+# Async version of Repo in lesson3_sync.py, same queries awaited on an AsyncSession
+@label_repo_methods
+class AsyncRepo:
+    def __init__(self, session: AsyncSession, user_cache: UserCache | None = None):
+        self.session = session
+        # optional read-through cache, see Repo
+        self.user_cache = user_cache
+        # unit of work state, see Repo.transaction
+        self._transaction_depth = 0
+        self._pending_cache_writes: list[tuple[int, dict | None]] = []
 
-def wait_for_postgres():
-    while True:
+    # ----- Unit of work -----
+    @asynccontextmanager
+    async def transaction(self):
+        # async with repo.transaction(): one commit at exit, SAVEPOINTs when nested
+        if self._transaction_depth:
+            mark = len(self._pending_cache_writes)
+            self._transaction_depth += 1
+            try:
+                async with self.session.begin_nested():
+                    yield self
+            except BaseException:
+                del self._pending_cache_writes[mark:]
+                raise
+            finally:
+                self._transaction_depth -= 1
+            return
+
+        self._transaction_depth = 1
         try:
-            conn = psycopg2.connect(
-                host="127.0.0.1",
-                database="postgres",
-                user="postgres",
-                password="testpassword"
-            )
-            conn.close()
-            break
-        except psycopg2.OperationalError:
-            print("Waiting for Postgres to start...")
-            time.sleep(2)
+            yield self
+            await self.session.commit()
+        except BaseException:
+            await self.session.rollback()
+            self._pending_cache_writes.clear()
+            raise
+        finally:
+            self._transaction_depth = 0
+        self._apply_cache_writes()
 
-# ----- Repo Class -----
-class Repo:
-    def __init__(self, session: Session):
-        self.session = session
+    batch = transaction
+
+    async def _commit(self):
+        if self._transaction_depth:
+            await self.session.flush()
+            return
+        try:
+            await self.session.commit()
+        except BaseException:
+            self._pending_cache_writes.clear()
+            raise
+        self._apply_cache_writes()
+
+    # see Repo._cache_write / _cache_fill: writes wait for the commit, reads fill right away
+    def _cache_write(self, telegram_id: int, values: dict | None = None):
+        if self.user_cache is None:
+            return
+        self._pending_cache_writes.append((telegram_id, values))
+
+    def _cache_fill(self, telegram_id: int, values: dict):
+        self._cache_write(telegram_id, values)
+        if not self._transaction_depth:
+            self._apply_cache_writes()
+
+    def _has_pending_cache_write(self, telegram_id: int) -> bool:
+        return any(pending_id == telegram_id for pending_id, _ in self._pending_cache_writes)
+
+    def _apply_cache_writes(self):
+        writes, self._pending_cache_writes = self._pending_cache_writes, []
+        if self.user_cache is None:
+            return
+        for telegram_id, values in writes:
+            if values is None:
+                self.user_cache.invalidate(telegram_id)
+            else:
+                self.user_cache.set(telegram_id, values)
 
     async def add_user(
-        self, 
-        telegram_id: int, 
-        full_name: str, 
-        language_code: str, 
-        user_name: str = None,
-        referrer_id=None
-    ):
+        self,
+        telegram_id: int,
+        full_name: str,
+        language_code: str,
+        referred_id=None,
+        user_name: str = None) -> User:
+        # insert if not exists, or update if exists
         stmt = insert(User).values(
-            telegram_id=telegram_id,
-            full_name=full_name,
-            user_name=user_name,
-            language_code=language_code,
-            referrer_id=referrer_id
+                telegram_id=telegram_id,
+                full_name=full_name,
+                user_name=user_name,
+                language_code=language_code,
+                referred_id=referred_id
+            ).on_conflict_do_update(
+                index_elements=[User.telegram_id],
+                set_= {
+                    "full_name": full_name,
+                    "user_name": user_name
+                }
+            ).returning(
+                User
+            ).execution_options(
+                populate_existing=True
+            )
+        result = (await self.session.execute(stmt)).scalar_one()
+        if self.user_cache is not None:
+            self._cache_write(result.telegram_id, user_to_values(result))
+        await self._commit()
+        return result
+
+    async def upsert_users(
+        self,
+        rows: Iterable[dict],
+        batch_size: int = 1000,
+        return_rows: bool = False) -> list[User] | list[int]:
+        # See Repo.upsert_users
+        stmt = insert(User)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[User.telegram_id],
+            set_={
+                "full_name": stmt.excluded.full_name,
+                "user_name": stmt.excluded.user_name
+            }
+        ).returning(
+            User if return_rows else User.telegram_id
+        ).execution_options(
+            insertmanyvalues_page_size=batch_size,
+            populate_existing=True
+        )
+
+        upserted = []
+        rows = iter(rows)
+        while batch := list(islice(rows, batch_size)):
+            batch = list({
+                row["telegram_id"]: {"user_name": None, "referred_id": None, **row} for row in batch
+            }.values())
+            upserted.extend((await self.session.scalars(stmt, batch)).all())
+        if self.user_cache is not None:
+            if return_rows:
+                for user in upserted:
+                    self._cache_write(user.telegram_id, user_to_values(user))
+            else:
+                for telegram_id in upserted:
+                    self._cache_write(telegram_id)
+        await self._commit()
+        return upserted
+
+    # profile: "summary" or "full", see load_profiles.py
+    async def get_user_by_id(self, telegram_id: int, profile: str = DEFAULT_PROFILE) -> User | None:
+        if self.user_cache is not None and not self._has_pending_cache_write(telegram_id):
+            values = self.user_cache.get(telegram_id)
+            if values is not None:
+                return await self.session.merge(user_from_values(values), load=False)
+
+        options = profile_options(profile, User)
+        stmt = USER_BY_ID.options(*options) if options else USER_BY_ID
+        result = await self.session.execute(stmt, {"telegram_id": telegram_id})
+        user = result.scalars().first()
+        if user is not None and self.user_cache is not None:
+            self._cache_fill(telegram_id, user_to_values(user))
+        return user
+
+    async def get_all_users(self, profile: str = DEFAULT_PROFILE) -> list[User]:
+        stmt = select(
+            User
+            ).where(
+                or_(
+                    User.language_code == "en",
+                    User.language_code == "uk",
+                    User.language_code == "fr"
+                ),
+            ).order_by(
+                User.created_at.desc()
+            ).limit(
+                10
+            )
+        result = await self.session.execute(stmt.options(*profile_options(profile, User)))
+        return result.scalars().all()
+
+    async def get_users_page(
+        self,
+        cursor: str | None = None,
+        page_size: int = 10,
+        language_codes: Sequence[str] = ("en", "uk", "fr"),
+        profile: str = DEFAULT_PROFILE) -> tuple[list[User], str | None]:
+        # Keyset pagination, see Repo.get_users_page
+        stmt = select(
+            User
+            ).where(
+                User.language_code.in_(language_codes)
+            ).order_by(
+                User.created_at.desc(),
+                User.telegram_id.desc()
+            ).limit(
+                page_size
+            )
+        if cursor is not None:
+            created_at, telegram_id = decode_cursor(cursor)
+            stmt = stmt.where(
+                tuple_(User.created_at, User.telegram_id) < tuple_(created_at, telegram_id)
+            )
+        users = (await self.session.execute(stmt.options(*profile_options(profile, User)))).scalars().all()
+        next_cursor = None
+        if len(users) == page_size:
+            next_cursor = encode_cursor(users[-1].created_at, users[-1].telegram_id)
+        return users, next_cursor
+
+    async def get_user_language(self, telegram_id: int) -> str | None:
+        # See Repo.get_user_language
+        if self.user_cache is not None:
+            user = await self.get_user_by_id(telegram_id)
+            return user.language_code if user is not None else None
+
+        result = await self.session.execute(USER_LANGUAGE, {"telegram_id": telegram_id})
+        return result.scalar_one_or_none()
+
+    async def add_order(self, user_id: int) -> Order:
+        stmt = select(Order).from_statement(
+            insert(Order).values(
+                user_id=user_id
+            ).returning(
+                Order
+            )
         )
-        await self.session.execute(stmt)
-        await self.session.commit()
+        result = await self.session.scalars(stmt)
+        order = result.first()
+        await self._commit()
+        return order
+
+    async def add_product(self, title: str, description: str, price: int) -> Product:
+        stmt = select(Product).from_statement(
+            insert(Product).values(
+                title=title,
+                description=description,
+                price=price
+            ).returning(
+                Product
+            )
+        )
+        result = await self.session.scalars(stmt)
+        product = result.first()
+        await self._commit()
+        return product
+
+    async def add_order_product(self, order_id: int, product_id: int, quantity: int) -> OrderProduct:
+        # See Repo.add_order_product
+        return (await self.add_order_products([(order_id, product_id, quantity)]))[0]
+
+    async def add_order_products(self, lines: Iterable[tuple[int, int, int]]) -> list[OrderProduct]:
+        lines = merge_order_lines(lines)
+        if not lines:
+            return []
+        if self._transaction_depth:
+            # See Repo.add_order_products: the SAVEPOINT undoes this statement only
+            async with self.session.begin_nested():
+                result = await self._upsert_order_lines(lines)
+        else:
+            try:
+                result = await self._upsert_order_lines(lines)
+            except ValueError:
+                await self.session.rollback()
+                raise
+        await self._commit()
+        return result
+
+    async def _upsert_order_lines(self, lines: list[tuple[int, int, int]]) -> list[OrderProduct]:
+        result = (await self.session.scalars(upsert_order_products_stmt(lines))).all()
+        missing = missing_orders(lines, result)
+        if missing:
+            raise ValueError(f"order {missing[0]} not found" if len(missing) == 1 else f"orders {missing} not found")
+        return result
+
+    # Join User and Order tables on User.orders
+    @staticmethod
+    def _all_user_orders_stmt(telegram_id: int):
+        return (
+            select(Product, Order, User, OrderProduct)
+            .join(User.orders)).join(
+                Order.products
+            ).join(
+                Product
+            ).where(
+                User.telegram_id == telegram_id
+            )
+
+    async def get_all_user_orders(self, telegram_id: int, columns: Sequence | None = None, row_type: type | None = None,
+                                  profile: str = DEFAULT_PROFILE):
+        # columns / row_type: plain projected rows, profile: entity columns, see Repo.get_all_user_orders
+        stmt = self._all_user_orders_stmt(telegram_id)
+        if columns is not None:
+            return as_row_type((await self.session.execute(project(stmt, columns))).all(), row_type)
+        if row_type is not None:
+            raise ValueError("row_type needs columns")
+        result = await self.session.execute(stmt.options(*profile_options(profile, Product, Order, User, OrderProduct)))
+        # Rows are (Product, Order, User, OrderProduct) tuples, so no scalars()
+        return result.all()
+
+    # Eager loading, see Repo.get_users_with_orders. AsyncSession can't lazy load,
+    # so walking the graph only works on what these load up front
+    async def _scalars_with_graph(self, stmt, strategy: str, profile: str = DEFAULT_PROFILE) -> list:
+        stmt = stmt.options(user_orders_graph(strategy, profile), *profile_options(profile, User))
+        result = await self.session.execute(stmt)
+        if strategy == "joined":
+            result = result.unique()
+        return result.scalars().all()
+
+    async def get_users_with_orders(self, strategy: str = "selectin", limit: int | None = None,
+                                    profile: str = DEFAULT_PROFILE) -> list[User]:
+        stmt = select(User).order_by(User.created_at.desc())
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        return await self._scalars_with_graph(stmt, strategy, profile)
+
+    async def get_user_with_orders(self, telegram_id: int, strategy: str = "selectin",
+                                   profile: str = DEFAULT_PROFILE) -> User | None:
+        stmt = select(User).where(User.telegram_id == telegram_id)
+        users = await self._scalars_with_graph(stmt, strategy, profile)
+        return users[0] if users else None
+
+    # Count the number of unique orders
+    # since / until: optional [since, until) window on created_at, see Repo.get_total_number_of_orders
+    async def get_total_number_of_orders(self, telegram_id: int, since: datetime | None = None, until: datetime | None = None):
+        # pre-built statements, see Repo.get_total_number_of_orders
+        stmt, params = total_orders_params(telegram_id, since, until)
+        return await self.session.scalar(stmt, params)
+
+    # Count the number of orders for all users
+    @staticmethod
+    def _total_number_of_orders_all_users_stmt(since: datetime | None = None, until: datetime | None = None):
+        return (
+            select(func.count(
+                Order.order_id
+            ).label('quantity'),
+                User.full_name
+            ).join(
+                User
+            ).where(
+                *created_between(Order.created_at, since, until)
+            ).group_by(User.telegram_id)
+        )
+
+    async def get_total_number_of_orders_all_users(self, since: datetime | None = None, until: datetime | None = None):
+        stmt = self._total_number_of_orders_all_users_stmt(since, until)
+        result = await self.session.execute(stmt)
+        return result.all()
+
+    # Streaming: see Repo.stream_all_user_orders. AsyncSession.stream() uses a
+    # server-side cursor and hands rows over partition_size at a time
+    async def _stream_partitions(self, stmt, partition_size: int) -> AsyncIterator[Sequence[Row]]:
+        result = await self.session.stream(
+            stmt.execution_options(stream_results=True, yield_per=partition_size)
+        )
+        try:
+            async for partition in result.partitions():
+                yield partition
+        finally:
+            await result.close()
+
+    def stream_all_user_orders(self, telegram_id: int, partition_size: int = 1000,
+                               columns: Sequence | None = None, row_type: type | None = None,
+                               profile: str = DEFAULT_PROFILE) -> AsyncIterator[Sequence[Row]]:
+        stmt = self._all_user_orders_stmt(telegram_id)
+        if columns is None:
+            stmt = stmt.options(*profile_options(profile, Product, Order, User, OrderProduct))
+            return self._stream_partitions(stmt, partition_size)
+        return self._stream_projected(project(stmt, columns), partition_size, row_type)
+
+    async def _stream_projected(self, stmt, partition_size: int, row_type: type | None) -> AsyncIterator[list]:
+        async for partition in self._stream_partitions(stmt, partition_size):
+            yield as_row_type(partition, row_type)
+
+    def stream_total_number_of_orders_all_users(self, partition_size: int = 1000, since: datetime | None = None, until: datetime | None = None) -> AsyncIterator[Sequence[Row]]:
+        return self._stream_partitions(self._total_number_of_orders_all_users_stmt(since, until), partition_size)
+
+    # Sum up the number or products
+    async def get_total_number_of_products(self, since: datetime | None = None, until: datetime | None = None):
+        stmt = (
+            select(func.sum(
+                OrderProduct.quantity
+            ).label('quantity'),
+                User.full_name
+            ).join(
+                Order,
+                and_(Order.order_id == OrderProduct.order_id, Order.created_at == OrderProduct.order_created_at)
+            ).join(
+                User
+            ).where(
+                *created_between(Order.created_at, since, until),
+                *created_between(OrderProduct.order_created_at, since, until)
+            ).group_by(
+                User.telegram_id
+            ).having(func.sum(OrderProduct.quantity) > 50000)
+        )
+        result = await self.session.execute(stmt)
+        return result.all()
+
+    # Summary table: user_product_totals, kept current by add_order_products
+    async def get_total_number_of_products_from_summary(self, threshold: int = 50000):
+        stmt = (
+            select(
+                UserProductTotal.total_quantity.label('quantity'),
+                User.full_name
+            ).join(
+                User, User.telegram_id == UserProductTotal.user_id
+            ).where(
+                UserProductTotal.total_quantity > threshold
+            )
+        )
+        result = await self.session.execute(stmt)
+        return result.all()
+
+    async def rebuild_user_product_totals(self):
+        # See Repo.rebuild_user_product_totals
+        for stmt in rebuild_user_product_totals_stmts():
+            await self.session.execute(stmt)
+        await self._commit()
+
+    async def check_user_product_totals(self) -> list[tuple[int, int | None, int | None]]:
+        # See Repo.check_user_product_totals, empty when the summary is correct
+        return [tuple(row) for row in await self.session.execute(user_product_totals_mismatch_stmt())]
+
+    # Inner Join: users who were invited by a referrer (referred_id)
+    async def select_all_invited_users(self):
+        ParentUser = aliased(User)
+        ReferralUser = aliased(User)
+        stmt = (
+            select(ParentUser.full_name.label("parent_name"),
+                   ReferralUser.full_name.label("referral_name")
+            ).join(
+                ReferralUser, ReferralUser.referred_id == ParentUser.telegram_id
+            )
+        )
+        result = await self.session.execute(stmt)
+        return result.all()
+
+    # Outer join variant, see Repo.select_all_invited_users2
+    async def select_all_invited_users2(self):
+        ParentUser = aliased(User)
+        ReferralUser = aliased(User)
+        stmt = (
+            select(ParentUser.full_name.label("parent_name"),
+                   ReferralUser.full_name.label("referral_name")
+            ).outerjoin(
+                ReferralUser, ReferralUser.referred_id == ParentUser.telegram_id
+            ).where(
+                ReferralUser.telegram_id.isnot(None),
+                ParentUser.referred_id.isnot(None)
+            )
+        )
+        result = await self.session.execute(stmt)
+        return result.all()
+
+
+# ----- Bounded Concurrency -----
+async def gather_bounded(
+    session_pool: async_sessionmaker,
+    operations: Iterable[Callable[[AsyncRepo], Awaitable]],
+    limit: int | None = None,
+    db: DbConfig | None = None) -> list:
+    """
+    Summary: Run many repo operations concurrently, each with its own session
+    (an AsyncSession can't be shared between tasks). A semaphore sized to the
+    engine pool keeps at most that many checkouts in flight, so tasks wait on
+    the semaphore instead of queueing inside the pool until pool_timeout.
+
+    Args:
+        session_pool (async_sessionmaker): from setup_async.create_session_pool
+        operations (Iterable[Callable]): e.g. lambda repo: repo.get_user_by_id(1)
+        limit (int | None): max concurrent sessions, defaults to pool_size + max_overflow of db
+        db (DbConfig | None): the config session_pool was created from, DbConfig() when not given
+
+    Returns:
+        list: results in the same order as operations
+    """
+    if limit is None:
+        limit = pool_capacity(db or DbConfig())
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(operation):
+        async with semaphore:
+            async with session_pool() as session:
+                return await operation(AsyncRepo(session))
+
+    return await asyncio.gather(*(run(operation) for operation in operations))
+
+
+async def get_users_by_ids(session_pool: async_sessionmaker, telegram_ids: Iterable[int], limit: int | None = None,
+                           db: DbConfig | None = None) -> list[User | None]:
+    # Example fan out: one lookup per id
+    return await gather_bounded(
+        session_pool,
+        [lambda repo, telegram_id=telegram_id: repo.get_user_by_id(telegram_id) for telegram_id in telegram_ids],
+        limit=limit,
+        db=db
+    )
 
 # ----- Main Async Function -----
 async def main():
     session_pool = await get_session()
     async with session_pool() as session:
-        repo = Repo(session)
+        repo = AsyncRepo(session)
         await repo.add_user(
             telegram_id=1,
             full_name="John Doe",
@@ -61,9 +534,17 @@ async def main():
             user_name="johnny"
         )
 
+    # Fan out over the pool
+    # users = await get_users_by_ids(session_pool, [1, 2, 3])
+    # for user in users:
+    #     print(user and user.full_name)
+
 # ----- Run everything -----
-if __name__ == "__main__":
-    start_postgres()
-    wait_for_postgres()
+async def run():
+    # Same event loop for startup and main: asyncpg connections belong to the loop that opened them
+    await startup_async(DbConfig(), AsyncRepo)
     print("Postgres ready, starting async DB operations...")
-    asyncio.run(main())
\ No newline at end of file
+    await main()
+
+if __name__ == "__main__":
+    asyncio.run(run())
@@ -1,44 +1,131 @@
+from contextlib import contextmanager
 import random
-import subprocess
 import time
-import psycopg2
+from datetime import datetime
+from itertools import islice
+from typing import Iterable, Iterator, Sequence
 from faker import Faker
 
 from lesson2_structured.database.models.users import User
 from lesson2_structured.database.models.orders import Order
 from lesson2_structured.database.models.products import Product
 from lesson2_structured.database.models.order_products import OrderProduct
-from sqlalchemy import and_, func, or_, select
+from lesson2_structured.database.models.user_product_totals import UserProductTotal
+from sqlalchemy import Row, and_, func, or_, select, tuple_
 # from sqlalchemy import insert
 from sqlalchemy.dialects.postgresql import insert
 
-from lesson2_structured.setup import DbConfig, drop_tables, create_tables, get_session
+from lesson2_structured.setup import DbConfig, drop_tables, create_tables, get_routing_session, get_session
+from lesson2_structured.query_counter import assert_num_statements
+from lesson2_structured.nplusone import detect_repeated_statements
+from lesson2_structured.metrics import dump_metrics, label_repo_methods, start_metrics_server
+from lesson2_structured.pool_telemetry import pool_stats
+from lesson2_structured.startup import startup
+from lesson2_structured.statement_cache import USER_BY_ID, USER_LANGUAGE, total_orders_params
+from lesson2_structured.projections import ORDER_LINE_COLUMNS, OrderLine, as_row_type, project
+from lesson2_structured.load_profiles import DEFAULT_PROFILE, profile_options, user_orders_graph
+from lesson2_structured.user_cache import UserCache, user_from_values, user_to_values
+from lesson2_structured.order_lines import (
+    merge_order_lines, missing_orders, rebuild_user_product_totals_stmts, user_product_totals_mismatch_stmt,
+    upsert_order_products_stmt,
+)
+from lesson2_structured.database.partitions import created_between
+from lesson2_structured.pagination import decode_cursor, encode_cursor
 
 from sqlalchemy.orm import Session, aliased
 
-# ----- Docker/Postgres Startup -----
-def start_postgres():
-    subprocess.run(["docker-compose", "up", "-d"], check=True)
-
-def wait_for_postgres():
-    while True:
-        try:
-            conn = psycopg2.connect(
-                host="127.0.0.1",
-                database="postgres",
-                user="postgres",
-                password="testpassword"
-            )
-            conn.close()
-            break
-        except psycopg2.OperationalError:
-            print("Waiting for Postgres to start...")
-            time.sleep(2)
-
 # ----- Repo Class -----
+@label_repo_methods
 class Repo:
-    def __init__(self, session: Session):
+    def __init__(self, session: Session, user_cache: UserCache | None = None):
         self.session = session
+        # optional read-through cache for get_user_by_id / get_user_language
+        self.user_cache = user_cache
+        # unit of work state, see transaction()
+        self._transaction_depth = 0
+        self._pending_cache_writes: list[tuple[int, dict | None]] = []
+
+    # ----- Unit of work -----
+    @contextmanager
+    def transaction(self):
+        """
+        Summary: Group several write methods into one transaction.
+        Inside the block the per-method commits are skipped and everything is
+        committed once at exit, or rolled back if the block raises.
+        Nested blocks become SAVEPOINTs, so an inner failure only undoes the inner block.
+
+        Usage:
+            with repo.transaction():
+                order = repo.add_order(user_id)
+                for product_id, quantity in cart:
+                    repo.add_order_product(order.order_id, product_id, quantity)
+        """
+        if self._transaction_depth:
+            mark = len(self._pending_cache_writes)
+            self._transaction_depth += 1
+            try:
+                with self.session.begin_nested():
+                    yield self
+            except BaseException:
+                # those writes were rolled back, so they must not reach the cache
+                del self._pending_cache_writes[mark:]
+                raise
+            finally:
+                self._transaction_depth -= 1
+            return
+
+        self._transaction_depth = 1
+        try:
+            yield self
+            self.session.commit()
+        except BaseException:
+            self.session.rollback()
+            self._pending_cache_writes.clear()
+            raise
+        finally:
+            self._transaction_depth = 0
+        self._apply_cache_writes()
+
+    batch = transaction
+
+    def _commit(self):
+        # Every write method ends here instead of calling session.commit() directly
+        if self._transaction_depth:
+            self.session.flush()
+            return
+        try:
+            self.session.commit()
+        except BaseException:
+            # nothing was committed, the queued cache writes must not land
+            self._pending_cache_writes.clear()
+            raise
+        self._apply_cache_writes()
+
+    def _cache_write(self, telegram_id: int, values: dict | None = None):
+        # Write methods: queued, applied once the commit succeeded (_commit / transaction()).
+        # values=None invalidates
+        if self.user_cache is None:
+            return
+        self._pending_cache_writes.append((telegram_id, values))
+
+    def _cache_fill(self, telegram_id: int, values: dict):
+        # Reads: committed values go in right away, inside a transaction they wait for the commit
+        self._cache_write(telegram_id, values)
+        if not self._transaction_depth:
+            self._apply_cache_writes()
+
+    def _has_pending_cache_write(self, telegram_id: int) -> bool:
+        return any(pending_id == telegram_id for pending_id, _ in self._pending_cache_writes)
+
+    def _apply_cache_writes(self):
+        writes, self._pending_cache_writes = self._pending_cache_writes, []
+        if self.user_cache is None:
+            return
+        for telegram_id, values in writes:
+            if values is None:
+                self.user_cache.invalidate(telegram_id)
+            else:
+                self.user_cache.set(telegram_id, values)
 
     def add_user(
         self, 
@@ -73,21 +160,95 @@ class Repo:
                 }
             ).returning(
                 User
+            ).execution_options(
+                # refresh the User if it's already in the session, so the cache gets the new values
+                populate_existing=True
             )
         
         result = self.session.execute(stmt).scalar_one()
-        print(f"User: {result.full_name}")
-        self.session.commit()
+        if self.user_cache is not None:
+            # write through once committed: the next read is a hit with the upserted values
+            self._cache_write(result.telegram_id, user_to_values(result))
+        self._commit()
         return result
-        
-    def get_user_by_id(self, telegram_id: int) -> User | None:
-        stmt = select(User).where(User.telegram_id == telegram_id)
-        result = self.session.execute(stmt)
+
+    def upsert_users(
+        self,
+        rows: Iterable[dict],
+        batch_size: int = 1000,
+        return_rows: bool = False) -> list[User] | list[int]:
+        """
+        Summary: Bulk version of add_user. Rows are sent as multi-row
+        INSERT ... ON CONFLICT DO UPDATE statements (SQLAlchemy's
+        insertmanyvalues path), batch_size rows per round trip, one commit at the end.
+
+        Args:
+            rows (Iterable[dict]): user dicts with the add_user keyword names
+            batch_size (int): rows per INSERT statement
+            return_rows (bool): return User objects instead of telegram_ids
+
+        Returns:
+            list[User] | list[int]: upserted users, or their telegram_ids
+        """
+        stmt = insert(User)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[User.telegram_id],
+            # same columns add_user updates on conflict
+            set_={
+                "full_name": stmt.excluded.full_name,
+                "user_name": stmt.excluded.user_name
+            }
+        ).returning(
+            User if return_rows else User.telegram_id
+        ).execution_options(
+            insertmanyvalues_page_size=batch_size,
+            # refresh User objects already in the identity map
+            populate_existing=True
+        )
+
+        upserted = []
+        rows = iter(rows)
+        # Only batch_size dicts are held in memory at a time
+        while batch := list(islice(rows, batch_size)):
+            # every row needs the same keys for one multi-row VALUES statement
+            # ON CONFLICT can't update the same row twice in one statement,
+            # a telegram_id repeated in the batch keeps its last row
+            batch = list({
+                row["telegram_id"]: {"user_name": None, "referred_id": None, **row} for row in batch
+            }.values())
+            upserted.extend(self.session.scalars(stmt, batch).all())
+        if self.user_cache is not None:
+            if return_rows:
+                for user in upserted:
+                    self._cache_write(user.telegram_id, user_to_values(user))
+            else:
+                # only the keys came back, drop the old values
+                for telegram_id in upserted:
+                    self._cache_write(telegram_id)
+        self._commit()
+        return upserted
+
+    # profile: which columns to load, "summary" or "full" (see load_profiles.py)
+    def get_user_by_id(self, telegram_id: int, profile: str = DEFAULT_PROFILE) -> User | None:
+        # a write to this user is waiting for the commit, the cache still has the old values
+        if self.user_cache is not None and not self._has_pending_cache_write(telegram_id):
+            values = self.user_cache.get(telegram_id)
+            if values is not None:
+                # attach without a query
+                return self.session.merge(user_from_values(values), load=False)
+
+        # pre-built statement, no construct or cache key to build per call (see statement_cache.py)
+        options = profile_options(profile, User)
+        stmt = USER_BY_ID.options(*options) if options else USER_BY_ID
+        result = self.session.execute(stmt, {"telegram_id": telegram_id})
         # user = result.scalar_one_or_none()
         # return the actual values not the tuple
-        return result.scalars().first()
+        user = result.scalars().first()
+        if user is not None and self.user_cache is not None:
+            self._cache_fill(telegram_id, user_to_values(user))
+        return user
     
-    def get_all_users(self) -> list[User]:
+    def get_all_users(self, profile: str = DEFAULT_PROFILE) -> list[User]:
         stmt = select(
             User
             ).where(
@@ -111,17 +272,63 @@ class Repo:
             # .having(
             #     User.telegram_id > 0
             # )
-        result = self.session.execute(stmt) 
+        result = self.session.execute(stmt.options(*profile_options(profile, User)))
         # return the actual values not the tuple
         return result.scalars().all()
     
-    def get_user_language(self, telegram_id: int) -> str:
-        stmt = select(User.language_code).where(User.telegram_id == telegram_id).order_by(
-            User.created_at.desc()
-        )
-        result = self.session.execute(stmt)
+    def get_users_page(
+        self,
+        cursor: str | None = None,
+        page_size: int = 10,
+        language_codes: Sequence[str] = ("en", "uk", "fr"),
+        profile: str = DEFAULT_PROFILE) -> tuple[list[User], str | None]:
+        """
+        Summary: Keyset (cursor) pagination over the get_all_users query.
+        Instead of OFFSET, each page seeks past the last (created_at, telegram_id)
+        of the previous page using ix_users_created_at_telegram_id, so page N
+        costs the same as page 1.
+
+        Args:
+            cursor (str | None): cursor returned with the previous page, None for the first page
+            page_size (int): users per page
+            language_codes (Sequence[str]): same filter as get_all_users
+            profile (str): "summary" or "full", see load_profiles.py
+
+        Returns:
+            tuple[list[User], str | None]: the page, and the cursor for the next one (None on the last page)
+        """
+        stmt = select(
+            User
+            ).where(
+                User.language_code.in_(language_codes)
+            ).order_by(
+                User.created_at.desc(),
+                # telegram_id breaks ties between users created in the same instant
+                User.telegram_id.desc()
+            ).limit(
+                page_size
+            )
+        if cursor is not None:
+            created_at, telegram_id = decode_cursor(cursor)
+            stmt = stmt.where(
+                tuple_(User.created_at, User.telegram_id) < tuple_(created_at, telegram_id)
+            )
+        users = self.session.execute(stmt.options(*profile_options(profile, User))).scalars().all()
+        next_cursor = None
+        if len(users) == page_size:
+            next_cursor = encode_cursor(users[-1].created_at, users[-1].telegram_id)
+        return users, next_cursor
+
+    def get_user_language(self, telegram_id: int) -> str | None:
+        # Both paths read the one row with this telegram_id, None when there is none
+        if self.user_cache is not None:
+            # served from (and fills) the same cache entry as get_user_by_id
+            user = self.get_user_by_id(telegram_id)
+            return user.language_code if user is not None else None
+
+        result = self.session.execute(USER_LANGUAGE, {"telegram_id": telegram_id})
         # select one column of one row
-        return result.scalars().first()
+        return result.scalar_one_or_none()
     
     def add_order(self, user_id: int) -> Order:
         stmt = select(Order).from_statement(
@@ -132,7 +339,7 @@ class Repo:
             )
         )
         result = self.session.scalars(stmt)
-        self.session.commit()
+        self._commit()
         return result.first()
     
     def add_product(self, title: str, description: str, price: int) -> Product:
@@ -146,29 +353,56 @@ class Repo:
             )
         )
         result = self.session.scalars(stmt)
-        self.session.commit()
+        self._commit()
         return result.first()
     
-    def add_order_product(self, order_id: int, product_id: int, quantity: int):
-        existing = self.session.get(OrderProduct, {"order_id": order_id, "product_id": product_id})
-        # Make sure not to make a duplicate record
-        if not existing:
-            stmt = insert(OrderProduct).values(
-                order_id=order_id, 
-                product_id=product_id,
-                quantity=quantity,
-            ).returning(OrderProduct)
-            result = self.session.execute(stmt)
-            self.session.commit()
-            return result.first()
+    def add_order_product(self, order_id: int, product_id: int, quantity: int) -> OrderProduct:
+        # One round trip: insert the line, or add quantity to the existing line,
+        # and update user_product_totals in the same statement
+        return self.add_order_products([(order_id, product_id, quantity)])[0]
+
+    def add_order_products(self, lines: Iterable[tuple[int, int, int]]) -> list[OrderProduct]:
+        """
+        Summary: Batch add_order_product, one statement for all the lines.
+        Repeated (order_id, product_id) pairs are summed first.
+
+        Args:
+            lines (Iterable[tuple[int, int, int]]): (order_id, product_id, quantity) tuples
+
+        Returns:
+            list[OrderProduct]: the lines with their accumulated quantity
+
+        Raises:
+            ValueError: a line's order doesn't exist, nothing is added
+        """
+        lines = merge_order_lines(lines)
+        if not lines:
+            return []
+        if self._transaction_depth:
+            # the statement writes lines and totals before we can tell an order was missing,
+            # the SAVEPOINT undoes them without losing the rest of the transaction
+            with self.session.begin_nested():
+                result = self._upsert_order_lines(lines)
         else:
-            # existing.quantity += quantity
-            # self.session.commit()
-            return existing
-        
+            try:
+                result = self._upsert_order_lines(lines)
+            except ValueError:
+                self.session.rollback()
+                raise
+        self._commit()
+        return result
+
+    def _upsert_order_lines(self, lines: list[tuple[int, int, int]]) -> list[OrderProduct]:
+        result = self.session.scalars(upsert_order_products_stmt(lines)).all()
+        missing = missing_orders(lines, result)
+        if missing:
+            raise ValueError(f"order {missing[0]} not found" if len(missing) == 1 else f"orders {missing} not found")
+        return result
+
     # Join User and Order tables on User.orders
-    def get_all_user_orders(self, telegram_id: int):
-        stmt = (
+    @staticmethod
+    def _all_user_orders_stmt(telegram_id: int):
+        return (
             select(Product, Order, User, OrderProduct)
             .join(User.orders)).join(
                 Order.products
@@ -177,7 +411,29 @@ class Repo:
             ).where(
                 User.telegram_id == telegram_id
             )
-        result = self.session.execute(stmt)
+
+    def get_all_user_orders(self, telegram_id: int, columns: Sequence | None = None, row_type: type | None = None,
+                            profile: str = DEFAULT_PROFILE):
+        """
+        Summary: Every order line of a user with its product, order and user.
+
+        Args:
+            telegram_id (int): the user
+            columns (Sequence | None): only select these columns (see projections.py),
+                rows are plain Row objects and no ORM entities are loaded
+            row_type (type | None): with columns, build one row_type(*row) per row,
+                e.g. projections.OrderLine
+            profile (str): columns of the entities, "summary" skips Product.description (see load_profiles.py)
+
+        Returns:
+            list: (Product, Order, User, OrderProduct) rows, or the projected rows
+        """
+        stmt = self._all_user_orders_stmt(telegram_id)
+        if columns is not None:
+            return as_row_type(self.session.execute(project(stmt, columns)).all(), row_type)
+        if row_type is not None:
+            raise ValueError("row_type needs columns")
+        result = self.session.execute(stmt.options(*profile_options(profile, Product, Order, User, OrderProduct)))
         # Note: Don't use scalars when joining multiple tables with mult labels
         """
         scalars() is designed to extract a single ORM-mapped entity or column 
@@ -193,37 +449,91 @@ from sqlalchemy import func
         """
         return result.all()
     
+    # Eager loading: user.orders, order.products and product.product are loaded
+    # up front, so walking them afterwards doesn't lazy-load one query per hop (N+1).
+    # strategy: "selectin", "joined" or "subquery", see load_profiles.LOADER_STRATEGIES
+    def _scalars_with_graph(self, stmt, strategy: str, profile: str = DEFAULT_PROFILE) -> list:
+        stmt = stmt.options(user_orders_graph(strategy, profile), *profile_options(profile, User))
+        result = self.session.execute(stmt)
+        if strategy == "joined":
+            # joined collections repeat the parent row once per child
+            result = result.unique()
+        return result.scalars().all()
+
+    def get_users_with_orders(self, strategy: str = "selectin", limit: int | None = None,
+                              profile: str = DEFAULT_PROFILE) -> list[User]:
+        stmt = select(User).order_by(User.created_at.desc())
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        return self._scalars_with_graph(stmt, strategy, profile)
+
+    def get_user_with_orders(self, telegram_id: int, strategy: str = "selectin",
+                             profile: str = DEFAULT_PROFILE) -> User | None:
+        stmt = select(User).where(User.telegram_id == telegram_id)
+        users = self._scalars_with_graph(stmt, strategy, profile)
+        return users[0] if users else None
+
     # Count the number of unique orders
-    def get_total_number_of_orders(self, telegram_id: int):
-        stmt = (
-            select(func.count(
-                Order.order_id
-            )).where(
-                Order.user_id == telegram_id
-            )
-        )
+    # since / until: optional [since, until) window on created_at, only the
+    # matching monthly partitions are scanned (see database/partitions.py)
+    def get_total_number_of_orders(self, telegram_id: int, since: datetime | None = None, until: datetime | None = None):
+        # select(func.count(Order.order_id)).where(Order.user_id == telegram_id, <window>),
+        # pre-built once per window shape
+        stmt, params = total_orders_params(telegram_id, since, until)
         # shorthand without execute
-        result = self.session.scalar(stmt)
+        result = self.session.scalar(stmt, params)
         return result
         
         
     # Count the number of orders for all users
-    def get_total_number_of_orders_all_users(self):
-        stmt = (
+    @staticmethod
+    def _total_number_of_orders_all_users_stmt(since: datetime | None = None, until: datetime | None = None):
+        return (
             select(func.count(
                 Order.order_id
             ).label('quantity'),
                 User.full_name
             ).join(
                 User
+            ).where(
+                *created_between(Order.created_at, since, until)
             ).group_by(User.telegram_id)
         )
+
+    def get_total_number_of_orders_all_users(self, since: datetime | None = None, until: datetime | None = None):
+        stmt = self._total_number_of_orders_all_users_stmt(since, until)
         # shorthand without execute
         result = self.session.execute(stmt)
         return result
+
+    # Streaming: a server-side cursor hands rows over partition_size at a time,
+    # so memory is bounded by the partition instead of the whole result
+    def _stream_partitions(self, stmt, partition_size: int) -> Iterator[Sequence[Row]]:
+        result = self.session.execute(
+            stmt.execution_options(stream_results=True, yield_per=partition_size)
+        )
+        try:
+            yield from result.partitions()
+        finally:
+            result.close()
+
+    def stream_all_user_orders(self, telegram_id: int, partition_size: int = 1000,
+                               columns: Sequence | None = None, row_type: type | None = None,
+                               profile: str = DEFAULT_PROFILE) -> Iterator[Sequence[Row]]:
+        # Same rows as get_all_user_orders: (Product, Order, User, OrderProduct), or the projection
+        stmt = self._all_user_orders_stmt(telegram_id)
+        if columns is None:
+            stmt = stmt.options(*profile_options(profile, Product, Order, User, OrderProduct))
+            return self._stream_partitions(stmt, partition_size)
+        partitions = self._stream_partitions(project(stmt, columns), partition_size)
+        return (as_row_type(partition, row_type) for partition in partitions)
+
+    def stream_total_number_of_orders_all_users(self, partition_size: int = 1000, since: datetime | None = None, until: datetime | None = None) -> Iterator[Sequence[Row]]:
+        # Same rows as get_total_number_of_orders_all_users: (quantity, full_name)
+        return self._stream_partitions(self._total_number_of_orders_all_users_stmt(since, until), partition_size)
     
     # Sum up the number or products
-    def get_total_number_of_products(self):
+    def get_total_number_of_products(self, since: datetime | None = None, until: datetime | None = None):
         stmt = (
             select(func.sum(
                 OrderProduct.quantity
@@ -231,9 +541,14 @@ from sqlalchemy import func
                 User.full_name
             ).join(
                 Order,
-                Order.order_id == OrderProduct.order_id
+                # both halves of the key, so matching partitions are joined pairwise
+                and_(Order.order_id == OrderProduct.order_id, Order.created_at == OrderProduct.order_created_at)
             ).join(
                 User
+            ).where(
+                # filter both tables, each prunes its own partitions
+                *created_between(Order.created_at, since, until),
+                *created_between(OrderProduct.order_created_at, since, until)
             ).group_by(
                 User.telegram_id
             ).having(func.sum(OrderProduct.quantity) > 50000)
@@ -243,6 +558,81 @@ from sqlalchemy import func
         return result
     
     
+    # Summary table: user_product_totals, kept current by add_order_products
+    # Same rows as get_total_number_of_products, read from the summary table:
+    # cost grows with the users over the threshold, not with the order history
+    def get_total_number_of_products_from_summary(self, threshold: int = 50000):
+        stmt = (
+            select(
+                UserProductTotal.total_quantity.label('quantity'),
+                User.full_name
+            ).join(
+                User, User.telegram_id == UserProductTotal.user_id
+            ).where(
+                UserProductTotal.total_quantity > threshold
+            )
+        )
+        result = self.session.execute(stmt)
+        return result
+
+    def rebuild_user_product_totals(self):
+        # Full recompute, e.g. after seeding or COPY loads that bypass add_order_product
+        for stmt in rebuild_user_product_totals_stmts():
+            self.session.execute(stmt)
+        self._commit()
+
+    def check_user_product_totals(self) -> list[tuple[int, int | None, int | None]]:
+        """
+        Summary: Consistency check, compares user_product_totals against a full recompute.
+
+        Returns:
+            list[tuple[int, int | None, int | None]]: (user_id, summary total, recomputed total)
+            for every user that differs, empty when the summary is correct
+        """
+        return [tuple(row) for row in self.session.execute(user_product_totals_mismatch_stmt())]
+
+    # Inner Joins:
+    # get all users who were invited by a referrer (reffered_id)
+    def select_all_invited_users(self):
+        # Create Alliased Table
+        ParentUser = aliased(User)
+        ReferralUser = aliased(User)
+        
+        # Inner Join = Select User who have a reffered_id
+        # Full Outer Join Definiton: Returns all users from both tables, wheter or not there is a match on referred_id.
+        # To Change stmt to Outer Join use "outerjoin" instead
+        stmt = (
+            select(ParentUser.full_name.label("parent_name"),
+                   ReferralUser.full_name.label("referral_name")
+            ).join(
+                ReferralUser, ReferralUser.referred_id == ParentUser.telegram_id 
+            )
+        )
+        result = self.session.execute(stmt)
+        return result.all()
+    
+    def select_all_invited_users2(self):
+        # Create Alliased Table
+        ParentUser = aliased(User)
+        ReferralUser = aliased(User)
+        
+        # Inner Join = Select User who have a reffered_id
+        # Full Outer Join Definiton: Returns all users from both tables, wheter or not there is a match on referred_id.
+        # To Change stmt to Outer Join use "outerjoin" instead
+        stmt = (
+            select(ParentUser.full_name.label("parent_name"),
+                   ReferralUser.full_name.label("referral_name")
+            ).outerjoin(
+                ReferralUser, ReferralUser.referred_id == ParentUser.telegram_id 
+            ).where(
+                ReferralUser.telegram_id.isnot(None),
+                ParentUser.referred_id.isnot(None)
+            )
+        )
+        result = self.session.execute(stmt)
+        return result.all()
+
+
 # Seed the data:
 def seed_fake_data(repo: Repo):
     Faker.seed(0)
@@ -289,48 +679,125 @@ def seed_fake_data(repo: Repo):
                 quantity=fake.pyint()
             )
 
-    # Inner Joins:
-    # get all users who were invited by a referrer (reffered_id)
-    def select_all_invited_users(self):
-        # Create Alliased Table
-        ParentUser = aliased(User)
-        ReferralUser = aliased(User)
-        
-        # Inner Join = Select User who have a reffered_id
-        # Full Outer Join Definiton: Returns all users from both tables, wheter or not there is a match on referred_id.
-        # To Change stmt to Outer Join use "outerjoin" instead
-        stmt = (
-            select(ParentUser.full_name.label("parent_name"),
-                   ReferralUser.full_name.label("referral_name")
-            ).join(
-                ReferralUser, ReferralUser.referred_id == ParentUser.telegram_id 
-            )
-        )
-        result = self.session.execute(stmt)
-        return result.all()
-    
-    def select_all_invited_users2(self):
-        # Create Alliased Table
-        ParentUser = aliased(User)
-        ReferralUser = aliased(User)
-        
-        # Inner Join = Select User who have a reffered_id
-        # Full Outer Join Definiton: Returns all users from both tables, wheter or not there is a match on referred_id.
-        # To Change stmt to Outer Join use "outerjoin" instead
-        stmt = (
-            select(ParentUser.full_name.label("parent_name"),
-                   ReferralUser.full_name.label("referral_name")
-            ).outerjoin(
-                ReferralUser, ReferralUser.referred_id == ParentUser.telegram_id 
-            ).where(
-                ReferralUser.telegram_id.isnot(None),
-                ParentUser.referred_id.isnot(None)
-            )
-        )
-        result = self.session.execute(stmt)
-        return result.all()
-    
-def reset_database():
+
+# Batched seeding:
+def _insert_in_chunks(session: Session, table_name: str, make_stmt, rows: list[dict], chunk_size: int):
+    """
+    Summary: Write rows with one multi-row INSERT ... RETURNING per chunk,
+    and one commit per chunk instead of one per row.
+
+    Args:
+        session (Session): open session
+        table_name (str): label used in the rows/second report
+        make_stmt (callable): builds the insert statement for a list of row dicts
+        rows (list[dict]): rows to insert
+        chunk_size (int): number of rows per INSERT statement
+
+    Returns:
+        tuple[list, float]: the RETURNING values, and rows/second
+    """
+    returned = []
+    start = time.perf_counter()
+    for i in range(0, len(rows), chunk_size):
+        chunk = rows[i:i + chunk_size]
+        result = session.execute(make_stmt(chunk))
+        returned.extend(result.scalars().all())
+        session.commit()
+    elapsed = time.perf_counter() - start
+    rows_per_second = len(rows) / elapsed if elapsed else float("inf")
+    print(f"Seeded {len(rows)} {table_name} in {elapsed:.3f}s ({rows_per_second:,.0f} rows/s)")
+    return returned, rows_per_second
+
+
+def seed_fake_data_batched(repo: Repo, chunk_size: int = 1000) -> dict[str, float]:
+    """
+    Summary: Same data as seed_fake_data, but the rows are built in memory
+    first and written in chunks. The Faker calls happen in exactly the same
+    order as seed_fake_data, so Faker.seed(0) gives the same output.
+
+    Args:
+        repo (Repo): repo whose session is used for the inserts
+        chunk_size (int): rows per multi-row INSERT (and per commit)
+
+    Returns:
+        dict[str, float]: rows/second for each table
+    """
+    Faker.seed(0)
+    fake = Faker()
+    # set here instead of by the server, order lines need their order's created_at (the partition key)
+    seeded_at = datetime.now()
+    users = []
+    orders = []
+    products = []
+
+    # Build all rows first, following the seed_fake_data loop
+    for _ in range(10):
+        referred_id = None if not users else users[-1]["telegram_id"]
+        users.append(dict(
+            telegram_id=fake.unique.random_int(min=1000, max=9999),
+            full_name=fake.name(),
+            user_name=fake.user_name(),
+            language_code=random.choice(["en", "uk", "fr"]),
+            referred_id=referred_id
+        ))
+        for _ in range(10):
+            orders.append(dict(user_id=random.choice(users)["telegram_id"], created_at=seeded_at))
+        for _ in range(10):
+            products.append(dict(
+                title=fake.word(),
+                description=fake.sentence(),
+                price=fake.pyint(),
+            ))
+
+    session = repo.session
+    stats = {}
+
+    # Users must exist before their orders and referrals (order is preserved per chunk)
+    def users_stmt(chunk):
+        stmt = insert(User).values(chunk)
+        return stmt.on_conflict_do_update(
+            index_elements=[User.telegram_id],
+            set_={
+                "full_name": stmt.excluded.full_name,
+                "user_name": stmt.excluded.user_name
+            }
+        ).returning(User.telegram_id)
+
+    _, stats[User.__tablename__] = _insert_in_chunks(
+        session, User.__tablename__, users_stmt, users, chunk_size)
+    order_ids, stats[Order.__tablename__] = _insert_in_chunks(
+        session, Order.__tablename__,
+        lambda chunk: insert(Order).values(chunk).returning(Order.order_id),
+        orders, chunk_size)
+    product_ids, stats[Product.__tablename__] = _insert_in_chunks(
+        session, Product.__tablename__,
+        lambda chunk: insert(Product).values(chunk).returning(Product.product_id),
+        products, chunk_size)
+
+    # seed_fake_data attaches the last product to every order line, and
+    # add_order_product adds up the quantity when the same (order, product) pair comes up again
+    order_products = merge_order_lines(
+        (order_id, product_ids[-1], fake.pyint())
+        for order_id in order_ids
+        for _ in range(3)
+    )
+
+    _, stats[OrderProduct.__tablename__] = _insert_in_chunks(
+        session, OrderProduct.__tablename__,
+        lambda chunk: insert(OrderProduct).values(chunk).on_conflict_do_nothing(
+            index_elements=[OrderProduct.order_id, OrderProduct.product_id, OrderProduct.order_created_at]
+        ).returning(OrderProduct.order_id),
+        [
+            dict(order_id=order_id, product_id=product_id, order_created_at=seeded_at, quantity=quantity)
+            for order_id, product_id, quantity in order_products
+        ],
+        chunk_size)
+    # the multi-row inserts bypass add_order_product
+    repo.rebuild_user_product_totals()
+    return stats
+
+
+def reset_database(batched: bool = False, chunk_size: int = 1000):
     db = DbConfig()
 
     # Drop all tables
@@ -348,7 +815,10 @@ def reset_database():
 
     # Reseed database
     print("Seeding fake data...")
-    seed_fake_data(repo)
+    if batched:
+        seed_fake_data_batched(repo, chunk_size=chunk_size)
+    else:
+        seed_fake_data(repo)
 
     print("Database reset and reseeded successfully!")
     
@@ -357,6 +827,8 @@ def reset_database():
 def main():
     # Create Session
     Session = get_session()
+    # Or send reads to the DB_REPLICA_URLS replicas, writes (and reads after them) to the primary
+    # Session = get_routing_session()
     session = Session()
     repo = Repo(session)
            
@@ -364,6 +836,18 @@ def main():
     # CALL METHODS HERE:
     #####################
     
+    # Per-statement latency metrics in Prometheus format
+    # start_metrics_server(9100)   # curl http://127.0.0.1:9100/metrics
+    # dump_metrics("db_metrics.prom")
+    # Pool usage: checked out / idle / overflow, checkout waits, connection churn
+    # print(pool_stats(session.get_bind()))
+
+    # One transaction for an order and its lines
+    # with repo.transaction():
+    #     order = repo.add_order(user_id=1)
+    #     repo.add_order_product(order_id=order.order_id, product_id=1, quantity=2)
+    #     repo.add_order_product(order_id=order.order_id, product_id=2, quantity=1)
+
     # insert user
     # repo.add_user(
     #     telegram_id=1,
@@ -381,11 +865,18 @@ def main():
     # for user in users:
     #     print(f"User: {user.telegram_id}: {user.full_name}")
         
+    # Page through users without OFFSET
+    # users, cursor = repo.get_users_page(page_size=10)
+    # while cursor:
+    #     users, cursor = repo.get_users_page(cursor=cursor, page_size=10)
+
     # language = repo.get_user_language(1)
     # print(f"User language: {language}")
     
     # One time data load
     # seed_fake_data(repo)
+    # Faster: multi-row inserts, one commit per chunk
+    # seed_fake_data_batched(repo, chunk_size=1000)
     
     # Return all users with a referred_id, using inner join
     # Inner Join: Only takes the columns that each table has in common.
@@ -410,7 +901,21 @@ def main():
     #         for product in order.products:
     #             product = product.product
     #             print(f"    Product: {product.title}, Price: {product.price}")  
+
+    # Catch it at runtime: warns (or raises) naming User.orders once it lazy loads 5+ times
+    # with detect_repeated_statements(session, threshold=5, action="raise"):
+    #     for user in repo.get_all_users():
+    #         for order in user.orders:
+    #             print(order.order_id)
     
+    # Efficient: same loop, but the whole graph is loaded in a fixed number of queries
+    # (the counts per strategy are pinned in tests/test_eager_loading.py)
+    # with assert_num_statements(session, 4):
+    #     for user in repo.get_users_with_orders(strategy="selectin"):
+    #         for order in user.orders:
+    #             for product in order.products:
+    #                 print(f"{user.full_name}: {order.order_id} {product.product.title}")
+
     # Efficient Approach: Use a join to get the orders and products
     """
     Note: Order can reference elements in users,
@@ -420,16 +925,36 @@ def main():
     # for row in user_orders:
     #     print(f"#{row.Product.product_id}, Product: {row.Product.title} (x {row.OrderProduct.quantity}), Order ID: {row.Order.order_id}, User: {row.User.full_name}")
     
+    # Listing without descriptions: "summary" defers Product.description for this query (see load_profiles.py)
+    # user_orders = repo.get_all_user_orders(telegram_id=1418, profile="summary")
+
+    # Only the columns we print: plain rows, no entities in the session (see projections.py)
+    # for line in repo.get_all_user_orders(telegram_id=1418, columns=ORDER_LINE_COLUMNS, row_type=OrderLine):
+    #     print(f"#{line.product_id}, Product: {line.title} (x {line.quantity}), Order ID: {line.order_id}")
+
+    # Power users: stream the same join 1000 rows at a time
+    # for partition in repo.stream_all_user_orders(telegram_id=1418, partition_size=1000):
+    #     for row in partition:
+    #         print(f"#{row.Product.product_id}, Product: {row.Product.title} (x {row.OrderProduct.quantity})")
+
     # Aggregated Queries: COUNT, SUM, AVG, MIN, MAX
     # Get total number of orders:
     # num_of_orders = repo.get_total_number_of_orders(telegram_id=1418)
     # print(f"Total number of orders: {num_of_orders}")
+    # Only this month: scans one partition of orders (see database/partitions.py)
+    # num_of_orders = repo.get_total_number_of_orders(telegram_id=1418, since=datetime(2026, 10, 1))
     
     # Print all user and their number or orders:
     # num_of_orders = repo.get_total_number_of_orders_all_users()
     # for quantity, full_name in num_of_orders:
     #     print(f"Total number of orders: {quantity} by {full_name}")
     
+    # Same totals from the incrementally maintained summary table
+    # for quantity, full_name in repo.get_total_number_of_products_from_summary(threshold=50000):
+    #     print(f"Sum of all products by user: {quantity} by {full_name}")
+    # Summary vs full recompute, empty when consistent
+    # print(repo.check_user_product_totals())
+
     # Print the sum of all orders:
     sum_of_orders = repo.get_total_number_of_products()
     for quantity, full_name in sum_of_orders:
@@ -438,7 +963,7 @@ def main():
     
 # ----- Run everything -----
 if __name__ == "__main__":
-    start_postgres()
-    wait_for_postgres()
+    # waits for Postgres (starting docker-compose if needed), warms the pool and the hot statements
+    startup(DbConfig(), Repo)
     print("Postgres ready, starting DB operations...")
     main()
\ No newline at end of file
@@ -0,0 +1,247 @@
+"""
+EXPLAIN plan regression check for the Repo query methods in lesson3_sync.py.
+
+Every read method on Repo is called with representative arguments; the SQL it
+sends is captured and re-run as EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON).
+`record` stores the plans as a baseline, `check` fails (exit code 1) when a
+plan changes shape (e.g. Index Scan -> Seq Scan) or its estimated cost or
+buffer reads grow past the thresholds.
+
+    python -m scripts.explain_plans seed --users 10000
+    python -m scripts.explain_plans record
+    python -m scripts.explain_plans check --cost-threshold 1.25 --buffer-threshold 1.5
+"""
+import argparse
+import inspect
+import json
+import random
+import sys
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from lesson2_structured.bulk_copy import copy_rows
+from lesson2_structured.database.partitions import ensure_partitions
+from lesson2_structured.database.models.order_products import OrderProduct
+from lesson2_structured.database.models.orders import Order
+from lesson2_structured.database.models.products import Product
+from lesson2_structured.database.models.users import User
+from lesson2_structured.setup import DbConfig, create_tables, drop_tables, get_session
+from lesson3_sync import Repo
+from scripts.time_repo_indexes import pick_arguments
+
+DEFAULT_BASELINE = "explain_baselines.json"
+
+# Repo method -> arguments built from pick_arguments()
+# Write methods (add_*, upsert_*, rebuild_*) and the stream_* variants of methods listed here are not walked
+METHOD_ARGUMENTS = {
+    "get_user_by_id": lambda a: (a["telegram_id"],),
+    "get_all_users": lambda a: (),
+    "get_users_page": lambda a: (),
+    "get_user_language": lambda a: (a["telegram_id"],),
+    "get_all_user_orders": lambda a: (a["telegram_id"],),
+    "get_total_number_of_orders": lambda a: (a["telegram_id"],),
+    "get_total_number_of_orders_all_users": lambda a: (),
+    "get_total_number_of_products": lambda a: (),
+    "get_total_number_of_products_from_summary": lambda a: (),
+    "check_user_product_totals": lambda a: (),
+    "get_users_with_orders": lambda a: ("selectin", 10),
+    "get_user_with_orders": lambda a: (a["telegram_id"],),
+    "select_all_invited_users": lambda a: (),
+    "select_all_invited_users2": lambda a: (),
+}
+SKIPPED_PREFIXES = ("add_", "upsert_", "stream_", "rebuild_", "_")
+HISTORY_DAYS = 365
+
+
+# ----- Seeding -----
+def seed(users: int, orders_per_user: int, lines_per_order: int, products: int, seed_value: int = 0):
+    """Reset the schema and load a deterministic dataset of the given scale with COPY"""
+    db = DbConfig()
+    drop_tables(db)
+    create_tables(db)
+    rng = random.Random(seed_value)
+    # fixed, so the same seed_value gives the same rows
+    now = datetime(2026, 1, 1)
+    Session = get_session()
+    with Session() as session:
+        telegram_ids = rng.sample(range(1000, 1000 + users * 10), users)
+        copy_rows(session, User, (
+            {
+                "telegram_id": telegram_id,
+                "full_name": f"User {telegram_id}",
+                "user_name": f"user{telegram_id}",
+                "language_code": rng.choice(["en", "uk", "fr", "de"]),
+                # referrals point at an earlier user, so the FK is always satisfied
+                "referred_id": telegram_ids[rng.randrange(i)] if i and rng.random() < 0.3 else None,
+            }
+            for i, telegram_id in enumerate(telegram_ids)
+        ))
+        product_ids = copy_rows(session, Product, (
+            {"title": f"product {i}", "description": "x" * rng.randint(10, 300), "price": rng.randint(1, 500)}
+            for i in range(products)
+        ), return_keys=True)
+        # a year of orders, spread over the monthly partitions
+        created_at = [now - timedelta(seconds=rng.randrange(HISTORY_DAYS * 86400)) for _ in range(users * orders_per_user)]
+        ensure_partitions(session.connection(), start=now - timedelta(days=HISTORY_DAYS))
+        order_ids = copy_rows(session, Order, (
+            {"user_id": rng.choice(telegram_ids), "created_at": order_created_at} for order_created_at in created_at
+        ), return_keys=True)
+        copy_rows(session, OrderProduct, (
+            {"order_id": order_id, "product_id": product_id, "order_created_at": order_created_at, "quantity": rng.randint(1, 5000)}
+            for order_id, order_created_at in zip(order_ids, created_at)
+            for product_id in rng.sample(product_ids, min(lines_per_order, len(product_ids)))
+        ))
+        session.commit()
+        Repo(session).rebuild_user_product_totals()
+    # fresh planner statistics, otherwise the first plans are based on empty tables
+    with Session() as session:
+        session.connection().exec_driver_sql("ANALYZE")
+        session.commit()
+
+
+# ----- Plan capture -----
+def repo_query_methods() -> list[str]:
+    methods = [
+        name for name, _ in inspect.getmembers(Repo, inspect.isfunction)
+        if not name.startswith(SKIPPED_PREFIXES)
+    ]
+    missing = [name for name in methods if name not in METHOD_ARGUMENTS]
+    for name in missing:
+        print(f"warning: no representative arguments for Repo.{name}, add it to METHOD_ARGUMENTS", file=sys.stderr)
+    return [name for name in methods if name in METHOD_ARGUMENTS]
+
+
+def capture_statements(session, call) -> list[tuple[str, dict]]:
+    """Run call() and return the SELECT statements it executed"""
+    captured = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            captured.append((statement, parameters))
+
+    engine = session.get_bind()
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        result = call()
+        # aggregates return an unfetched Result
+        if hasattr(result, "all"):
+            result.all()
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    return captured
+
+
+def explain(session, statement: str, parameters) -> dict:
+    cursor = session.connection().connection.dbapi_connection.cursor()
+    try:
+        cursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + statement, parameters)
+        return cursor.fetchone()[0][0]
+    finally:
+        cursor.close()
+
+
+def plan_shape(node: dict) -> str:
+    """Node types, relations and indexes, e.g. Limit(Index Scan[users/ix_users_language_code_created_at])"""
+    label = node["Node Type"]
+    target = "/".join(filter(None, [node.get("Relation Name"), node.get("Index Name")]))
+    if target:
+        label += f"[{target}]"
+    children = node.get("Plans", [])
+    if children:
+        label += "(" + ", ".join(plan_shape(child) for child in children) + ")"
+    return label
+
+
+def summarize(plan: dict) -> dict:
+    root = plan["Plan"]
+    return {
+        "shape": plan_shape(root),
+        "total_cost": root["Total Cost"],
+        # buffer counts on the root node include all children
+        "buffers": root.get("Shared Hit Blocks", 0) + root.get("Shared Read Blocks", 0),
+        "execution_ms": plan.get("Execution Time"),
+    }
+
+
+def capture_plans() -> dict:
+    Session = get_session()
+    plans = {}
+    with Session() as session:
+        repo = Repo(session)
+        args = pick_arguments(session)
+        for name in repo_query_methods():
+            method = getattr(repo, name)
+            statements = capture_statements(session, lambda: method(*METHOD_ARGUMENTS[name](args)))
+            for i, (statement, parameters) in enumerate(statements):
+                key = name if len(statements) == 1 else f"{name}#{i + 1}"
+                plans[key] = summarize(explain(session, statement, parameters))
+                plans[key]["statement"] = statement
+            session.expunge_all()
+        session.rollback()
+    return plans
+
+
+# ----- Baselines -----
+def record(path: str):
+    plans = capture_plans()
+    with open(path, "w") as f:
+        json.dump(plans, f, indent=2)
+    print(f"Recorded {len(plans)} plans to {path}")
+
+
+def check(path: str, cost_threshold: float, buffer_threshold: float) -> int:
+    with open(path) as f:
+        baseline = json.load(f)
+    current = capture_plans()
+    failures = []
+    for key, old in baseline.items():
+        new = current.get(key)
+        if new is None:
+            failures.append(f"{key}: no longer executed")
+            continue
+        if new["shape"] != old["shape"]:
+            failures.append(f"{key}: plan shape changed\n    was: {old['shape']}\n    now: {new['shape']}")
+        if old["total_cost"] and new["total_cost"] > old["total_cost"] * cost_threshold:
+            failures.append(f"{key}: estimated cost {old['total_cost']} -> {new['total_cost']}")
+        # allow a few blocks of noise on tiny plans
+        if new["buffers"] > max(old["buffers"] * buffer_threshold, old["buffers"] + 8):
+            failures.append(f"{key}: buffers {old['buffers']} -> {new['buffers']}")
+    for key in current.keys() - baseline.keys():
+        print(f"new plan without a baseline: {key} (run record)")
+
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    print(f"{len(baseline) - len(set(f.split(':')[0] for f in failures))}/{len(baseline)} plans ok")
+    return 1 if failures else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = commands.add_parser("seed", help="reset the database and seed it at a given scale")
+    seed_parser.add_argument("--users", type=int, default=10000)
+    seed_parser.add_argument("--orders-per-user", type=int, default=10)
+    seed_parser.add_argument("--lines-per-order", type=int, default=3)
+    seed_parser.add_argument("--products", type=int, default=1000)
+    seed_parser.add_argument("--seed", type=int, default=0)
+
+    for name in ("record", "check"):
+        command = commands.add_parser(name)
+        command.add_argument("--baseline", default=DEFAULT_BASELINE)
+        if name == "check":
+            command.add_argument("--cost-threshold", type=float, default=1.25)
+            command.add_argument("--buffer-threshold", type=float, default=1.5)
+
+    options = parser.parse_args()
+    if options.command == "seed":
+        seed(options.users, options.orders_per_user, options.lines_per_order, options.products, options.seed)
+    elif options.command == "record":
+        record(options.baseline)
+    else:
+        sys.exit(check(options.baseline, options.cost_threshold, options.buffer_threshold))
+
+
+if __name__ == "__main__":
+    main()
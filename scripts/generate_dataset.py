@@ -0,0 +1,388 @@
+"""
+Synthetic benchmark-scale dataset: users, products, orders and order lines.
+
+Columns are generated with NumPy, one chunk of users (with their orders and
+lines) per task, fanned out over a process pool. Every chunk has its own seed
+derived from --seed, so the output is identical whatever the number of workers.
+
+Shape of the data:
+  - product popularity is Zipf-skewed (a few products are in most lines)
+  - orders per user follow a power law (most users order a little, some a lot)
+  - about a third of users were referred by an earlier user, which builds
+    referral chains, with early users referring the most
+
+users and products are written as CSV. orders and orderproducts, the big
+tables, are CSV or PostgreSQL binary COPY files (--format binary).
+
+    python -m scripts.generate_dataset generate --scale 10m --out data/10m --workers 8
+    python -m scripts.generate_dataset load data/10m
+
+`load` drops and recreates the tables, then COPYs the files in.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# Presets, sized by order lines: users * mean orders per user * mean lines per order
+SCALES = {
+    "1m": dict(users=60_000, products=10_000),
+    "10m": dict(users=600_000, products=100_000),
+    "100m": dict(users=6_000_000, products=1_000_000),
+}
+
+TELEGRAM_ID_BASE = 1_000_000_000
+LANGUAGES = np.array(["en", "uk", "fr", "de", "es"])
+LANGUAGE_WEIGHTS = np.array([0.5, 0.2, 0.1, 0.1, 0.1])
+WORDS = np.array(["fast", "red", "small", "wooden", "steel", "smart", "eco", "classic", "mini", "pro"])
+
+# PostgreSQL binary COPY: signature, flags, header extension length ... trailer
+PGCOPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + np.array([0, 0], dtype=">i4").tobytes()
+PGCOPY_TRAILER = np.array([-1], dtype=">i2").tobytes()
+PG_EPOCH = np.datetime64("2000-01-01T00:00:00", "us")
+
+
+@dataclass(frozen=True)
+class DatasetConfig:
+    users: int
+    products: int
+    seed: int = 0
+    end: str = "2026-01-01"                # all timestamps fall before this
+    history_days: int = 365
+    referral_rate: float = 0.3
+    product_zipf: float = 1.1              # popularity of the k-th product ~ 1 / k^s
+    orders_pareto: float = 1.6             # tail of the orders-per-user distribution, lower = heavier
+    orders_scale: float = 4.0
+    max_orders_per_user: int = 1000
+    mean_lines_per_order: float = 3.0
+    chunk_users: int = 20_000
+
+
+# ----- Seeds -----
+# One independent stream per (table, chunk): chunk 7 gets the same numbers
+# whether it runs first, last, alone or next to 31 other workers
+_USERS, _PRODUCTS, _ORDER_COUNTS, _ORDERS, _LINES, _PRODUCT_RANKS = range(6)
+
+
+def _rng(config: DatasetConfig, stream: int, chunk: int = 0) -> np.random.Generator:
+    return np.random.default_rng(np.random.SeedSequence(config.seed, spawn_key=(stream, chunk)))
+
+
+def _timestamps(config: DatasetConfig):
+    end = np.datetime64(config.end, "us")
+    start = end - np.timedelta64(config.history_days * 86400 * 10 ** 6, "us")
+    return start, end
+
+
+# ----- Columns -----
+def order_counts(config: DatasetConfig, chunk: int, size: int) -> np.ndarray:
+    """Orders per user for one chunk: 1 + a Lomax (Pareto II) draw, capped"""
+    rng = _rng(config, _ORDER_COUNTS, chunk)
+    counts = 1 + np.floor(rng.pareto(config.orders_pareto, size) * config.orders_scale)
+    return np.minimum(counts, config.max_orders_per_user).astype(np.int64)
+
+
+def user_columns(config: DatasetConfig, chunk: int, first: int, size: int) -> dict:
+    rng = _rng(config, _USERS, chunk)
+    index = np.arange(first, first + size, dtype=np.int64)
+    telegram_id = TELEGRAM_ID_BASE + index
+    start, end = _timestamps(config)
+    span = (end - start).astype(np.int64)
+    # sign-up time grows with the index, so a referrer always signed up first
+    created_at = start + ((index + rng.random(size)) / config.users * span).astype("timedelta64[us]")
+    # referrer = an earlier user, skewed towards the first ones (u^3)
+    referred = (rng.random(size) < config.referral_rate) & (index > 0)
+    referrer = np.floor(index * rng.random(size) ** 3).astype(np.int64)
+    return {
+        "telegram_id": telegram_id,
+        "full_name": np.char.add("User ", telegram_id.astype(str)),
+        "user_name": np.char.add("user", telegram_id.astype(str)),
+        "language_code": rng.choice(LANGUAGES, size, p=LANGUAGE_WEIGHTS),
+        "referred_id": np.where(referred, TELEGRAM_ID_BASE + referrer, -1),
+        "created_at": created_at,
+        "updated_at": created_at,
+    }
+
+
+def product_columns(config: DatasetConfig) -> dict:
+    rng = _rng(config, _PRODUCTS)
+    product_id = np.arange(1, config.products + 1, dtype=np.int64)
+    start, _ = _timestamps(config)
+    words = rng.choice(WORDS, (config.products, 2))
+    return {
+        "product_id": product_id,
+        "title": np.char.add(np.char.add(np.char.add(words[:, 0], " "), words[:, 1]), np.char.add(" ", product_id.astype(str))),
+        "description": np.char.multiply("lorem ipsum ", rng.integers(1, 25, config.products)),
+        "price": np.round(rng.lognormal(3.0, 1.0, config.products), 2),
+        "created_at": np.full(config.products, start),
+        "updated_at": np.full(config.products, start),
+    }
+
+
+def _product_sampler(config: DatasetConfig):
+    """Zipf over a finite catalog: inverse CDF over 1/k^s, ranks shuffled onto product ids"""
+    weights = 1.0 / np.arange(1, config.products + 1) ** config.product_zipf
+    cdf = np.cumsum(weights)
+    cdf /= cdf[-1]
+    # the same shuffle in every worker, so product 1 isn't always the bestseller
+    ranked_ids = _rng(config, _PRODUCT_RANKS).permutation(config.products) + 1
+
+    def sample(rng: np.random.Generator, size: int) -> np.ndarray:
+        ranks = np.minimum(np.searchsorted(cdf, rng.random(size), side="right"), config.products - 1)
+        return ranked_ids[ranks]
+    return sample
+
+
+def order_columns(config: DatasetConfig, chunk: int, users: dict, counts: np.ndarray, first_order_id: int, sample_products) -> tuple[dict, dict]:
+    rng = _rng(config, _ORDERS, chunk)
+    total = int(counts.sum())
+    order_id = np.arange(first_order_id, first_order_id + total, dtype=np.int64)
+    user_id = np.repeat(users["telegram_id"], counts)
+    # ordered some time between signing up and the end of the history
+    _, end = _timestamps(config)
+    signed_up = np.repeat(users["created_at"], counts)
+    created_at = signed_up + ((end - signed_up).astype(np.int64) * rng.random(total)).astype("timedelta64[us]")
+    orders = {"order_id": order_id, "user_id": user_id, "created_at": created_at, "updated_at": created_at}
+
+    rng = _rng(config, _LINES, chunk)
+    lines_per_order = 1 + rng.poisson(config.mean_lines_per_order - 1, total)
+    line_order = np.repeat(np.arange(total), lines_per_order)
+    product_id = sample_products(rng, len(line_order))
+    # (order_id, product_id) is the primary key: keep the first of any repeats
+    _, first = np.unique(line_order * (config.products + 1) + product_id, return_index=True)
+    first.sort()
+    line_order = line_order[first]
+    lines = {
+        "order_id": order_id[line_order],
+        "product_id": product_id[first],
+        "order_created_at": created_at[line_order],
+        "quantity": 1 + rng.geometric(0.3, len(first)),
+    }
+    return orders, lines
+
+
+# ----- Writers -----
+def _text(column: np.ndarray) -> np.ndarray:
+    if column.dtype.kind == "M":
+        return np.datetime_as_string(column, unit="us")
+    return column.astype(str)
+
+
+def write_csv(path: str, columns: dict, nulls: dict | None = None) -> int:
+    """One CSV line per row, no header. nulls: column -> mask of NULL values (written empty)"""
+    parts = []
+    for name, column in columns.items():
+        text = _text(column)
+        if nulls and name in nulls:
+            text = np.where(nulls[name], "", text)
+        parts.append(text)
+    lines = parts[0]
+    for part in parts[1:]:
+        lines = np.char.add(np.char.add(lines, ","), part)
+    with open(path, "w") as f:
+        f.write("\n".join(lines.tolist()))
+        f.write("\n")
+    return len(lines)
+
+
+# fixed width PostgreSQL types: numpy dtype -> (big endian dtype, byte length)
+_BINARY_TYPES = {"int4": (">i4", 4), "int8": (">i8", 8), "timestamp": (">i8", 8)}
+
+
+def write_binary(path: str, columns: dict, types: dict) -> int:
+    """
+    Binary COPY file for fixed width, NOT NULL columns. Every row is
+    int16 field count, then int32 length + value per field, all big endian,
+    which is a numpy structured array written in one go.
+    """
+    rows = len(next(iter(columns.values())))
+    fields = [("field_count", ">i2")]
+    for name in columns:
+        fields += [(f"{name}_length", ">i4"), (name, _BINARY_TYPES[types[name]][0])]
+    records = np.empty(rows, dtype=np.dtype(fields))
+    records["field_count"] = len(columns)
+    for name, column in columns.items():
+        records[f"{name}_length"] = _BINARY_TYPES[types[name]][1]
+        if types[name] == "timestamp":
+            column = (column - PG_EPOCH).astype(np.int64)   # microseconds since 2000-01-01
+        records[name] = column
+    with open(path, "wb") as f:
+        f.write(PGCOPY_HEADER)
+        f.write(records.tobytes())
+        f.write(PGCOPY_TRAILER)
+    return rows
+
+
+ORDER_TYPES = {"order_id": "int4", "user_id": "int8", "created_at": "timestamp", "updated_at": "timestamp"}
+LINE_TYPES = {"order_id": "int4", "product_id": "int4", "order_created_at": "timestamp", "quantity": "int4"}
+
+
+# ----- Workers -----
+def generate_products(config: DatasetConfig, out: str) -> dict:
+    return {"products": write_csv(os.path.join(out, "products_00000.csv"), product_columns(config))}
+
+
+def generate_chunk(config: DatasetConfig, chunk: int, first_user: int, size: int, first_order_id: int, out: str, file_format: str) -> dict:
+    """Users [first_user, first_user + size) with their orders and lines, one file per table"""
+    users = user_columns(config, chunk, first_user, size)
+    counts = order_counts(config, chunk, size)
+    orders, lines = order_columns(config, chunk, users, counts, first_order_id, _product_sampler(config))
+
+    written = {"users": write_csv(
+        os.path.join(out, f"users_{chunk:05d}.csv"), users, nulls={"referred_id": users["referred_id"] < 0}
+    )}
+    if file_format == "binary":
+        written["orders"] = write_binary(os.path.join(out, f"orders_{chunk:05d}.bin"), orders, ORDER_TYPES)
+        written["orderproducts"] = write_binary(os.path.join(out, f"orderproducts_{chunk:05d}.bin"), lines, LINE_TYPES)
+    else:
+        written["orders"] = write_csv(os.path.join(out, f"orders_{chunk:05d}.csv"), orders)
+        written["orderproducts"] = write_csv(os.path.join(out, f"orderproducts_{chunk:05d}.csv"), lines)
+    return written
+
+
+def generate(config: DatasetConfig, out: str, workers: int | None = None, file_format: str = "csv") -> dict:
+    """
+    Summary: Write the whole dataset to out/, one file per table per chunk.
+
+    Returns:
+        dict: rows per table, seconds and millions of rows per minute
+    """
+    os.makedirs(out, exist_ok=True)
+    chunks = [(chunk, first, min(config.chunk_users, config.users - first))
+              for chunk, first in enumerate(range(0, config.users, config.chunk_users))]
+    # order ids are consecutive across chunks: the counts are cheap and
+    # deterministic, so the parent computes every chunk's offset up front
+    first_order_ids = np.cumsum([1] + [int(order_counts(config, chunk, size).sum()) for chunk, _, size in chunks])
+
+    started = time.perf_counter()
+    rows = {"users": 0, "products": 0, "orders": 0, "orderproducts": 0}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(generate_products, config, out)]
+        futures += [
+            pool.submit(generate_chunk, config, chunk, first, size, int(first_order_ids[chunk]), out, file_format)
+            for chunk, first, size in chunks
+        ]
+        for future in futures:
+            for table, count in future.result().items():
+                rows[table] += count
+    elapsed = time.perf_counter() - started
+
+    total = sum(rows.values())
+    stats = {
+        "rows": rows,
+        "seconds": elapsed,
+        "million_rows_per_minute": total / elapsed * 60 / 1e6 if elapsed else float("inf"),
+    }
+    with open(os.path.join(out, "manifest.json"), "w") as f:
+        json.dump({"config": asdict(config), "format": file_format, **stats}, f, indent=2)
+    return stats
+
+
+# ----- Bulk load -----
+TABLE_COLUMNS = {
+    # dependency order: referrers and products before orders, orders before lines
+    "users": ["telegram_id", "full_name", "user_name", "language_code", "referred_id", "created_at", "updated_at"],
+    "products": ["product_id", "title", "description", "price", "created_at", "updated_at"],
+    "orders": list(ORDER_TYPES),
+    "orderproducts": list(LINE_TYPES),
+}
+
+
+def load(directory: str) -> dict:
+    """Recreate the tables and COPY every file in, returns rows per table and throughput"""
+    from lesson2_structured.database.partitions import ensure_partitions
+    from lesson2_structured.setup import DbConfig, create_engine_sync, create_tables, drop_tables, get_session
+    from lesson3_sync import Repo
+
+    with open(os.path.join(directory, "manifest.json")) as f:
+        manifest = json.load(f)
+    config = DatasetConfig(**manifest["config"])
+    db = DbConfig()
+    drop_tables(db)
+    create_tables(db)
+    start = datetime.fromisoformat(config.end) - timedelta(days=config.history_days)
+
+    engine = create_engine_sync(db)
+    started = time.perf_counter()
+    rows = {}
+    with engine.begin() as connection:
+        ensure_partitions(connection, start=start)
+    for table, columns in TABLE_COLUMNS.items():
+        files = sorted(name for name in os.listdir(directory) if name.startswith(f"{table}_"))
+        connection = engine.raw_connection()
+        try:
+            with connection.cursor() as cursor:
+                for name in files:
+                    file_format = "binary" if name.endswith(".bin") else "csv"
+                    with open(os.path.join(directory, name), "rb") as f:
+                        cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT {file_format})", f)
+                    rows[table] = rows.get(table, 0) + cursor.rowcount
+            connection.commit()
+        finally:
+            connection.close()
+        print(f"Loaded {rows.get(table, 0):,} {table}")
+    elapsed = time.perf_counter() - started
+
+    Session = get_session()
+    with Session() as session:
+        # ids were loaded explicitly, move the sequences past them
+        session.connection().exec_driver_sql(
+            "SELECT setval('orders_order_id_seq', (SELECT max(order_id) FROM orders)), "
+            "setval('products_product_id_seq', (SELECT max(product_id) FROM products))"
+        )
+        session.commit()
+        Repo(session).rebuild_user_product_totals()
+    with Session() as session:
+        session.connection().exec_driver_sql("ANALYZE")
+        session.commit()
+    total = sum(rows.values())
+    return {"rows": rows, "seconds": elapsed, "million_rows_per_minute": total / elapsed * 60 / 1e6 if elapsed else float("inf")}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate_parser = commands.add_parser("generate")
+    generate_parser.add_argument("--scale", choices=SCALES, default="1m")
+    generate_parser.add_argument("--users", type=int, help="overrides the scale preset")
+    generate_parser.add_argument("--products", type=int, help="overrides the scale preset")
+    generate_parser.add_argument("--seed", type=int, default=0)
+    generate_parser.add_argument("--chunk-users", type=int, default=DatasetConfig.chunk_users)
+    generate_parser.add_argument("--workers", type=int, default=None, help="defaults to the number of CPUs")
+    generate_parser.add_argument("--format", choices=("csv", "binary"), default="csv",
+                                 help="orders and orderproducts files, users and products are always CSV")
+    generate_parser.add_argument("--out", required=True)
+
+    load_parser = commands.add_parser("load")
+    load_parser.add_argument("directory")
+    load_parser.add_argument("--allow-remote", action="store_true")
+
+    options = parser.parse_args()
+    if options.command == "generate":
+        scale = {**SCALES[options.scale]}
+        if options.users:
+            scale["users"] = options.users
+        if options.products:
+            scale["products"] = options.products
+        config = DatasetConfig(**scale, seed=options.seed, chunk_users=options.chunk_users)
+        stats = generate(config, options.out, options.workers, options.format)
+    else:
+        from benchmarks.common import require_local_database
+        from lesson2_structured.setup import DbConfig
+        require_local_database(DbConfig(), options.allow_remote)
+        stats = load(options.directory)
+    for table, count in stats["rows"].items():
+        print(f"{table:<15} {count:>14,} rows")
+    print(f"{sum(stats['rows'].values()):,} rows in {stats['seconds']:.1f}s "
+          f"({stats['million_rows_per_minute']:.2f} M rows/min)")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
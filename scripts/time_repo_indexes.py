@@ -0,0 +1,135 @@
+"""
+Before/after timings for the Repo methods affected by the index migration
+(alembic/versions/e73800e82cd6_index_foreign_keys_and_filters.py).
+
+    alembic downgrade 74f0923893a4
+    python -m scripts.time_repo_indexes --out before.json
+    alembic upgrade head
+    python -m scripts.time_repo_indexes --out after.json
+    python -m scripts.time_repo_indexes --compare before.json after.json
+"""
+import argparse
+import json
+import statistics
+import time
+
+from sqlalchemy import delete, func, select
+
+from lesson2_structured.database.models.orders import Order
+from lesson2_structured.database.models.products import Product
+from lesson2_structured.database.models.users import User
+from lesson2_structured.setup import get_session
+from lesson3_sync import Repo
+
+
+def pick_arguments(session) -> dict:
+    """Representative ids from the seeded data: the busiest user and product"""
+    telegram_id = session.scalar(
+        select(Order.user_id).group_by(Order.user_id).order_by(func.count().desc()).limit(1)
+    )
+    product_id = session.scalar(select(func.max(Product.product_id)))
+    if telegram_id is None or product_id is None:
+        raise SystemExit("The database is empty, seed it first (lesson3_sync.reset_database)")
+    return {"telegram_id": telegram_id, "product_id": product_id}
+
+
+def timed_calls(repo: Repo, args: dict) -> dict:
+    """Name -> zero-argument call. Results are fully fetched so the query really runs"""
+    session = repo.session
+
+    def delete_product_cascade():
+        # ON DELETE CASCADE from products to orderproducts, rolled back afterwards
+        with session.begin_nested() as savepoint:
+            session.execute(delete(Product).where(Product.product_id == args["product_id"]))
+            savepoint.rollback()
+
+    def delete_user_set_null():
+        # ON DELETE SET NULL from users to users.referred_id / orders.user_id
+        with session.begin_nested() as savepoint:
+            try:
+                session.execute(delete(User).where(User.telegram_id == args["telegram_id"]))
+            finally:
+                savepoint.rollback()
+
+    return {
+        "get_all_users": lambda: repo.get_all_users(),
+        "get_users_page": lambda: repo.get_users_page(page_size=10),
+        "get_all_user_orders": lambda: repo.get_all_user_orders(args["telegram_id"]),
+        "get_total_number_of_orders": lambda: repo.get_total_number_of_orders(args["telegram_id"]),
+        "get_total_number_of_orders_all_users": lambda: repo.get_total_number_of_orders_all_users().all(),
+        "get_total_number_of_products": lambda: repo.get_total_number_of_products().all(),
+        "select_all_invited_users": lambda: repo.select_all_invited_users(),
+        "get_users_with_orders": lambda: repo.get_users_with_orders(limit=10),
+        "cascade: delete product": delete_product_cascade,
+        "cascade: delete user": delete_user_set_null,
+    }
+
+
+def run(repeat: int, warmup: int) -> dict:
+    Session = get_session()
+    results = {}
+    with Session() as session:
+        repo = Repo(session)
+        args = pick_arguments(session)
+        for name, call in timed_calls(repo, args).items():
+            timings = []
+            for i in range(warmup + repeat):
+                start = time.perf_counter()
+                try:
+                    call()
+                except Exception as e:
+                    # e.g. orders.user_id is NOT NULL, so SET NULL fails: still a full scan
+                    session.rollback()
+                    error = type(e).__name__
+                else:
+                    error = None
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                if i >= warmup:
+                    timings.append(elapsed_ms)
+                # don't let the identity map grow between runs
+                session.expunge_all()
+            results[name] = {
+                "median_ms": statistics.median(timings),
+                "mean_ms": statistics.fmean(timings),
+                "min_ms": min(timings),
+                "runs": repeat,
+                "error": error,
+            }
+            print(f"{name:<40} median {results[name]['median_ms']:9.3f} ms")
+        session.rollback()
+    return {"arguments": args, "results": results}
+
+
+def compare(before_path: str, after_path: str):
+    with open(before_path) as f:
+        before = json.load(f)["results"]
+    with open(after_path) as f:
+        after = json.load(f)["results"]
+    print(f"{'method':<40} {'before ms':>10} {'after ms':>10} {'speedup':>8}")
+    for name, old in before.items():
+        new = after.get(name)
+        if new is None:
+            continue
+        speedup = old["median_ms"] / new["median_ms"] if new["median_ms"] else float("inf")
+        print(f"{name:<40} {old['median_ms']:10.3f} {new['median_ms']:10.3f} {speedup:7.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", help="write timings to this JSON file")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"))
+    options = parser.parse_args()
+
+    if options.compare:
+        compare(*options.compare)
+        return
+    timings = run(options.repeat, options.warmup)
+    if options.out:
+        with open(options.out, "w") as f:
+            json.dump(timings, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
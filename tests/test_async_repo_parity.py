@@ -0,0 +1,60 @@
+import asyncio
+import inspect
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+from lesson2_structured.database.models.users import User
+from lesson2_structured.pagination import decode_cursor
+from lesson2_structured.startup import pool_capacity
+from lesson3_async import AsyncRepo
+from lesson3_sync import Repo
+
+
+def public_methods(cls) -> set[str]:
+    return {name for name, member in vars(cls).items() if not name.startswith("_") and callable(member)}
+
+
+def test_async_repo_has_every_repo_method():
+    assert public_methods(Repo) - public_methods(AsyncRepo) == set()
+
+
+def test_async_repo_methods_take_the_same_arguments():
+    for name in public_methods(Repo):
+        sync_params = list(inspect.signature(getattr(Repo, name)).parameters)
+        async_params = list(inspect.signature(getattr(AsyncRepo, name)).parameters)
+        assert async_params == sync_params, name
+
+
+def fake_session(users) -> MagicMock:
+    session = MagicMock()
+    result = MagicMock()
+    result.scalars.return_value.all.return_value = users
+    result.unique.return_value = result
+    session.execute = AsyncMock(return_value=result)
+    return session
+
+
+def test_async_get_users_page_returns_the_next_cursor():
+    users = [User(telegram_id=telegram_id, created_at=datetime(2026, 1, telegram_id)) for telegram_id in (3, 2)]
+    session = fake_session(users)
+
+    page, cursor = asyncio.run(AsyncRepo(session).get_users_page(page_size=2))
+
+    assert page == users
+    assert decode_cursor(cursor) == (datetime(2026, 1, 2), 2)
+    assert asyncio.run(AsyncRepo(fake_session(users[:1])).get_users_page(page_size=2))[1] is None
+
+
+def test_async_get_user_with_orders_dedupes_joined_rows():
+    user = User(telegram_id=1)
+    session = fake_session([user])
+
+    assert asyncio.run(AsyncRepo(session).get_user_with_orders(1, strategy="joined")) is user
+    session.execute.return_value.unique.assert_called_once()
+
+
+def test_pool_capacity_comes_from_the_config():
+    assert pool_capacity(SimpleNamespace(pool_size=5, max_overflow=10)) == 15
+    # max_overflow=-1 means unlimited overflow in SQLAlchemy, the pool size is what is guaranteed
+    assert pool_capacity(SimpleNamespace(pool_size=5, max_overflow=-1)) == 5
@@ -0,0 +1,66 @@
+from datetime import datetime
+from unittest.mock import MagicMock
+
+from lesson2_structured.bulk_copy import copy_rows
+from lesson2_structured.database.models.orders import Order
+from lesson2_structured.database.models.products import Product
+
+
+class FakeCursor:
+    """Records what copy_expert would have sent to Postgres"""
+    def __init__(self):
+        self.copies = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def copy_expert(self, sql, stream):
+        self.copies.append((sql, stream.read().decode()))
+
+
+def fake_session(reserved_keys=()):
+    session = MagicMock()
+    cursor = FakeCursor()
+    session.connection.return_value.connection.dbapi_connection.cursor.return_value = cursor
+    # _allocate_keys: SELECT nextval(...) on a second connection
+    conn = session.get_bind.return_value.connect.return_value.__enter__.return_value
+    conn.execute.return_value.scalars.return_value.all.return_value = list(reserved_keys)
+    return session, cursor
+
+
+def test_copy_dict_rows_returns_count():
+    session, cursor = fake_session()
+    rows = [{"title": "a", "description": "d", "price": 1}, {"title": "b", "description": None, "price": 2}]
+
+    assert copy_rows(session, Product, rows) == 2
+    sql, data = cursor.copies[0]
+    assert sql == 'COPY "products" ("title", "description", "price") FROM STDIN'
+    assert data == "a\td\t1\nb\t\\N\t2\n"
+
+
+def test_copy_dict_rows_with_generated_keys():
+    session, cursor = fake_session(reserved_keys=[10, 11])
+    rows = [{"title": "t", "description": "d", "price": 1}, {"title": "u", "description": "e", "price": 2}]
+
+    keys = copy_rows(session, Product, rows, return_keys=True)
+
+    assert keys == [10, 11]
+    sql, data = cursor.copies[0]
+    assert sql == 'COPY "products" ("product_id", "title", "description", "price") FROM STDIN'
+    # one field per column: the reserved key, then the dict values
+    assert data == "10\tt\td\t1\n11\tu\te\t2\n"
+
+
+def test_copy_orders_returns_generated_order_ids():
+    # orders' primary key is (order_id, created_at), only order_id comes back
+    session, cursor = fake_session(reserved_keys=[7, 8])
+    created_at = [datetime(2026, 1, 5), datetime(2026, 2, 5)]
+    rows = [{"user_id": 1, "created_at": day} for day in created_at]
+
+    assert copy_rows(session, Order, rows, return_keys=True) == [7, 8]
+    sql, data = cursor.copies[0]
+    assert sql == 'COPY "orders" ("order_id", "user_id", "created_at") FROM STDIN'
+    assert data == "7\t1\t2026-01-05T00:00:00\n8\t1\t2026-02-05T00:00:00\n"
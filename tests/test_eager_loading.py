@@ -0,0 +1,78 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from lesson2_structured.database.models.base import Base
+from lesson2_structured.database.models.order_products import OrderProduct
+from lesson2_structured.database.models.orders import Order
+from lesson2_structured.database.models.products import Product
+from lesson2_structured.database.models.users import User
+from lesson2_structured.query_counter import assert_num_statements
+from lesson3_sync import Repo
+
+# users, then one query per relationship hop: orders, orderproducts, products
+SELECTIN_STATEMENTS = 4
+SUBQUERY_STATEMENTS = 4
+JOINED_STATEMENTS = 1
+
+
+@pytest.fixture
+def session(monkeypatch):
+    # SQLite can't autoincrement a composite primary key, the rows below set order_id themselves
+    monkeypatch.setattr(Order.__table__.c.order_id, "autoincrement", False)
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with Session(engine, expire_on_commit=False) as session:
+        session.add_all([Product(product_id=p, title=f"p{p}", description="d", price=p) for p in (1, 2)])
+        created_at = datetime(2026, 1, 5)
+        order_id = 0
+        for telegram_id in (1, 2, 3):
+            session.add(User(telegram_id=telegram_id, full_name=f"user {telegram_id}", language_code="en"))
+            for _ in range(2):
+                order_id += 1
+                session.add(Order(order_id=order_id, user_id=telegram_id, created_at=created_at))
+                session.add_all([
+                    OrderProduct(order_id=order_id, product_id=p, order_created_at=created_at, quantity=1)
+                    for p in (1, 2)
+                ])
+        session.commit()
+        # start from an empty identity map, nothing may come from the session
+        session.expunge_all()
+        yield session
+
+
+def walk(users):
+    return [product.product.title for user in users for order in user.orders for product in order.products]
+
+
+@pytest.mark.parametrize("strategy, expected", [
+    ("selectin", SELECTIN_STATEMENTS),
+    ("subquery", SUBQUERY_STATEMENTS),
+    ("joined", JOINED_STATEMENTS),
+])
+def test_get_users_with_orders_statement_count(session, strategy, expected):
+    repo = Repo(session)
+
+    with assert_num_statements(session, expected):
+        users = repo.get_users_with_orders(strategy=strategy)
+        # walking the graph must not lazy load anything
+        titles = walk(users)
+
+    assert len(users) == 3
+    assert len(titles) == 12
+
+
+@pytest.mark.parametrize("strategy, expected", [
+    ("selectin", SELECTIN_STATEMENTS),
+    ("joined", JOINED_STATEMENTS),
+])
+def test_get_user_with_orders_statement_count(session, strategy, expected):
+    repo = Repo(session)
+
+    with assert_num_statements(session, expected):
+        user = repo.get_user_with_orders(2, strategy=strategy)
+        titles = walk([user])
+
+    assert titles == ["p1", "p2", "p1", "p2"]
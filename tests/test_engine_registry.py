@@ -0,0 +1,46 @@
+import asyncio
+
+from sqlalchemy import URL
+
+from lesson2_structured import engine_registry
+from lesson2_structured.engine_registry import dispose_async_engines, get_async_engine, get_engine
+
+ASYNC_URL = URL.create("postgresql+asyncpg", username="u", password="p", host="localhost", database="registry_test")
+
+
+def test_sync_engine_shared_per_url_and_options():
+    url = URL.create("sqlite", database=":memory:")
+
+    assert get_engine(url, echo=False) is get_engine(url, echo=False)
+    assert get_engine(url, echo=False) is not get_engine(url, echo=True)
+
+
+def test_async_engine_shared_within_one_loop():
+    async def twice():
+        return get_async_engine(ASYNC_URL), get_async_engine(ASYNC_URL)
+
+    first, second = asyncio.run(twice())
+    assert first is second
+
+
+def test_async_engine_not_shared_across_asyncio_run():
+    async def lookup():
+        return get_async_engine(ASYNC_URL)
+
+    first = asyncio.run(lookup())
+    second = asyncio.run(lookup())
+
+    assert first is not second
+    # the first loop is closed, its engine was dropped on the second lookup
+    assert first not in engine_registry.registered_engines()
+    assert second in engine_registry.registered_engines()
+
+
+def test_dispose_async_engines_forgets_the_running_loops_engines():
+    async def lookup_and_dispose():
+        engine = get_async_engine(ASYNC_URL)
+        await dispose_async_engines()
+        return engine
+
+    engine = asyncio.run(lookup_and_dispose())
+    assert engine not in engine_registry.registered_engines()
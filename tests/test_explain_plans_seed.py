@@ -0,0 +1,55 @@
+from datetime import datetime
+from itertools import count
+from unittest.mock import MagicMock
+
+import scripts.explain_plans as explain_plans
+from tests.test_bulk_copy import FakeCursor
+
+
+def run_seed(monkeypatch, **scale) -> dict[str, tuple[list[str], list[list[str]]]]:
+    """seed() with the real copy_rows on a fake connection, returns table -> (columns, rows) as sent to COPY"""
+    session = MagicMock()
+    cursor = FakeCursor()
+    session.connection.return_value.connection.dbapi_connection.cursor.return_value = cursor
+    # nextval() blocks for the generated keys, ids keep counting across tables like separate sequences would
+    ids = count(1)
+    conn = session.get_bind.return_value.connect.return_value.__enter__.return_value
+    conn.execute.return_value.scalars.return_value.all.side_effect = lambda: [next(ids) for _ in range(10000)]
+    Session = MagicMock()
+    Session.return_value.__enter__.return_value = session
+
+    for name in ("DbConfig", "drop_tables", "create_tables", "ensure_partitions", "Repo"):
+        monkeypatch.setattr(explain_plans, name, MagicMock())
+    monkeypatch.setattr(explain_plans, "get_session", lambda: Session)
+
+    explain_plans.seed(**scale)
+
+    copies = {}
+    for sql, data in cursor.copies:
+        table = sql.split('"')[1]
+        columns = [part.strip().strip('"') for part in sql.split("(")[1].split(")")[0].split(",")]
+        copies[table] = (columns, [line.split("\t") for line in data.splitlines()])
+    return copies
+
+
+def test_seed_copies_consistent_rows(monkeypatch):
+    copies = run_seed(monkeypatch, users=5, orders_per_user=2, lines_per_order=3, products=4)
+
+    assert set(copies) == {"users", "products", "orders", "orderproducts"}
+    for table, (columns, rows) in copies.items():
+        assert rows, table
+        assert all(len(row) == len(columns) for row in rows), table
+
+    order_columns, orders = copies["orders"]
+    line_columns, lines = copies["orderproducts"]
+    assert len(orders) == 10
+    assert len(lines) == 30
+    # every line points at a copied order, with that order's created_at (the partition key)
+    order_created_at = {
+        row[order_columns.index("order_id")]: row[order_columns.index("created_at")] for row in orders
+    }
+    for line in lines:
+        order_id = line[line_columns.index("order_id")]
+        assert order_id.isdigit()
+        assert line[line_columns.index("order_created_at")] == order_created_at[order_id]
+    assert all(datetime.fromisoformat(created_at) < datetime(2026, 1, 1) for created_at in order_created_at.values())
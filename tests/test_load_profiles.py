@@ -0,0 +1,40 @@
+import pytest
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+
+from lesson2_structured.database.models.order_products import OrderProduct
+from lesson2_structured.database.models.products import Product
+from lesson2_structured.database.models.users import User
+from lesson2_structured.load_profiles import DEFAULT_PROFILE, apply_profile, profile_options
+import lesson3_sync  # noqa: F401  configures the mappers
+
+
+def selected_columns(stmt) -> str:
+    return str(stmt.compile()).split(" FROM ")[0]
+
+
+def test_default_profile_loads_every_column():
+    assert DEFAULT_PROFILE == "full"
+    assert profile_options(DEFAULT_PROFILE, Product, User) == []
+    # no profile at all: the model itself doesn't defer anything
+    assert "products.description" in selected_columns(select(Product))
+
+
+def test_summary_defers_only_the_description():
+    columns = selected_columns(select(Product).options(*profile_options("summary", Product)))
+
+    assert "products.description" not in columns
+    for name in ("product_id", "title", "price", "created_at", "updated_at"):
+        assert f"products.{name}" in columns
+
+
+def test_full_leaves_relationship_loaders_alone():
+    loader = selectinload(OrderProduct.product)
+
+    assert apply_profile(loader, Product, "full") is loader
+    assert apply_profile(loader, Product, "summary") is not loader
+
+
+def test_unknown_profile_raises():
+    with pytest.raises(ValueError, match="Unknown load profile"):
+        profile_options("everything", Product)
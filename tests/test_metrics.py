@@ -0,0 +1,53 @@
+import pytest
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import asyncpg, insert, psycopg2
+
+from lesson2_structured.database.models.products import Product
+from lesson2_structured.database.models.users import User
+from lesson2_structured.metrics import normalize_statement
+import lesson3_sync  # noqa: F401  configures the mappers
+
+DIALECTS = {"psycopg2": psycopg2.dialect(), "asyncpg": asyncpg.dialect()}
+
+
+def rendered(stmt, dialect) -> str:
+    # IN lists expanded the way they are at execution time
+    return str(stmt.compile(dialect=dialect, compile_kwargs={"render_postcompile": True}))
+
+
+def in_lists(ids: int, languages: int):
+    return select(User).where(
+        User.telegram_id.in_(range(ids)),
+        User.language_code.in_(["en"] * languages),
+        User.full_name == "x",
+    )
+
+
+def product_rows(rows: int):
+    return insert(Product).values([{"title": "t", "description": "d", "price": 1}] * rows)
+
+
+@pytest.mark.parametrize("paramstyle", DIALECTS)
+def test_in_lists_of_any_length_share_a_label(paramstyle):
+    dialect = DIALECTS[paramstyle]
+    labels = {normalize_statement(rendered(in_lists(ids, languages), dialect)) for ids, languages in [(1, 1), (3, 2), (50, 7)]}
+
+    assert len(labels) == 1
+    assert labels.pop().count("IN (?)") == 2
+
+
+@pytest.mark.parametrize("paramstyle", DIALECTS)
+def test_multi_row_values_share_a_label(paramstyle):
+    dialect = DIALECTS[paramstyle]
+    labels = {normalize_statement(rendered(product_rows(rows), dialect)) for rows in (2, 10, 100)}
+
+    assert labels == {"INSERT INTO products (title, description, price) VALUES (?)"}
+
+
+def test_asyncpg_placeholders_and_casts():
+    assert normalize_statement(
+        "SELECT * FROM t WHERE a IN ($1::BIGINT, $2::BIGINT) AND b = $3::TIMESTAMP WITHOUT TIME ZONE"
+    ) == "SELECT * FROM t WHERE a IN (?) AND b = ?::TIMESTAMP WITHOUT TIME ZONE"
+    assert normalize_statement("SELECT * FROM t WHERE a IN ($1::BIGINT) AND b = $2::TIMESTAMP WITHOUT TIME ZONE") == (
+        "SELECT * FROM t WHERE a IN (?) AND b = ?::TIMESTAMP WITHOUT TIME ZONE"
+    )
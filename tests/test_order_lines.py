@@ -0,0 +1,95 @@
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from lesson3_async import AsyncRepo
+from lesson3_sync import Repo
+
+
+def line(order_id, product_id, quantity):
+    return SimpleNamespace(order_id=order_id, product_id=product_id, quantity=quantity)
+
+
+def fake_session(rows):
+    session = MagicMock()
+    session.scalars.return_value.all.return_value = rows
+    return session
+
+
+def test_add_order_products_returns_upserted_lines():
+    rows = [line(1, 2, 3)]
+    session = fake_session(rows)
+
+    assert Repo(session).add_order_products([(1, 2, 3)]) == rows
+    session.commit.assert_called_once()
+
+
+def test_add_order_product_missing_order_raises():
+    # the statement skips lines whose order isn't there, nothing comes back
+    session = fake_session([])
+
+    with pytest.raises(ValueError, match="order 9 not found"):
+        Repo(session).add_order_product(9, 2, 3)
+    session.commit.assert_not_called()
+    session.rollback.assert_called_once()
+
+
+def test_add_order_products_names_every_missing_order():
+    session = fake_session([line(1, 2, 3)])
+
+    with pytest.raises(ValueError, match=r"orders \[7, 9\] not found"):
+        Repo(session).add_order_products([(1, 2, 3), (9, 2, 1), (7, 5, 1)])
+    session.commit.assert_not_called()
+
+
+def test_async_add_order_product_missing_order_raises():
+    session = MagicMock()
+    result = MagicMock()
+    result.all.return_value = []
+    session.scalars = AsyncMock(return_value=result)
+    session.rollback = AsyncMock()
+    session.commit = AsyncMock()
+
+    with pytest.raises(ValueError, match="order 9 not found"):
+        asyncio.run(AsyncRepo(session).add_order_product(9, 2, 3))
+    session.commit.assert_not_called()
+    session.rollback.assert_awaited_once()
+
+
+def test_missing_order_inside_transaction_rolls_back_the_savepoint():
+    session = fake_session([line(1, 2, 3)])
+    repo = Repo(session)
+
+    with repo.transaction():
+        with pytest.raises(ValueError, match="order 9 not found"):
+            repo.add_order_products([(1, 2, 3), (9, 2, 1)])
+        # the SAVEPOINT around the statement saw the error, the outer transaction didn't
+        exc_type, _, _ = session.begin_nested.return_value.__exit__.call_args.args
+        assert exc_type is ValueError
+        session.rollback.assert_not_called()
+    session.commit.assert_called_once()
+
+
+def test_async_missing_order_inside_transaction_rolls_back_the_savepoint():
+    session = MagicMock()
+    result = MagicMock()
+    result.all.return_value = []
+    session.scalars = AsyncMock(return_value=result)
+    session.rollback = AsyncMock()
+    session.commit = AsyncMock()
+    savepoint = session.begin_nested.return_value
+    savepoint.__aenter__ = AsyncMock()
+    savepoint.__aexit__ = AsyncMock(return_value=False)
+    repo = AsyncRepo(session)
+
+    async def run():
+        async with repo.transaction():
+            with pytest.raises(ValueError, match="order 9 not found"):
+                await repo.add_order_product(9, 2, 3)
+
+    asyncio.run(run())
+    exc_type, _, _ = savepoint.__aexit__.call_args.args
+    assert exc_type is ValueError
+    session.rollback.assert_not_called()
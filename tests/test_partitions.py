@@ -0,0 +1,62 @@
+from datetime import date
+from unittest.mock import MagicMock
+
+from lesson2_structured.database.partitions import ensure_partitions
+
+
+class FakeConnection:
+    """Records the SQL ensure_partitions sends, with existing partitions and DEFAULT rows to report"""
+    def __init__(self, existing=(), default_rows=()):
+        self.existing = set(existing)
+        self.default_rows = set(default_rows)   # (table, month) pairs sitting in DEFAULT
+        self.statements = []
+
+    def execute(self, statement, params=None):
+        sql = str(statement)
+        self.statements.append(sql)
+        result = MagicMock()
+        if "FROM pg_inherits" in sql:
+            result.scalars.return_value = [name for name in self.existing if name.startswith(f"{params['table']}_p")]
+        elif sql.startswith("SELECT EXISTS"):
+            table = sql.split(" FROM ")[1].split("_default")[0]
+            result.scalar.return_value = (table, params["start"]) in self.default_rows
+        return result
+
+    def index(self, prefix: str) -> int:
+        return next(i for i, sql in enumerate(self.statements) if sql.startswith(prefix))
+
+
+def test_creates_missing_months_for_both_tables():
+    conn = FakeConnection(existing={"orders_p202610", "orderproducts_p202610"})
+
+    created = ensure_partitions(conn, months_ahead=2, today=date(2026, 10, 18))
+
+    assert created == ["orders_p202611", "orderproducts_p202611", "orders_p202612", "orderproducts_p202612"]
+    # nothing sat in DEFAULT, no rows moved
+    assert not any(sql.startswith(("CREATE TEMP", "DELETE", "INSERT")) for sql in conn.statements)
+
+
+def test_moves_default_rows_into_the_new_month():
+    november = date(2026, 11, 1)
+    conn = FakeConnection(
+        existing={"orders_p202610", "orderproducts_p202610"},
+        default_rows={("orders", november), ("orderproducts", november)},
+    )
+
+    ensure_partitions(conn, months_ahead=1, today=date(2026, 10, 18))
+
+    # lines leave DEFAULT before their orders, orders come back before their lines
+    assert conn.index("DELETE FROM orderproducts_default") < conn.index("DELETE FROM orders_default")
+    assert conn.index("DELETE FROM orders_default") < conn.index("CREATE TABLE IF NOT EXISTS orders_p202611")
+    assert conn.index("CREATE TABLE IF NOT EXISTS orderproducts_p202611") < conn.index(
+        "INSERT INTO orders SELECT * FROM orders_p202611_moving"
+    )
+    assert conn.index("INSERT INTO orders SELECT") < conn.index("INSERT INTO orderproducts SELECT")
+
+
+def test_serializes_concurrent_callers():
+    conn = FakeConnection()
+
+    ensure_partitions(conn, months_ahead=0, today=date(2026, 10, 18))
+
+    assert "pg_advisory_xact_lock" in conn.statements[0]
@@ -0,0 +1,33 @@
+import pytest
+
+from lesson2_structured.database.models.order_products import OrderProduct
+from lesson2_structured.database.models.orders import Order
+from lesson2_structured.database.models.products import Product
+from lesson2_structured.database.models.users import User
+from lesson2_structured.projections import labelled_columns
+
+
+def labels(columns):
+    return [column.key for column in labelled_columns(columns)]
+
+
+def test_only_shared_attribute_names_are_prefixed():
+    assert labels([Product.title, "Order.created_at", "User.created_at"]) == [
+        "title", "order_created_at", "user_created_at"
+    ]
+
+
+def test_prefixed_label_colliding_with_a_column_raises():
+    with pytest.raises(ValueError, match="order_created_at"):
+        labelled_columns(["Order.created_at", "User.created_at", "OrderProduct.order_created_at"])
+
+
+def test_explicit_label_resolves_the_collision():
+    columns = [Order.created_at, User.created_at, OrderProduct.order_created_at.label("line_created_at")]
+
+    assert labels(columns) == ["order_created_at", "user_created_at", "line_created_at"]
+
+
+def test_same_explicit_label_twice_raises():
+    with pytest.raises(ValueError, match="'x'"):
+        labelled_columns([Product.title.label("x"), User.full_name.label("x")])
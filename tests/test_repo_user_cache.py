@@ -0,0 +1,129 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from lesson2_structured.database.models.users import User
+from lesson2_structured.user_cache import UserCache
+from lesson3_async import AsyncRepo
+from lesson3_sync import Repo
+
+OLD = {"telegram_id": 1, "full_name": "Old Name", "user_name": None, "language_code": "en",
+       "referred_id": None, "created_at": None, "updated_at": None}
+
+
+def upserted_user() -> User:
+    return User(telegram_id=1, full_name="New Name", language_code="en")
+
+
+def fake_session(user: User) -> MagicMock:
+    session = MagicMock()
+    # add_user: execute(...).scalar_one(), get_user_by_id: execute(...).scalars().first()
+    session.execute.return_value.scalar_one.return_value = user
+    session.execute.return_value.scalars.return_value.first.return_value = user
+    return session
+
+
+def test_add_user_failed_commit_leaves_cache_alone():
+    cache = UserCache()
+    cache.set(1, OLD)
+    session = fake_session(upserted_user())
+    session.commit.side_effect = RuntimeError("commit failed")
+    repo = Repo(session, user_cache=cache)
+
+    with pytest.raises(RuntimeError):
+        repo.add_user(telegram_id=1, full_name="New Name", language_code="en")
+
+    assert cache.get(1) == OLD
+    assert repo._pending_cache_writes == []
+
+
+def test_add_user_updates_cache_after_commit():
+    cache = UserCache()
+    repo = Repo(fake_session(upserted_user()), user_cache=cache)
+
+    repo.add_user(telegram_id=1, full_name="New Name", language_code="en")
+
+    assert cache.get(1)["full_name"] == "New Name"
+
+
+def test_get_user_by_id_skips_stale_cache_inside_transaction():
+    cache = UserCache()
+    cache.set(1, OLD)
+    user = upserted_user()
+    session = fake_session(user)
+    repo = Repo(session, user_cache=cache)
+
+    with repo.transaction():
+        repo.add_user(telegram_id=1, full_name="New Name", language_code="en")
+        # the cache still holds OLD until the commit, read the session instead
+        assert repo.get_user_by_id(1) is user
+        session.merge.assert_not_called()
+        assert cache.get(1) == OLD
+
+    assert cache.get(1)["full_name"] == "New Name"
+
+
+def test_async_add_user_failed_commit_leaves_cache_alone():
+    cache = UserCache()
+    cache.set(1, OLD)
+    session = MagicMock()
+    result = MagicMock()
+    result.scalar_one.return_value = upserted_user()
+    session.execute = AsyncMock(return_value=result)
+    session.commit = AsyncMock(side_effect=RuntimeError("commit failed"))
+    repo = AsyncRepo(session, user_cache=cache)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(repo.add_user(telegram_id=1, full_name="New Name", language_code="en"))
+
+    assert cache.get(1) == OLD
+
+
+def test_upsert_users_keeps_last_row_per_telegram_id():
+    session = MagicMock()
+    session.scalars.return_value.all.return_value = [1, 2]
+    repo = Repo(session)
+    rows = [
+        {"telegram_id": 1, "full_name": "First", "language_code": "en"},
+        {"telegram_id": 2, "full_name": "Other", "language_code": "en"},
+        {"telegram_id": 1, "full_name": "Last", "language_code": "en"},
+    ]
+
+    repo.upsert_users(rows, batch_size=3)
+
+    _, batch = session.scalars.call_args.args
+    assert [(row["telegram_id"], row["full_name"]) for row in batch] == [(1, "Last"), (2, "Other")]
+
+
+def test_async_upsert_users_keeps_last_row_per_telegram_id():
+    session = MagicMock()
+    result = MagicMock()
+    result.all.return_value = [1]
+    session.scalars = AsyncMock(return_value=result)
+    session.commit = AsyncMock()
+    rows = [{"telegram_id": 1, "full_name": name, "language_code": "en"} for name in ("First", "Last")]
+
+    asyncio.run(AsyncRepo(session).upsert_users(rows))
+
+    _, batch = session.scalars.call_args.args
+    assert [row["full_name"] for row in batch] == ["Last"]
+
+
+@pytest.mark.parametrize("cached", [False, True])
+def test_get_user_language_reads_the_one_row_either_way(cached):
+    user = upserted_user()
+    session = fake_session(user)
+    session.execute.return_value.scalar_one_or_none.return_value = user.language_code
+    repo = Repo(session, user_cache=UserCache() if cached else None)
+
+    assert repo.get_user_language(1) == "en"
+    stmt = session.execute.call_args.args[0]
+    # a primary key lookup, no ORDER BY picking among rows
+    assert stmt._order_by_clauses == ()
+
+
+def test_add_user_prints_nothing(capsys):
+    Repo(fake_session(upserted_user())).add_user(telegram_id=1, full_name="New Name", language_code="en")
+
+    assert capsys.readouterr().out == ""